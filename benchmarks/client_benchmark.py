@@ -0,0 +1,248 @@
+"""Throughput, latency, cache hit rate and memory of the client.
+
+The client is run against FakePermobilServer of mypermobil.testing, in its
+own process so that the server does not take CPU time from the client. Every
+scenario polls the default fleet methods of `chairs` chairs for `rounds`
+rounds, with the default cache TTLs or without caching. The results are
+printed and, with --output, written as JSON. Pass the JSON of an earlier
+commit to --compare to see the change. With mypermobil installed, or from
+the root of the repository:
+
+    PYTHONPATH=. python benchmarks/client_benchmark.py --output after.json \\
+        --compare before.json [--scenario fleet] [--latency 0.005]
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import aiohttp
+
+from mypermobil import (
+    ITEM_LOOKUP,
+    ConnectionPoolProfile,
+    MyPermobil,
+    MyPermobilFleet,
+)
+from mypermobil.testing import FakePermobilServer
+
+SCENARIOS = {
+    "single": {"chairs": 1, "rounds": 1000, "cached": False},
+    "single-cached": {"chairs": 1, "rounds": 1000, "cached": True},
+    "fleet": {"chairs": 1000, "rounds": 2, "cached": False},
+    "fleet-cached": {"chairs": 1000, "rounds": 2, "cached": True},
+}
+# the results that are better when higher, and when lower
+HIGHER_IS_BETTER = ("calls_per_second", "requests_per_second", "cache_hit_rate")
+LOWER_IS_BETTER = ("seconds", "p50_ms", "p99_ms", "peak_memory_bytes")
+
+
+def serve(conn, options: dict, chairs: int):
+    """Run the fake server until anything is received on conn.
+
+    The url, the url of the regions and (email, token, product id) of every
+    chair are sent on conn once the server is started.
+    """
+
+    async def main():
+        server = FakePermobilServer(**options)
+        await server.start()
+        users = [server.add_user(f"chair{i}@example.com") for i in range(chairs)]
+        credentials = [
+            (user.email, server.issue_token(user), user.product_id) for user in users
+        ]
+        conn.send((str(server.url), server.regions_url, credentials))
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await server.close()
+
+    asyncio.run(main())
+
+
+def percentile_ms(values: list, fraction: float) -> float:
+    """The milliseconds that a fraction of the values is below."""
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] * 1000
+
+
+def latency_trace(latencies: list) -> aiohttp.TraceConfig:
+    """A trace config that appends the seconds of every request."""
+
+    async def on_start(session, context, params):
+        context.start = time.perf_counter()
+
+    async def on_end(session, context, params):
+        latencies.append(time.perf_counter() - context.start)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_start)
+    trace_config.on_request_end.append(on_end)
+    trace_config.on_request_exception.append(on_end)
+    return trace_config
+
+
+async def run_scenario(server, chairs, rounds, cached, concurrency):
+    """Poll a fleet, returns the results."""
+    url, regions_url, credentials = server
+    latencies = []
+    session = aiohttp.ClientSession(
+        connector=ConnectionPoolProfile().create_connector(),
+        trace_configs=[latency_trace(latencies)],
+    )
+    fleet = MyPermobilFleet(session, max_concurrency_per_host=concurrency)
+    ttls = None if cached else {endpoint: 0 for endpoint in ITEM_LOOKUP}
+    expiration = datetime.date.today() + datetime.timedelta(days=365)
+    for email, token, product_id in credentials[:chairs]:
+        api = MyPermobil(
+            "benchmark",
+            session,
+            email=email,
+            region=url,
+            token=token,
+            expiration_date=expiration.isoformat(),
+            product_id=product_id,
+            cache_ttls=ttls,
+        )
+        api.regions_url = regions_url
+        api.self_authenticate()
+        fleet.add(api)
+
+    calls = errors = 0
+    start = time.perf_counter()
+    # the regions are requested once, like a client that starts up
+    await fleet.apis[0].request_regions(include_internal=True)
+    for _ in range(rounds):
+        async for result in fleet.refresh():
+            calls += 1
+            errors += not result.ok
+    seconds = time.perf_counter() - start
+    await session.close()
+
+    hits = sum(api.cache.hits for api in fleet)
+    misses = sum(api.cache.misses for api in fleet)
+    return {
+        "calls": calls,
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": seconds,
+        "calls_per_second": calls / seconds,
+        "requests_per_second": len(latencies) / seconds,
+        "p50_ms": percentile_ms(latencies, 0.5),
+        "p99_ms": percentile_ms(latencies, 0.99),
+        "cache_hit_rate": hits / (hits + misses) if hits + misses else 0,
+    }
+
+
+async def run(server, scenario: dict, concurrency: int) -> dict:
+    """Run a scenario, then once more for the memory of one round."""
+    results = await run_scenario(server, concurrency=concurrency, **scenario)
+    tracemalloc.start()
+    once = {**scenario, "rounds": 1}
+    await run_scenario(server, concurrency=concurrency, **once)
+    results["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return results
+
+
+def commit() -> str:
+    """The commit that is benchmarked, None outside of a git repository."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, before: dict):
+    """Print the change of every result from an earlier run."""
+    if before["config"] != results["config"]:
+        print("warning: the earlier run had a different config")
+    print(f"\ncompared to {before['commit']}:")
+    for name, scenario in results["scenarios"].items():
+        if name not in before["scenarios"]:
+            continue
+        for key, value in scenario.items():
+            old = before["scenarios"][name].get(key)
+            if not old or not isinstance(value, (int, float)):
+                continue
+            change = value / old - 1
+            mark = ""
+            if abs(change) >= 0.05 and key in HIGHER_IS_BETTER + LOWER_IS_BETTER:
+                better = (change > 0) == (key in HIGHER_IS_BETTER)
+                mark = " better" if better else " worse"
+            print(
+                f"  {name:<14} {key:<20} {old:>12.4g} -> {value:>12.4g} "
+                f"{change:>+7.1%}{mark}"
+            )
+
+
+def main():
+    """Run the benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=SCENARIOS, action="append")
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--positions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "positions": args.positions,
+        "seed": args.seed,
+    }
+    names = args.scenario or list(SCENARIOS)
+    chairs = max(SCENARIOS[name]["chairs"] for name in names)
+    conn, child = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=serve, args=(child, options, chairs))
+    process.start()
+    server = conn.recv()
+
+    results = {
+        "commit": commit(),
+        "python": platform.python_version(),
+        "aiohttp": aiohttp.__version__,
+        "config": {**options, "concurrency": args.concurrency},
+        "scenarios": {},
+    }
+    try:
+        for name in names:
+            scenario = asyncio.run(run(server, SCENARIOS[name], args.concurrency))
+            results["scenarios"][name] = scenario
+            print(
+                f"{name:<14} {scenario['calls_per_second']:>9.0f} calls/s "
+                f"{scenario['requests_per_second']:>7.0f} req/s "
+                f"p50 {scenario['p50_ms']:>6.2f} ms p99 {scenario['p99_ms']:>6.2f} ms "
+                f"hits {scenario['cache_hit_rate']:>4.0%} "
+                f"errors {scenario['errors']:>5} "
+                f"peak {scenario['peak_memory_bytes'] / 2**20:>6.1f} MiB"
+            )
+    finally:
+        conn.send("stop")
+        process.join()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(results, json.load(file))
+
+
+if __name__ == "__main__":
+    main()
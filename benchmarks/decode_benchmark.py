@@ -0,0 +1,53 @@
+"""Micro-benchmark of decoding the response of every endpoint.
+
+The payloads are built from the items in ITEM_LOOKUP, with a list of
+previous positions as large as a busy chair has. Every installed decoder
+(json, orjson, msgspec) is timed on every payload, and the size of the
+payload is shown uncompressed and gzip compressed. With mypermobil
+installed, or from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/decode_benchmark.py [--positions N] [--number N]
+"""
+
+import argparse
+import functools
+import gzip
+import json
+import timeit
+
+from mypermobil import ITEM_LOOKUP, MyPermobilClientException, json_decoder
+from mypermobil.testing import fake_payload
+
+DECODERS = ("json", "orjson", "msgspec")
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--positions", type=int, default=1000)
+    parser.add_argument("--number", type=int, default=10000)
+    args = parser.parse_args()
+
+    decoders = {}
+    for name in DECODERS:
+        try:
+            decoders[name] = json_decoder(name)
+        except MyPermobilClientException:
+            print(f"{name} is not installed")
+
+    header = f"{'endpoint':<45} {'bytes':>8} {'gzip':>7}"
+    print(header + "".join(f" {name + ' us':>11}" for name in decoders))
+    for endpoint in ITEM_LOOKUP:
+        body = json.dumps(fake_payload(endpoint, args.positions)).encode()
+        # fewer rounds for the large payloads
+        number = max(1, min(args.number, args.number * 1000 // len(body)))
+        row = f"{endpoint:<45} {len(body):>8} {len(gzip.compress(body)):>7}"
+        for loads in decoders.values():
+            decode = functools.partial(loads, body)
+            seconds = min(timeit.repeat(decode, number=number, repeat=3))
+            row += f" {seconds / number * 1e6:>11.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Memory per response held as a dict, a model and a lazy model.
+
+Many responses of every endpoint with a model are kept in a list, the way a
+history view holds them, and the memory they take is measured with
+tracemalloc. Every response has different values, like real responses. With
+mypermobil installed, or from the root of the repository:
+
+    PYTHONPATH=. python benchmarks/model_memory.py [--count 10000]
+"""
+
+import argparse
+import json
+import sys
+import tracemalloc
+
+from mypermobil import MODEL_LOOKUP
+from mypermobil.testing import fake_payload
+
+
+def bodies(endpoint: str, count: int, positions: int) -> list:
+    """Raw bodies of the endpoint that differ in their values."""
+    template = json.dumps(fake_payload(endpoint, positions))
+    # change the numbers so that the values are not shared
+    return [
+        template.replace("42.5", f"{42.5 + i / count}").encode() for i in range(count)
+    ]
+
+
+def measure(create, items: list) -> float:
+    """Bytes allocated per object to hold the objects created from items."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    held = [create(item) for item in items]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return (after - before) / len(items)
+
+
+def main():
+    """Run the benchmark and print a table."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--positions", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'endpoint':<45} {'dict':>9} {'model':>9} {'lazy':>9} {'saved':>6}")
+    for endpoint, model in MODEL_LOOKUP.items():
+        raw = bodies(endpoint, args.count, args.positions)
+        dicts = measure(json.loads, raw)
+        models = measure(lambda body, model=model: model(json.loads(body)), raw)
+        # the bodies are already allocated, so only the models are measured
+        lazy = measure(lambda body, model=model: model(body=body), raw)
+        lazy += sum(sys.getsizeof(body) for body in raw) / len(raw)
+        saved = 1 - models / dicts
+        print(
+            f"{endpoint:<45} {dicts:>9.0f} {models:>9.0f} {lazy:>9.0f} {saved:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,42 @@ from mypermobil.mypermobil import (
     MyPermobil,
     create_session,
 )
+from mypermobil.session import (
+    ConnectionPoolProfile,
+    ConnectionStats,
+    MyPermobilResponse,
+    json_decoder,
+)
+from mypermobil.coalesce import RequestCoalescer
+from mypermobil.ratelimit import RateLimiter, TokenBucket
+from mypermobil.retry import RetryPolicy, RetryBudget
+from mypermobil.cache import MyPermobilCache, MyPermobilPersistentCache
+from mypermobil.items import ItemPath, ITEM_PATHS, compile_item
+from mypermobil.fleet import (
+    MyPermobilFleet,
+    FleetResult,
+)
+from mypermobil.scheduler import PollScheduler, PollUpdate
+from mypermobil.changes import Change, ChangeDetector, payload_hash, watch_endpoint
+from mypermobil.timeseries import TimeSeries, TimeSeriesStore, SERIES_ITEMS
+from mypermobil.analytics import BatteryTable, BATTERY_COLUMNS
+from mypermobil.models import (
+    Model,
+    BatteryInfo,
+    DailyUsage,
+    UsageRecords,
+    Position,
+    Positions,
+    MODEL_LOOKUP,
+)
+from mypermobil.stream import JSONStream, iter_json
+from mypermobil.positions import (
+    PositionCursor,
+    PositionStore,
+    PositionTrack,
+    GridIndex,
+    haversine,
+)
 from mypermobil.exceptions import (
     MyPermobilException,
     MyPermobilAPIException,
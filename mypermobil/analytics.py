@@ -0,0 +1,231 @@
+"""Columnar fleet analytics of battery info, requires numpy."""
+
+import time
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .const import (
+    BATTERY_AMPERE_HOURS_LEFT,
+    BATTERY_CHARGING,
+    BATTERY_DISTANCE_LEFT,
+    BATTERY_MAX_AMPERE_HOURS,
+    BATTERY_MAX_DISTANCE_LEFT,
+    BATTERY_STATE_OF_CHARGE,
+    BATTERY_STATE_OF_HEALTH,
+)
+from .exceptions import MyPermobilClientException
+from .items import ItemPath
+
+# column name -> item in the battery info
+BATTERY_COLUMNS = {
+    "stateOfCharge": BATTERY_STATE_OF_CHARGE,
+    "stateOfHealth": BATTERY_STATE_OF_HEALTH,
+    "distanceLeft": BATTERY_DISTANCE_LEFT,
+    "maxDistanceLeft": BATTERY_MAX_DISTANCE_LEFT,
+    "ampereHoursLeft": BATTERY_AMPERE_HOURS_LEFT,
+    "maxAmpereHours": BATTERY_MAX_AMPERE_HOURS,
+    "charging": BATTERY_CHARGING,
+}
+BATTERY_PATHS = {
+    name: ItemPath(item, None) for name, item in BATTERY_COLUMNS.items()
+}
+DAY = 24 * 60 * 60
+
+
+def require_numpy():
+    """Raise if numpy is not installed."""
+    if np is None:
+        raise MyPermobilClientException(
+            "numpy is required for analytics, install mypermobil[analytics]"
+        )
+
+
+def nanmean(column) -> float:
+    """The mean of the values that are not NaN, NaN if there are none."""
+    valid = ~np.isnan(column)
+    if not valid.any():
+        return float("nan")
+    return float(column[valid].mean(dtype=np.float64))
+
+
+def to_float(value) -> float:
+    """A value as a float, NaN if it is missing. Booleans are 0 or 1."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return float("nan")
+
+
+class BatteryTable:
+    """Battery info of many chairs at many times as numpy columns.
+
+    Every row is one snapshot of one chair. Chairs are stored as integer
+    codes into `ids` so that they can be grouped without comparing strings,
+    and every column in BATTERY_COLUMNS is a float32 array with NaN where the
+    item was missing. Charging is 1 or 0.
+    """
+
+    def __init__(self, ids, chair, timestamp, columns: dict) -> None:
+        """Initialize."""
+        require_numpy()
+        self.ids = ids  # product ids
+        self.chair = chair  # index into ids of every row
+        self.timestamp = timestamp
+        self.columns = columns
+
+    @classmethod
+    def from_snapshots(cls, snapshots) -> "BatteryTable":
+        """Create from (product_id, timestamp, battery info) tuples."""
+        require_numpy()
+        product_ids = []
+        timestamps = []
+        values = {name: [] for name in BATTERY_PATHS}
+        for product_id, timestamp, response in snapshots:
+            product_ids.append(product_id)
+            timestamps.append(timestamp)
+            for name, path in BATTERY_PATHS.items():
+                try:
+                    values[name].append(to_float(path.get(response)))
+                except MyPermobilClientException:
+                    values[name].append(float("nan"))
+        ids, chair = np.unique(np.array(product_ids, dtype=str), return_inverse=True)
+        return cls(
+            ids,
+            chair.astype(np.int32),
+            np.array(timestamps, dtype=np.float64),
+            {
+                name: np.array(column, dtype=np.float32)
+                for name, column in values.items()
+            },
+        )
+
+    @classmethod
+    def from_fleet_results(cls, results, timestamp: float = None) -> "BatteryTable":
+        """Create from the FleetResults of get_battery_info, errors are skipped."""
+        if timestamp is None:
+            timestamp = time.time()
+        return cls.from_snapshots(
+            (res.api.product_id, timestamp, res.result) for res in results if res.ok
+        )
+
+    @classmethod
+    def concat(cls, tables: list) -> "BatteryTable":
+        """Concatenate tables, for example one per poll."""
+        require_numpy()
+        if not tables:
+            return cls.from_snapshots([])
+        product_ids = np.concatenate([table.ids[table.chair] for table in tables])
+        ids, chair = np.unique(product_ids, return_inverse=True)
+        return cls(
+            ids,
+            chair.astype(np.int32),
+            np.concatenate([table.timestamp for table in tables]),
+            {
+                name: np.concatenate([table.columns[name] for table in tables])
+                for name in BATTERY_PATHS
+            },
+        )
+
+    def __len__(self) -> int:
+        """Number of rows."""
+        return len(self.chair)
+
+    def __getitem__(self, name: str):
+        """A column by name."""
+        return self.columns[name]
+
+    @property
+    def product_ids(self):
+        """The product id of every row."""
+        return self.ids[self.chair]
+
+    def filter(self, mask) -> "BatteryTable":
+        """The rows where the boolean mask is True."""
+        return BatteryTable(
+            self.ids,
+            self.chair[mask],
+            self.timestamp[mask],
+            {name: column[mask] for name, column in self.columns.items()},
+        )
+
+    def between(self, start: float = None, end: float = None) -> "BatteryTable":
+        """The rows with start <= timestamp < end."""
+        mask = np.ones(len(self), dtype=bool)
+        if start is not None:
+            mask &= self.timestamp >= start
+        if end is not None:
+            mask &= self.timestamp < end
+        return self.filter(mask)
+
+    def latest(self) -> "BatteryTable":
+        """The last row of every chair."""
+        order = np.lexsort((self.timestamp, self.chair))
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = self.chair[order][1:] != self.chair[order][:-1]
+        return self.filter(order[last])
+
+    def mean(self, name: str) -> float:
+        """The mean of a column, NaN values are ignored."""
+        return nanmean(self.columns[name])
+
+    def below(self, name: str, threshold: float):
+        """The product ids of the chairs with a value below the threshold.
+
+        Only the last row of every chair is used.
+        """
+        latest = self.latest()
+        return latest.product_ids[latest.columns[name] < threshold]
+
+    def range_ratio(self):
+        """distanceLeft / maxDistanceLeft of every row, the range that is left."""
+        maximum = self.columns["maxDistanceLeft"]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = self.columns["distanceLeft"] / maximum
+        return np.where(maximum > 0, ratio, np.float32("nan"))
+
+    def per_chair(self, name: str) -> tuple:
+        """The product ids and the mean of a column for every chair."""
+        column = self.columns[name]
+        valid = ~np.isnan(column)
+        size = len(self.ids)
+        count = np.bincount(self.chair[valid], minlength=size)
+        total = np.bincount(self.chair[valid], column[valid], minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return self.ids, total / count
+
+    def degradation(self, name: str = "stateOfHealth") -> tuple:
+        """The product ids and the slope of a column per day for every chair.
+
+        The slope is the least squares fit of every chair's rows, NaN for
+        chairs with less than two different times.
+        """
+        column = self.columns[name].astype(np.float64)
+        valid = ~np.isnan(column)
+        chair = self.chair[valid]
+        y = column[valid]
+        x = self.timestamp[valid]
+        size = len(self.ids)
+        count = np.bincount(chair, minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # center the times per chair so that the sums stay precise
+            x = (x - (np.bincount(chair, x, minlength=size) / count)[chair]) / DAY
+            sum_xx = np.bincount(chair, x * x, minlength=size)
+            sum_xy = np.bincount(chair, x * y, minlength=size)
+            # the centered times sum to 0 for every chair
+            slope = sum_xy / sum_xx
+        slope[~(sum_xx > 0)] = np.nan
+        return self.ids, slope
+
+    def summary(self, low_charge: float = 20) -> dict:
+        """Fleet wide stats of the last row of every chair."""
+        latest = self.latest()
+        return {
+            "chairs": len(latest),
+            "mean_state_of_health": latest.mean("stateOfHealth"),
+            "mean_state_of_charge": latest.mean("stateOfCharge"),
+            "charging": int(np.nansum(latest.columns["charging"])),
+            "low_charge": int((latest.columns["stateOfCharge"] < low_charge).sum()),
+            "mean_range_ratio": nanmean(latest.range_ratio()),
+        }
@@ -0,0 +1,303 @@
+"""Response cache for the Permobil API."""
+
+import json
+import sqlite3
+import sys
+import time
+from collections import OrderedDict
+
+from .coalesce import RequestCoalescer
+from .exceptions import MyPermobilClientException
+
+# returned on a miss, since None and other falsy values can be cached
+MISSING = object()
+
+
+def sizeof(value) -> int:
+    """Approximate the memory used by a decoded JSON value."""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += sizeof(key) + sizeof(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += sizeof(item)
+    return size
+
+
+class MyPermobilCache:
+    """Bounded LRU cache where every entry has its own TTL.
+
+    Keys are tuples such as (region, endpoint, product_id). The cache holds at
+    most `max_entries` entries and, if `max_bytes` is set, at most that many
+    (approximate) bytes of values. The least recently used entries are
+    evicted first.
+
+    Entries can have validators (ETag, Last-Modified) of the response. Those
+    are kept for `revalidate_ttl` seconds after they expire so that they can
+    be revalidated with a conditional request.
+    """
+
+    max_entries = 1024
+    max_bytes = None
+    revalidate_ttl = 24 * 60 * 60
+
+    def __init__(
+        self,
+        max_entries: int = None,
+        max_bytes: int = None,
+        clock=time.monotonic,
+    ) -> None:
+        """Initialize."""
+        if max_entries is not None:
+            if max_entries < 1:
+                raise MyPermobilClientException("Cache must hold at least 1 entry")
+            self.max_entries = max_entries
+        if max_bytes is not None:
+            if max_bytes < 1:
+                raise MyPermobilClientException("Cache must hold at least 1 byte")
+            self.max_bytes = max_bytes
+        self.clock = clock
+        # the requests in flight for the keys of this cache
+        self.flights = RequestCoalescer()
+        # key -> time until which a failed background refresh is not retried
+        self.cooldowns = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0  # responses revalidated by a conditional request
+        # key -> (value, expires, keep, size, validators)
+        self._entries = OrderedDict()
+        self._bytes = 0
+
+    def __len__(self) -> int:
+        """len."""
+        return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        """in."""
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        """Approximate number of bytes held, 0 if `max_bytes` is not set."""
+        return self._bytes
+
+    @property
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "not_modified": self.not_modified,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _retain_until(self, keep: float, validators) -> float:
+        """Time an entry is deleted, later if it can be revalidated."""
+        return keep + self.revalidate_ttl if validators else keep
+
+    def _get_entry(self, key):
+        """Get an entry that has not passed its stale or revalidate TTL."""
+        entry = self._entries.get(key)
+        if entry is not None and self._retain_until(entry[2], entry[4]) <= self.clock():
+            # only from memory, the file is purged on its own
+            self._remove(key)
+            return None
+        return entry
+
+    def _insert(self, key, value, expires: float, keep: float, validators=None):
+        """Insert an entry into memory and evict until within bounds."""
+        size = sizeof(value) if self.max_bytes else 0
+        self._remove(key)
+        if self.max_bytes and size > self.max_bytes:
+            # the value would evict everything else, do not cache it
+            return
+        self._entries[key] = (value, expires, keep, size, validators)
+        self._bytes += size
+        self._evict()
+
+    def _remove(self, key):
+        """Remove an entry from memory if it exists."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
+
+    def get(self, key, default=None):
+        """Get a value, `default` if it is missing or expired."""
+        entry = self._get_entry(key)
+        if entry is None or entry[1] <= self.clock():
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def get_stale(self, key, default=None):
+        """Get a value even if it is expired, as long as it is within its
+        stale TTL. `default` if it is missing.
+        """
+        entry = self._get_entry(key)
+        if entry is None or entry[2] <= self.clock():
+            return default
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get_validated(self, key):
+        """Get (value, validators) even if the value is expired, None if
+        there are no validators to revalidate it with.
+        """
+        entry = self._get_entry(key)
+        if entry is None or not entry[4] or isinstance(entry[0], Exception):
+            return None
+        return entry[0], entry[4]
+
+    def set(self, key, value, ttl: float, stale_ttl: float = 0, validators=None):
+        """Set a value that expires after `ttl` seconds.
+
+        The value is kept for another `stale_ttl` seconds after it expires,
+        during which it can still be read with get_stale.
+        """
+        expires = self.clock() + ttl
+        self._insert(key, value, expires, expires + stale_ttl, validators)
+
+    def delete(self, key):
+        """Delete a value if it exists."""
+        self._remove(key)
+
+    def clear(self):
+        """Delete all values and reset the counters."""
+        self._entries.clear()
+        self._bytes = 0
+        self.cooldowns.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def _evict(self):
+        """Evict the least recently used values until within bounds."""
+        while len(self._entries) > self.max_entries or (
+            self.max_bytes and self._bytes > self.max_bytes
+        ):
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry[3]
+            self.evictions += 1
+
+
+class MyPermobilPersistentCache(MyPermobilCache):
+    """MyPermobilCache that also stores the responses in an SQLite file.
+
+    Responses survive restarts: an entry that is not in memory is loaded
+    from the file the first time it is requested. Errors are only cached in
+    memory. The expiry must survive restarts so the clock is the wall time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = None,
+        max_bytes: int = None,
+        clock=time.time,
+    ) -> None:
+        """Initialize."""
+        super().__init__(max_entries=max_entries, max_bytes=max_bytes, clock=clock)
+        self.path = path
+        self.loads = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, keep REAL, "
+            "validators TEXT)"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(responses)")]
+        if "validators" not in columns:
+            # a file from before validators were stored
+            self._db.execute("ALTER TABLE responses ADD COLUMN validators TEXT")
+        self.purge()
+
+    @property
+    def stats(self) -> dict:
+        """Hit, miss and eviction counters and entries loaded from the file."""
+        return {**super().stats, "loads": self.loads}
+
+    def _get_entry(self, key):
+        """Get an entry, loading it from the file if it is not in memory.
+
+        An error that expires in memory uncovers the response in the file.
+        """
+        if key not in self._entries:
+            self._load(key)
+        entry = super()._get_entry(key)
+        if entry is None and key not in self._entries:
+            self._load(key)
+            entry = super()._get_entry(key)
+        return entry
+
+    def _load(self, key):
+        """Load an entry from the file into memory."""
+        row = self._db.execute(
+            "SELECT value, expires, keep, validators FROM responses WHERE key = ?",
+            (json.dumps(key),),
+        ).fetchone()
+        if row is None:
+            return
+        validators = json.loads(row[3]) if row[3] else None
+        if self._retain_until(row[2], validators) <= self.clock():
+            return
+        self._insert(key, json.loads(row[0]), row[1], row[2], validators)
+        self.loads += 1
+
+    def set(self, key, value, ttl: float, stale_ttl: float = 0, validators=None):
+        """Set a value that expires after `ttl` seconds and store it."""
+        expires = self.clock() + ttl
+        self._insert(key, value, expires, expires + stale_ttl, validators)
+        if isinstance(value, Exception):
+            return
+        try:
+            data = json.dumps(value)
+        except (TypeError, ValueError):
+            # only JSON responses are stored
+            return
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (
+                    json.dumps(key),
+                    data,
+                    expires,
+                    expires + stale_ttl,
+                    json.dumps(validators) if validators else None,
+                ),
+            )
+
+    def delete(self, key):
+        """Delete a value if it exists, both from memory and the file."""
+        super().delete(key)
+        with self._db:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (json.dumps(key),))
+
+    def clear(self):
+        """Delete all values, both from memory and the file."""
+        super().clear()
+        self.loads = 0
+        with self._db:
+            self._db.execute("DELETE FROM responses")
+
+    def purge(self):
+        """Delete the entries in the file that have passed their stale TTL,
+        or their revalidate TTL if they have validators.
+        """
+        with self._db:
+            self._db.execute(
+                "DELETE FROM responses WHERE keep + "
+                "CASE WHEN validators IS NULL THEN 0 ELSE ? END <= ?",
+                (self.revalidate_ttl, self.clock()),
+            )
+
+    def close(self):
+        """Close the file."""
+        self._db.close()
@@ -0,0 +1,128 @@
+"""Detection of the items that changed between successive responses."""
+
+import asyncio
+import hashlib
+import json
+
+from .const import ITEM_LOOKUP
+from .exceptions import MyPermobilClientException
+from .items import compile_item
+from .mypermobil import MyPermobil
+
+
+def payload_hash(response) -> bytes:
+    """Structural hash of a response, independent of the order of the keys."""
+    data = json.dumps(response, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(data.encode(), digest_size=16).digest()
+
+
+class Change:
+    """An item that changed, None is used for an item not in the response."""
+
+    __slots__ = ("path", "old", "new")
+
+    def __init__(self, path, old, new) -> None:
+        """Initialize."""
+        self.path = path
+        self.old = old
+        self.new = new
+
+    def __repr__(self) -> str:
+        """repr."""
+        return f"Change({list(self.path)}, {self.old!r} -> {self.new!r})"
+
+    def __eq__(self, other) -> bool:
+        """==."""
+        if not isinstance(other, Change):
+            return NotImplemented
+        return (self.path, self.old, self.new) == (other.path, other.old, other.new)
+
+    __hash__ = None
+
+
+class ChangeDetector:
+    """Diffs successive responses of an endpoint item by item.
+
+    By default the items of the endpoint in ITEM_LOOKUP are compared. A
+    response that is the same object as the last one, or has the same
+    structural hash, is skipped without looking at the items.
+    """
+
+    def __init__(self, endpoint: str, items: list = None) -> None:
+        """Initialize."""
+        if items is None:
+            if endpoint not in ITEM_LOOKUP:
+                raise MyPermobilClientException(f"No items for: {endpoint}")
+            items = ITEM_LOOKUP[endpoint]
+        # items can share a path, compare each path once
+        paths = {tuple(item): compile_item(item, endpoint) for item in items}
+        self.endpoint = endpoint
+        self.paths = list(paths.values())
+        self.values = {}
+        self.last = None
+        self.hash = None
+        self.checked = 0
+        self.skipped = 0  # responses that had not changed at all
+        self.changes = 0
+
+    @property
+    def stats(self) -> dict:
+        """Response and change counters."""
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "changes": self.changes,
+        }
+
+    def reset(self):
+        """Forget the last response, the next one is reported in full."""
+        self.values = {}
+        self.last = None
+        self.hash = None
+
+    def diff(self, response) -> list:
+        """The changes since the last response, the first one is all new."""
+        self.checked += 1
+        if self.last is not None and response is self.last:
+            self.skipped += 1
+            return []
+        digest = payload_hash(response)
+        self.last = response
+        if digest == self.hash:
+            self.skipped += 1
+            return []
+        self.hash = digest
+
+        changes = []
+        for path in self.paths:
+            try:
+                new = path.get(response)
+            except MyPermobilClientException:
+                new = None
+            old = self.values.get(path)
+            if path not in self.values or old != new:
+                changes.append(Change(path, old, new))
+            self.values[path] = new
+        self.changes += len(changes)
+        return changes
+
+
+async def watch_endpoint(
+    api: MyPermobil,
+    endpoint: str,
+    interval: float = 60,
+    items: list = None,
+    detector: ChangeDetector = None,
+):
+    """Poll an endpoint and yield the list of changes whenever it changes.
+
+    Polls with `request_endpoint`, so the client's cache is used. An error
+    ends the iteration, pass the same detector to a new watch to resume.
+    """
+    if detector is None:
+        detector = ChangeDetector(endpoint, items)
+    while True:
+        changes = detector.diff(await api.request_endpoint(endpoint))
+        if changes:
+            yield changes
+        await asyncio.sleep(interval)
@@ -0,0 +1,88 @@
+"""Coalescing of identical concurrent requests."""
+
+import asyncio
+
+
+class InFlight:
+    """A request in flight and the number of callers waiting for it."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Future) -> None:
+        """Initialize."""
+        self.task = task
+        self.waiters = 0
+
+
+class RequestCoalescer:
+    """Shares one in-flight request between identical concurrent requests.
+
+    Requests are identified by a logical key such as (region, endpoint,
+    product_id, token), so callers from any MyPermobil instance that use the
+    same coalescer share the request. The request runs in its own task: a
+    cancelled caller does not cancel it for the others, it is only cancelled
+    when every caller has been cancelled.
+    """
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.inflight = {}
+        self.requests = 0  # requests made
+        self.coalesced = 0  # calls that joined a request in flight
+
+    @property
+    def stats(self) -> dict:
+        """Request counters."""
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "inflight": len(self.inflight),
+        }
+
+    def _done(self, key, inflight: InFlight):
+        """Forget a finished request."""
+        if self.inflight.get(key) is inflight:
+            del self.inflight[key]
+
+    def __contains__(self, key) -> bool:
+        """in."""
+        return key in self.inflight
+
+    def start(self, key, request) -> InFlight:
+        """Start `request()` unless the identical request is already in flight.
+
+        This does not wait for the request, so it is started even if it is
+        never awaited.
+        """
+        inflight = self.inflight.get(key)
+        if inflight is None:
+            inflight = InFlight(asyncio.ensure_future(request()))
+            inflight.task.add_done_callback(lambda _: self._done(key, inflight))
+            self.inflight[key] = inflight
+            self.requests += 1
+        else:
+            self.coalesced += 1
+        return inflight
+
+    async def run(self, key, request):
+        """Await `request()`, or the identical request already in flight.
+
+        Every caller gets the result, or the exception, of the same request.
+        """
+        inflight = self.start(key, request)
+        inflight.waiters += 1
+        try:
+            return await asyncio.shield(inflight.task)
+        except asyncio.CancelledError:
+            if inflight.waiters == 1 and not inflight.task.done():
+                # nobody else is waiting for the request, stop it and make
+                # sure that no new caller joins it while it is cancelled
+                self._done(key, inflight)
+                inflight.task.cancel()
+            raise
+        finally:
+            inflight.waiters -= 1
+
+
+# shared by every MyPermobil instance unless another coalescer is given
+COALESCER = RequestCoalescer()
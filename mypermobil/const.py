@@ -146,3 +146,26 @@ ENDPOINT_LOOKUP = {
     for endpoint, items in list(ITEM_LOOKUP.items())[::-1]
     for item in items
 }
+
+# Seconds to cache the response of each endpoint, overridable per MyPermobil
+# instance. Endpoints that are not listed are cached for CACHE_TTL seconds.
+CACHE_TTL_LOOKUP = {
+    GET_REGIONS: 24 * 60 * 60,
+    ENDPOINT_PRODUCTS: 6 * 60 * 60,
+    ENDPOINT_PRODUCT_BY_ID: 5 * 60,
+    ENDPOINT_VA_USAGE_RECORDS: 60 * 60,
+    ENDPOINT_DAILY_USAGE: 60,
+    ENDPOINT_BATTERY_INFO: 30,
+    ENDPOINT_VA_CHARGE_TIME: 30,
+    ENDPOINT_VA_CHAIR_STATUS: 30,
+    ENDPOINT_PRODUCTS_POSITIONS: 15,
+}
+
+# Validators of a cached response and the headers to revalidate it with
+ETAG = "ETag"
+LAST_MODIFIED = "Last-Modified"
+IF_NONE_MATCH = "If-None-Match"
+IF_MODIFIED_SINCE = "If-Modified-Since"
+
+# Header to negotiate a compressed response with
+ACCEPT_ENCODING = "Accept-Encoding"
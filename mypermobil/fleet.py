@@ -0,0 +1,178 @@
+"""Fleet of MyPermobil clients that are polled concurrently."""
+
+import asyncio
+from urllib.parse import urlparse
+
+import aiohttp
+
+from .exceptions import MyPermobilClientException
+from .mypermobil import MyPermobil
+from .ratelimit import RateLimiter
+from .session import ConnectionPoolProfile, ConnectionStats, create_session
+
+
+class FleetResult:
+    """Result of one request made for one chair in the fleet."""
+
+    __slots__ = ("api", "method", "result", "error")
+
+    def __init__(self, api: MyPermobil, method: str, result=None, error=None):
+        """Initialize."""
+        self.api = api
+        self.method = method
+        self.result = result
+        self.error = error
+
+    def __repr__(self) -> str:
+        """repr."""
+        outcome = f"error={self.error!r}" if self.error else "ok"
+        return f"FleetResult({self.api.product_id}, {self.method}, {outcome})"
+
+    @property
+    def ok(self) -> bool:
+        """True if the request did not raise."""
+        return self.error is None
+
+
+class MyPermobilFleet:
+    """Many authenticated MyPermobil clients sharing one session.
+
+    Requests are fanned out concurrently with at most
+    `max_concurrency_per_host` requests in flight per region host.
+    """
+
+    max_concurrency_per_host = 10
+    default_methods = (
+        "get_battery_info",
+        "get_daily_usage",
+        "get_usage_records",
+        "get_gps_position",
+    )
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        apis: list = None,
+        max_concurrency_per_host: int = None,
+        rate_limiter: RateLimiter = None,
+    ) -> None:
+        """Initialize."""
+        self.session = session
+        # shared by every client in the fleet, None for no limit
+        self.rate_limiter = rate_limiter
+        if max_concurrency_per_host is not None:
+            if max_concurrency_per_host < 1:
+                raise MyPermobilClientException("Concurrency must be at least 1")
+            self.max_concurrency_per_host = max_concurrency_per_host
+        self.apis = []
+        self._semaphores = {}
+        # updated by sessions opened with open_session
+        self.connection_stats = ConnectionStats()
+        for api in apis or []:
+            self.add(api)
+
+    def __len__(self) -> int:
+        """len."""
+        return len(self.apis)
+
+    def __iter__(self):
+        """iter."""
+        return iter(self.apis)
+
+    def add(self, api: MyPermobil) -> MyPermobil:
+        """Add an authenticated client to the fleet and share the session."""
+        if not api.authenticated:
+            raise MyPermobilClientException("Not authenticated")
+        api.session = self.session
+        api.connection_stats = self.connection_stats
+        if self.rate_limiter is not None:
+            api.rate_limiter = self.rate_limiter
+        self.apis.append(api)
+        return api
+
+    def create(
+        self,
+        application: str,
+        email: str,
+        region: str,
+        token: str,
+        expiration_date: str,
+        product_id: str = None,
+    ) -> MyPermobil:
+        """Create, authenticate and add a client to the fleet."""
+        api = MyPermobil(
+            application,
+            self.session,
+            email=email,
+            region=region,
+            token=token,
+            expiration_date=expiration_date,
+            product_id=product_id,
+        )
+        api.self_authenticate()
+        return self.add(api)
+
+    def _semaphore(self, region: str) -> asyncio.Semaphore:
+        """Get the concurrency limit for the host of a region."""
+        host = urlparse(region).netloc
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        return self._semaphores[host]
+
+    async def _request(self, api: MyPermobil, method: str) -> FleetResult:
+        """Make one request for one chair, capturing the error if any."""
+        async with self._semaphore(api.region):
+            try:
+                result = await getattr(api, method)()
+            except Exception as err:  # pylint: disable=broad-except
+                return FleetResult(api, method, error=err)
+        return FleetResult(api, method, result=result)
+
+    async def refresh(self, methods: tuple = None):
+        """Request `methods` for every chair.
+
+        This is an async iterator that yields a FleetResult as soon as each
+        request completes, so one slow chair does not hold up the others.
+        """
+        if methods is None:
+            methods = self.default_methods
+        for method in methods:
+            if not callable(getattr(MyPermobil, method, None)):
+                raise MyPermobilClientException(f"Invalid method: {method}")
+
+        tasks = [
+            asyncio.ensure_future(self._request(api, method))
+            for api in self.apis
+            for method in methods
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            # if the consumer stops early, do not leave requests running
+            for task in tasks:
+                task.cancel()
+
+    async def refresh_all(self, methods: tuple = None) -> list:
+        """Request `methods` for every chair and return all results."""
+        return [result async for result in self.refresh(methods)]
+
+    async def open_session(self, profile: ConnectionPoolProfile = None):
+        """Open a shared session with a connection pool profile.
+
+        The connections of the session are counted in connection_stats.
+        """
+        if self.session is not None:
+            raise MyPermobilClientException("Session already exists")
+        self.session = await create_session(profile, self.connection_stats)
+        for api in self.apis:
+            api.session = self.session
+
+    async def close_session(self):
+        """Close the shared session."""
+        if self.session is None:
+            raise MyPermobilClientException("Session does not exist")
+        await self.session.close()
+        self.session = None
+        for api in self.apis:
+            api.session = None
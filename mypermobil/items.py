@@ -0,0 +1,66 @@
+"""Items compiled into hashable paths with a precomputed endpoint."""
+
+from .const import ITEM_LOOKUP
+from .exceptions import MyPermobilClientException
+
+
+class ItemPath(tuple):
+    """An item compiled once into a path and the endpoint it belongs to.
+
+    It is a tuple of the steps in the JSON tree, so it is hashable and equal
+    to tuple(item) of the list based item it was compiled from.
+    """
+
+    def __new__(cls, items, endpoint: str):
+        """Create the path."""
+        path = super().__new__(cls, items)
+        path.endpoint = endpoint
+        return path
+
+    def __repr__(self) -> str:
+        """repr."""
+        return f"ItemPath({list(self)}, {self.endpoint})"
+
+    def get(self, response):
+        """Dive into the response for each step of the path."""
+        for item in self:
+            try:
+                response = response[item]
+            except (KeyError, IndexError, TypeError) as err:
+                raise MyPermobilClientException(f"{item} not in response") from err
+        return response
+
+
+# when multiple endpoints have the same item, the FIRST one in the list will be used
+ITEM_PATHS = {
+    tuple(item): ItemPath(item, endpoint)
+    for endpoint, items in list(ITEM_LOOKUP.items())[::-1]
+    for item in items
+}
+
+
+def get_or_none(path: ItemPath, response):
+    """Get an item from a response, None if it is not in the response."""
+    try:
+        return path.get(response)
+    except MyPermobilClientException:
+        return None
+
+
+def compile_item(items, endpoint: str = None) -> ItemPath:
+    """Compile an item, or return it as is if it is already compiled.
+
+    Without an endpoint the item must be in ITEM_LOOKUP.
+    """
+    if isinstance(items, ItemPath) and endpoint is None:
+        return items
+    if isinstance(items, str):
+        items = [items]
+    if not items:
+        raise MyPermobilClientException("No item(s) provided")
+    path = tuple(items)
+    if endpoint is not None:
+        return ItemPath(path, endpoint)
+    if path not in ITEM_PATHS:
+        raise MyPermobilClientException(f"No endpoint for: {list(path)}")
+    return ITEM_PATHS[path]
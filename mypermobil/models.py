@@ -0,0 +1,165 @@
+"""Slotted models of the responses, with far less memory than the dicts."""
+
+import json
+
+from . import const
+from .const import (
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_DAILY_USAGE,
+    ENDPOINT_PRODUCTS_POSITIONS,
+    ENDPOINT_VA_USAGE_RECORDS,
+)
+from .items import ItemPath, get_or_none
+from .positions import parse_position
+
+
+def const_fields(prefix: str, endpoint: str) -> dict:
+    """Attribute name -> item for the items in const with a prefix.
+
+    BATTERY_STATE_OF_CHARGE becomes the attribute state_of_charge.
+    """
+    return {
+        name[len(prefix) :].lower(): ItemPath(value, endpoint)
+        for name, value in vars(const).items()
+        if name.startswith(prefix) and isinstance(value, list)
+    }
+
+
+class Model:
+    """A response with one slot per item instead of a dict.
+
+    Created from a decoded response, or from the raw body which is only
+    decoded the first time an attribute is read. Items that are not in the
+    response are None.
+    """
+
+    __slots__ = ("_body", "_loads")
+    fields = {}  # attribute name -> item, set by every model
+
+    def __init__(self, response=None, body: bytes = None, loads=json.loads) -> None:
+        """Initialize."""
+        self._body = body
+        self._loads = loads
+        if body is None:
+            self._set(response if response is not None else {})
+
+    def __getattr__(self, name: str):
+        """Decode the body the first time an item is read."""
+        # only called for the slots that are not set yet
+        if name in type(self).fields and self._body is not None:
+            self._decode()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __eq__(self, other) -> bool:
+        """eq."""
+        if type(other) is not type(self):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        """repr."""
+        values = [f"{name}={value!r}" for name, value in self.as_dict().items()]
+        return f"{type(self).__name__}({', '.join(values)})"
+
+    @property
+    def decoded(self) -> bool:
+        """False while the body has not been decoded."""
+        return self._body is None
+
+    def _decode(self):
+        """Decode the body and drop it."""
+        response = self._loads(self._body)
+        self._body = None
+        self._set(response)
+
+    def _set(self, response):
+        """Set every slot from a decoded response."""
+        for name, path in self.fields.items():
+            setattr(self, name, get_or_none(path, response))
+
+    def as_dict(self) -> dict:
+        """Attribute name -> value."""
+        return {name: getattr(self, name) for name in self.fields}
+
+
+class BatteryInfo(Model):
+    """Response of ENDPOINT_BATTERY_INFO."""
+
+    fields = const_fields("BATTERY_", ENDPOINT_BATTERY_INFO)
+    __slots__ = tuple(fields)
+
+
+class DailyUsage(Model):
+    """Response of ENDPOINT_DAILY_USAGE."""
+
+    fields = const_fields("USAGE_", ENDPOINT_DAILY_USAGE)
+    __slots__ = tuple(fields)
+
+
+class UsageRecords(Model):
+    """Response of ENDPOINT_VA_USAGE_RECORDS."""
+
+    fields = const_fields("RECORDS_", ENDPOINT_VA_USAGE_RECORDS)
+    __slots__ = tuple(fields)
+
+
+class Position:
+    """A position with the timestamp in seconds since the epoch."""
+
+    __slots__ = ("timestamp", "latitude", "longitude")
+
+    def __init__(self, timestamp: float, latitude: float, longitude: float) -> None:
+        """Initialize."""
+        self.timestamp = timestamp
+        self.latitude = latitude
+        self.longitude = longitude
+
+    def __iter__(self):
+        """iter, as the (timestamp, latitude, longitude) of parse_position."""
+        return iter((self.timestamp, self.latitude, self.longitude))
+
+    def __eq__(self, other) -> bool:
+        """eq."""
+        if not isinstance(other, Position):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    def __repr__(self) -> str:
+        """repr."""
+        return f"Position({self.timestamp}, {self.latitude}, {self.longitude})"
+
+    @classmethod
+    def parse(cls, position):
+        """A position from the response, None if it has no coordinates."""
+        parsed = parse_position(position)
+        return None if parsed is None else cls(*parsed)
+
+
+class Positions(Model):
+    """Response of ENDPOINT_PRODUCTS_POSITIONS.
+
+    `current` is a Position and `previous` a tuple of them, the positions
+    without coordinates are left out.
+    """
+
+    fields = const_fields("POSITIONS_", ENDPOINT_PRODUCTS_POSITIONS)
+    __slots__ = tuple(fields)
+
+    def _set(self, response):
+        """Set every slot from a decoded response."""
+        self.current = Position.parse(get_or_none(self.fields["current"], response))
+        previous = get_or_none(self.fields["previous"], response)
+        if not isinstance(previous, list):
+            previous = []
+        positions = (Position.parse(position) for position in previous)
+        self.previous = tuple(pos for pos in positions if pos is not None)
+
+
+# the model of the response of an endpoint
+MODEL_LOOKUP = {
+    ENDPOINT_BATTERY_INFO: BatteryInfo,
+    ENDPOINT_DAILY_USAGE: DailyUsage,
+    ENDPOINT_VA_USAGE_RECORDS: UsageRecords,
+    ENDPOINT_PRODUCTS_POSITIONS: Positions,
+}
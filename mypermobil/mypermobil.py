@@ -2,11 +2,30 @@
 
 import asyncio
 import datetime
+import functools
+import json
 import re
+from collections.abc import Mapping
 
 import aiohttp
-from aiocache import Cache
 
+from .cache import MISSING, MyPermobilCache
+from .coalesce import COALESCER, RequestCoalescer
+from .items import ItemPath, compile_item, get_or_none
+from .models import MODEL_LOOKUP, Model
+from .positions import PositionCursor
+from .ratelimit import RateLimiter, parse_retry_after
+from .retry import RetryPolicy
+from .stream import iter_json
+from .session import (
+    CONTENT_ENCODINGS,
+    DECODE_ERRORS,
+    ConnectionPoolProfile,
+    ConnectionStats,
+    MyPermobilResponse,
+    create_session,
+    json_decoder,
+)
 from .exceptions import (
     MyPermobilAPIException,
     MyPermobilConnectionException,
@@ -18,12 +37,17 @@ from .exceptions import (
 from .const import (
     ENDPOINT_APPLICATIONAUTHENTICATIONS,
     ENDPOINT_APPLICATIONLINKS,
-    ENDPOINT_LOOKUP,
     ENDPOINT_PRODUCTS,
     ENDPOINT_BATTERY_INFO,
     ENDPOINT_DAILY_USAGE,
     ENDPOINT_VA_USAGE_RECORDS,
     ENDPOINT_PRODUCTS_POSITIONS,
+    CACHE_TTL_LOOKUP,
+    ACCEPT_ENCODING,
+    ETAG,
+    LAST_MODIFIED,
+    IF_NONE_MATCH,
+    IF_MODIFIED_SINCE,
     PRODUCTS_ID,
     GET_REGIONS,
     EMAIL_REGEX,
@@ -34,67 +58,186 @@ from .const import (
 )
 
 
-CACHE: Cache = Cache()
-CACHE_TTL = 5 * 60  # 5 minutes
+CACHE_TTL = 5 * 60  # 5 minutes, for endpoints not in CACHE_TTL_LOOKUP
 CACHE_ERROR_TTL = 10  # 10 seconds
-CACHE_LOCKS = {}
 
 
-async def async_get_cache(key):
-    """Get cache."""
+def get_cache(cache: MyPermobilCache, key: tuple):
+    """Get cache, MISSING if there is no cached data."""
     # get the cached data
-    res = await CACHE.get(key)
+    res = cache.get(key, MISSING)
     if isinstance(res, Exception):
         # if the cached data is an error, raise instead of returning
         raise res
     return res
 
 
-def cacheable(func):
+def cacheable(key_func):
     """Decorator to cache function calls for methods that
     fetch multiple data points from the API.
+
+    `key_func` takes the same arguments as the method and returns the
+    structured cache key (region, endpoint, ...), the endpoint decides the TTL.
+
+    Concurrent calls with the same key share a single request, and all of
+    them get its response or its exception.
+
+    If the instance has `stale_while_revalidate` set, an expired response is
+    returned immediately while it is refreshed in the background. A failed
+    refresh is not retried for CACHE_ERROR_TTL seconds.
     """
 
-    async def wrapper(*args, **kwargs):
-        """wrapper."""
-        key = func.__name__ + str(args) + str(kwargs)
-        # check if the request is already cached
-        cached_data = await async_get_cache(key)
-        if cached_data:
-            # return cached data
-            return cached_data
-
-        # check if the request is already in progress
-        if key in CACHE_LOCKS:
-            # request is already in progress, wait for it to finish
-            await CACHE_LOCKS[key].wait()
-            res = await async_get_cache(key)
-            return res  # return cached data once it has finished by other task
-
-        # start request it and lock other requests from starting
-        CACHE_LOCKS[key] = asyncio.Event()
+    def decorator(func):
+        """decorator."""
+
+        async def fetch(self, key, args, kwargs, revalidate=False):
+            """Make the request and cache the response."""
+            cache = self.cache
+            try:
+                # make the request, or join the identical request from
+                # another instance that is already in flight
+                if self.coalescer is None:
+                    response = await func(self, *args, **kwargs)
+                else:
+                    response = await self.coalescer.run(
+                        (*key, self.token), lambda: func(self, *args, **kwargs)
+                    )
+                validators = None
+                if isinstance(response, Validated):
+                    if response.not_modified:
+                        cache.not_modified += 1
+                    validators = response.validators
+                    response = response.value
+                # cache the response
+                cache.set(
+                    key,
+                    response,
+                    ttl=self.cache_ttl(key[1]),
+                    stale_ttl=self.stale_while_revalidate or 0,
+                    validators=validators,
+                )
+                cache.cooldowns.pop(key, None)
+            except Exception as err:  # pylint: disable=broad-except
+                # if there is an error, cache the error and raise it
+                # unless the stale response is still being served, then
+                # the refresh is not retried for as long
+                if revalidate:
+                    cache.cooldowns[key] = cache.clock() + CACHE_ERROR_TTL
+                else:
+                    cache.set(key, err, ttl=CACHE_ERROR_TTL)
+                raise err
+            return response
+
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            """wrapper."""
+            cache = self.cache
+            key = key_func(self, *args, **kwargs)
+            # check if the request is already cached
+            cached_data = get_cache(cache, key)
+            if cached_data is not MISSING:
+                # return cached data
+                return cached_data
+
+            if self.stale_while_revalidate:
+                stale_data = cache.get_stale(key, MISSING)
+                if stale_data is not MISSING and not isinstance(
+                    stale_data, Exception
+                ):
+                    # return the stale data and refresh it unless another
+                    # task is already doing so, a failed refresh keeps
+                    # serving the stale data until its cooldown passes
+                    if key not in cache.flights and (
+                        cache.cooldowns.get(key, 0) <= cache.clock()
+                    ):
+                        inflight = cache.flights.start(
+                            key, lambda: fetch(self, key, args, kwargs, True)
+                        )
+                        self.track_background_task(inflight.task)
+                    return stale_data
 
-        try:
-            response = await func(*args, **kwargs)  # make the request
-            await CACHE.set(key, response, ttl=CACHE_TTL)  # cache the response
-        except Exception as err:  # pylint: disable=broad-except
-            # if there is an error, cache the error and raise it
-            await CACHE.set(key, err, ttl=CACHE_ERROR_TTL)
-            raise err
-        finally:
-            # regardless of the outcome, unlock other threads
-            CACHE_LOCKS[key].set()
-            del CACHE_LOCKS[key]
-        return response
+            # make the request, or wait for the request already in progress
+            return await cache.flights.run(
+                key, lambda: fetch(self, key, args, kwargs)
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def regions_key(api, include_icons: bool = False, include_internal: bool = False):
+    """Cache key for request_regions."""
+    if api.email and api.email.endswith("@permobil.com"):
+        include_internal = True
+    # the regions are the same for every region, but not every regions service
+    return (None, api.regions_url, include_icons, include_internal)
+
+
+def endpoint_key(api, endpoint: str, headers: dict = None, product_id: str = None):
+    """Cache key for request_endpoint."""
+    if product_id is None:
+        product_id = api.product_id
+    return (api.region, endpoint, product_id)
+
+
+class Validated:
+    """A response and the validators to make a conditional request with."""
+
+    __slots__ = ("value", "validators", "not_modified")
+
+    def __init__(self, value, validators: dict, not_modified: bool = False):
+        """Initialize."""
+        self.value = value
+        self.validators = validators
+        self.not_modified = not_modified  # the cached value was revalidated
+
+
+def response_validators(headers) -> dict:
+    """The ETag and Last-Modified of a response, None if it has neither."""
+    if not isinstance(headers, Mapping):
+        return None
+    validators = {}
+    for name in (ETAG, LAST_MODIFIED):
+        value = headers.get(name)
+        if isinstance(value, str) and value:
+            validators[name] = value
+    return validators or None
+
+
+def conditional_headers(validators: dict) -> dict:
+    """Headers that make a request conditional on the validators."""
+    headers = {}
+    if ETAG in validators:
+        headers[IF_NONE_MATCH] = validators[ETAG]
+    if LAST_MODIFIED in validators:
+        headers[IF_MODIFIED_SINCE] = validators[LAST_MODIFIED]
+    return headers
+
+
+async def decode_json(response, loads=json.loads):
+    """Decode the body of a response with `loads`.
+
+    The default decoder is not passed on, so any response with a json()
+    method works as long as the default is used.
+    """
+    if loads is json.loads:
+        return await response.json()
+    return await response.json(loads=loads)
 
-    return wrapper
 
+async def parse_response(response, not_modified=MISSING, loads=json.loads) -> dict:
+    """Parse a response, or raise the error it holds.
 
-async def parse_response(response) -> dict:
+    If the response is a 304 Not Modified, `not_modified` is the cached value
+    that is still valid and it is returned. The body is decoded with `loads`.
+    """
+    if response.status == 304 and not_modified is not MISSING:
+        return not_modified
     try:
-        res = await response.json()
+        res = await decode_json(response, loads)
         status = response.status
-    except aiohttp.client_exceptions.ContentTypeError:
+    except (aiohttp.client_exceptions.ContentTypeError, *DECODE_ERRORS):
         raise MyPermobilAPIException("Invalid formatted server response")
     if status == 200:
         return res
@@ -182,15 +325,11 @@ def validate_product_id(product_id: str) -> str:
     return product_id
 
 
-async def create_session():
-    """Create a client session."""
-    return aiohttp.ClientSession()
-
-
 class MyPermobil:
     """Permobil API."""
 
     request_timeout = 10
+    regions_url = GET_REGIONS  # the regions service
 
     def __init__(
         self,
@@ -202,6 +341,14 @@ class MyPermobil:
         token: str = None,
         expiration_date: str = None,
         product_id: str = None,
+        cache: MyPermobilCache = None,
+        cache_ttls: dict = None,
+        stale_while_revalidate: float = None,
+        retry_policy: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+        coalescer: RequestCoalescer = COALESCER,
+        json_loads=None,
+        compression: bool | str = True,
     ) -> None:
         """Initialize."""
         self.application = application
@@ -212,6 +359,31 @@ class MyPermobil:
         self.token = token
         self.expiration_date = expiration_date
         self.product_id = product_id
+        # the cache can be shared by clients that use the same account
+        self.cache = cache if cache is not None else MyPermobilCache()
+        # seconds to cache each endpoint, overrides CACHE_TTL_LOOKUP
+        self.cache_ttls = {**CACHE_TTL_LOOKUP, **(cache_ttls or {})}
+        # seconds after expiry that a stale response may be returned while it
+        # is refreshed in the background, None to always wait for the refresh
+        self.stale_while_revalidate = stale_while_revalidate
+        self.background_tasks = set()
+        # updated by sessions opened with open_session
+        self.connection_stats = ConnectionStats()
+        # None to never retry
+        self.retry_policy = retry_policy
+        # share the limiter between clients that should be limited together
+        self.rate_limiter = rate_limiter
+        # shares identical requests in flight between instances, None for no
+        # sharing between instances
+        self.coalescer = coalescer
+        # decodes the JSON bodies, a function or a name for json_decoder
+        if json_loads is None or isinstance(json_loads, str):
+            json_loads = json_decoder(json_loads or "json")
+        self.json_loads = json_loads
+        # the Accept-Encoding of the requests, False for uncompressed responses
+        if compression is True:
+            compression = CONTENT_ENCODINGS
+        self.accept_encoding = compression or "identity"
 
         self.authenticated = False
 
@@ -230,6 +402,32 @@ class MyPermobil:
             raise MyPermobilClientException("Not authenticated")
         return {"Authorization": f"Bearer {self.token}"}
 
+    @property
+    def cache_stats(self) -> dict:
+        """Hit, miss and eviction counters of the cache."""
+        return self.cache.stats
+
+    def cache_ttl(self, endpoint: str) -> float:
+        """Seconds to cache the response of an endpoint."""
+        if endpoint == self.regions_url:
+            # the regions are cached as long from any regions service
+            endpoint = GET_REGIONS
+        return self.cache_ttls.get(endpoint, CACHE_TTL)
+
+    def track_background_task(self, task: asyncio.Future) -> asyncio.Future:
+        """Keep a reference to a task running in the background until it is
+        done. Its exception is retrieved since nobody awaits it.
+        """
+
+        def done(task: asyncio.Future):
+            self.background_tasks.discard(task)
+            if not task.cancelled():
+                task.exception()
+
+        self.background_tasks.add(task)
+        task.add_done_callback(done)
+        return task
+
     def set_email(self, email: str):
         """Set email."""
         if self.authenticated:
@@ -270,6 +468,15 @@ class MyPermobil:
             raise MyPermobilClientException("Cannot change app after authentication")
         self.application = application
 
+    async def open_session(self, profile: ConnectionPoolProfile = None):
+        """Open a session with a connection pool profile.
+
+        The connections of the session are counted in connection_stats.
+        """
+        if self.session is not None:
+            raise MyPermobilClientException("Session already exists")
+        self.session = await create_session(profile, self.connection_stats)
+
     async def close_session(self):
         """Close session."""
         if self.session is None:
@@ -303,26 +510,84 @@ class MyPermobil:
         self.code = None
         self.authenticated = False
 
+    def encoding_headers(self, headers: dict = None) -> dict:
+        """A copy of the headers that negotiates the compression."""
+        return {ACCEPT_ENCODING: self.accept_encoding, **(headers or {})}
+
     # API Methods
-    async def make_request(self, request_type: str, *args, **kwargs):
-        """make a post, get, put or delete request"""
+    async def make_request(
+        self, request_type: str, *args, **kwargs
+    ) -> MyPermobilResponse:
+        """make a post, get, put or delete request
+
+        The response is read and released before it is returned. With a
+        retry policy, connection errors and retryable statuses are retried.
+        """
         if not kwargs.get("timeout"):
             kwargs["timeout"] = self.request_timeout
         if not kwargs.get("headers") and self.authenticated:
             kwargs["headers"] = self.headers
+        kwargs["headers"] = self.encoding_headers(kwargs.get("headers"))
 
         if request_type not in (GET, POST, PUT, DELETE):
             raise MyPermobilClientException("Invalid request type")
 
+        policy = self.retry_policy
+        if policy is None:
+            return await self.send_request(request_type, *args, **kwargs)
+
+        policy.budget.deposit()
+        attempt = 1
+        while True:
+            try:
+                response = await self.send_request(request_type, *args, **kwargs)
+            except MyPermobilConnectionException:
+                if not policy.should_retry(request_type, attempt):
+                    raise
+                delay = policy.delay(attempt)
+            else:
+                if response.status not in policy.retry_statuses:
+                    return response
+                if not policy.should_retry(request_type, attempt):
+                    return response
+                # wait at least as long as the server asks for
+                retry_after = parse_retry_after(response.headers) or 0
+                delay = max(policy.delay(attempt), retry_after)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def send_request(
+        self, request_type: str, *args, **kwargs
+    ) -> MyPermobilResponse:
+        """Send a single request and read the response.
+
+        With a rate limiter, wait for its permission first.
+        """
+        limiter = self.rate_limiter
+        url = args[0] if args else kwargs.get("url")
+        if limiter is not None:
+            await limiter.acquire(url, self.token)
+        response = await self.read_request(request_type, *args, **kwargs)
+        if limiter is not None and response.status == 429:
+            seconds = parse_retry_after(response.headers) or 0
+            limiter.retry_after(url, self.token, seconds)
+        return response
+
+    async def read_request(
+        self, request_type: str, *args, **kwargs
+    ) -> MyPermobilResponse:
+        """Make the request and read the response."""
         try:
             if request_type == GET:
-                return await self.session.get(*args, **kwargs)
-            if request_type == POST:
-                return await self.session.post(*args, **kwargs)
-            if request_type == PUT:
-                return await self.session.put(*args, **kwargs)
-            if request_type == DELETE:
-                return await self.session.delete(*args, **kwargs)
+                response = await self.session.get(*args, **kwargs)
+            elif request_type == POST:
+                response = await self.session.post(*args, **kwargs)
+            elif request_type == PUT:
+                response = await self.session.put(*args, **kwargs)
+            else:
+                response = await self.session.delete(*args, **kwargs)
+            # read the whole body so that the connection is always released
+            return await MyPermobilResponse.read(response)
         except aiohttp.ClientConnectorError as err:
             raise MyPermobilConnectionException("Connection error") from err
         except asyncio.TimeoutError as err:
@@ -332,7 +597,7 @@ class MyPermobil:
         except Exception as err:
             raise MyPermobilAPIException("Unknown error") from err
 
-    @cacheable
+    @cacheable(regions_key)
     async def request_regions(
         self, include_icons: bool = False, include_internal: bool = False
     ):
@@ -340,9 +605,9 @@ class MyPermobil:
         if self.email and self.email.endswith("@permobil.com"):
             include_internal = True
 
-        response = await self.make_request(GET, GET_REGIONS, headers={})
+        response = await self.make_request(GET, self.regions_url, headers={})
         if response.status == 200:
-            response_json = await response.json()
+            response_json = await decode_json(response, self.json_loads)
             regions = {}
             for region in response_json:
                 if not include_internal:
@@ -361,9 +626,9 @@ class MyPermobil:
                     regions[region_id]["icon"] = region.get("flag")
             return regions
 
-        if response.status in (404, 500):
-            text = await response.text()
-            raise MyPermobilAPIException(text)
+        # an error is cached for CACHE_ERROR_TTL, unlike a result
+        text = await response.text()
+        raise MyPermobilAPIException(f"{response.status}: {text}")
 
     async def request_region_names(self, include_internal: bool = False):
         """Get region names."""
@@ -438,7 +703,7 @@ class MyPermobil:
             "expirationDate": expiration_date,
         }
         response = await self.make_request(POST, url, json=json)
-        res = await parse_response(response)
+        res = await parse_response(response, loads=self.json_loads)
         token = res.get("token")
         return token, expiration_date
 
@@ -488,47 +753,135 @@ class MyPermobil:
         return response[PRODUCTS_ID[0]][PRODUCTS_ID[1]]
 
     async def request_item(
-        self, items: str | list[str], endpoint: str = None, **kwargs
+        self, items: str | list[str] | ItemPath, endpoint: str = None, **kwargs
     ) -> str | int | float | bool | dict | list:
         """Takes a single item or list of items, finds the endpoint and makes the request."""
-        if not items:
-            raise MyPermobilClientException("No item(s) provided")
+        path = compile_item(items, endpoint)
+        response = await self.request_endpoint(path.endpoint, kwargs)
+        return path.get(response)
 
-        if isinstance(items, str):
-            items = [items]
+    async def request_items(self, items_list: list) -> dict:
+        """Takes many items and makes one request per distinct endpoint.
 
-        if endpoint is None:
-            key = str(items)
-            if key in ENDPOINT_LOOKUP:
-                endpoint = ENDPOINT_LOOKUP.get(key)
-            else:
-                raise MyPermobilClientException(f"No endpoint for: {key}")
-
-        # dive into the response for each item in the list
-        response = await self.request_endpoint(endpoint, kwargs)
-        for item in items:
-            if isinstance(response, dict) and item not in response:
-                raise MyPermobilClientException(f"{item} not in response")
-            if isinstance(response, list) and item >= len(response):
-                raise MyPermobilClientException(
-                    f"Too few items in response {item} >= {len(response)}"
-                )
-            response = response[item]
-        return response
+        The requests are made concurrently. Returns a dict of tuple(item) to
+        value, where the value is the exception instead if the item could not
+        be found or the request to its endpoint failed.
+        """
+        if not items_list:
+            raise MyPermobilClientException("No item(s) provided")
 
-    @cacheable
+        results = {}
+        endpoints = {}
+        for items in items_list:
+            try:
+                path = compile_item(items)
+            except MyPermobilClientException as err:
+                results[tuple([items] if isinstance(items, str) else items)] = err
+                continue
+            endpoints.setdefault(path.endpoint, []).append(path)
+
+        responses = await asyncio.gather(
+            *(self.request_endpoint(endpoint) for endpoint in endpoints),
+            return_exceptions=True,
+        )
+        for paths, response in zip(endpoints.values(), responses):
+            for path in paths:
+                if isinstance(response, Exception):
+                    results[path] = response
+                    continue
+                try:
+                    results[path] = path.get(response)
+                except MyPermobilClientException as err:
+                    results[path] = err
+        return results
+
+    @cacheable(endpoint_key)
     async def request_endpoint(
         self, endpoint: str, headers: dict = None, product_id: str = None
     ) -> dict:
         """Makes a request to an endpoint."""
-        if headers is None:
+        # resolve the auth headers before any conditional headers are added,
+        # make_request only adds them to empty headers
+        if not headers:
             headers = self.headers
         if product_id is None:
             product_id = self.product_id
 
+        # revalidate the expired response if it has validators
+        key = endpoint_key(self, endpoint, product_id=product_id)
+        validated = self.cache.get_validated(key)
+        cached = MISSING
+        if validated is not None:
+            cached, validators = validated
+            headers = {**headers, **conditional_headers(validators)}
+
         endpoint = self.region + endpoint.format(product_id=product_id)
         resp = await self.make_request(GET, endpoint, headers=headers)
-        return await parse_response(resp)
+        res = await parse_response(resp, cached, self.json_loads)
+        if validated is not None and resp.status == 304:
+            # the server may leave out the validators that did not change
+            validators = response_validators(resp.headers) or validators
+            return Validated(res, validators, not_modified=True)
+        validators = response_validators(resp.headers)
+        return Validated(res, validators) if validators else res
+
+    async def stream_endpoint(
+        self,
+        endpoint: str,
+        path=(),
+        items: list = None,
+        headers: dict = None,
+        product_id: str = None,
+        chunk_size: int = 64 * 1024,
+    ):
+        """Stream the elements of the JSON array at `path` in the response.
+
+        The body is decoded as it arrives, so only one element at a time is
+        kept in memory instead of the whole response. With `items`, a tuple
+        of those items (None if missing) is yielded for every element instead
+        of the element. Streamed responses are not cached or coalesced.
+        """
+        if headers is None:
+            headers = self.headers
+        if product_id is None:
+            product_id = self.product_id
+        paths = [compile_item(item, endpoint) for item in items] if items else None
+
+        url = self.region + endpoint.format(product_id=product_id)
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire(url, self.token)
+        try:
+            async with self.session.get(
+                url,
+                headers=self.encoding_headers(headers),
+                timeout=self.request_timeout,
+            ) as response:
+                if response.status != 200:
+                    error = await MyPermobilResponse.read(response)
+                    await parse_response(error, loads=self.json_loads)
+                chunks = response.content.iter_chunked(chunk_size)
+                async for value in iter_json(chunks, path):
+                    if paths is None:
+                        yield value
+                    else:
+                        yield tuple(get_or_none(item, value) for item in paths)
+        except aiohttp.ClientConnectorError as err:
+            raise MyPermobilConnectionException("Connection error") from err
+        except asyncio.TimeoutError as err:
+            raise MyPermobilConnectionException("Connection timeout") from err
+        except aiohttp.ClientError as err:
+            raise MyPermobilConnectionException("Client error") from err
+
+    async def request_model(self, endpoint: str, product_id: str = None) -> Model:
+        """Makes a request to an endpoint in MODEL_LOOKUP and returns its model.
+
+        A model takes far less memory than the response, so use it for the
+        responses that are kept around.
+        """
+        if endpoint not in MODEL_LOOKUP:
+            raise MyPermobilClientException(f"No model for: {endpoint}")
+        response = await self.request_endpoint(endpoint, product_id=product_id)
+        return MODEL_LOOKUP[endpoint](response)
 
     async def get_battery_info(self) -> dict:
         """ request battery info """
@@ -545,3 +898,8 @@ class MyPermobil:
     async def get_gps_position(self) -> dict:
         """ request gps info """
         return await self.request_endpoint(ENDPOINT_PRODUCTS_POSITIONS)
+
+    async def get_new_positions(self, cursor: PositionCursor) -> list:
+        """ request gps info, only the positions newer than the cursor's mark """
+        response = await self.request_endpoint(ENDPOINT_PRODUCTS_POSITIONS)
+        return cursor.new_positions(self.product_id, response)
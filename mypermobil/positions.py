@@ -0,0 +1,460 @@
+"""Position history of many chairs with a spatial index, requires numpy."""
+
+import bisect
+import datetime
+import json
+import math
+import os
+import time
+from array import array
+
+from .analytics import np, require_numpy
+from .const import ENDPOINT_PRODUCTS_POSITIONS, POSITIONS_CURRENT, POSITIONS_PREVIOUS
+from .exceptions import MyPermobilClientException
+from .items import compile_item
+
+EARTH_RADIUS = 6371008.8  # meters
+METERS_PER_DEGREE = 2 * math.pi * EARTH_RADIUS / 360
+POSITION_LATITUDE = "latitude"
+POSITION_LONGITUDE = "longitude"
+POSITION_COORDINATES = "coordinates"  # GeoJSON order, [longitude, latitude]
+POSITION_TIMESTAMPS = ("timestamp", "localTimestamp", "date")
+
+CURRENT = compile_item(POSITIONS_CURRENT)
+PREVIOUS = compile_item(POSITIONS_PREVIOUS)
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great circle distance in meters, vectorized over numpy arrays."""
+    require_numpy()
+    lat1, lon1, lat2, lon2 = (np.radians(value) for value in (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_timestamp(value) -> float:
+    """Seconds since the epoch from a number or an ISO 8601 string."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # milliseconds are used by javascript backends
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            date = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        if date.tzinfo is None:
+            date = date.replace(tzinfo=datetime.timezone.utc)
+        return date.timestamp()
+    return None
+
+
+def parse_position(position) -> tuple:
+    """(timestamp, latitude, longitude) of a position, None if it has none.
+
+    The timestamp is None if the position does not have one.
+    """
+    if not isinstance(position, dict):
+        return None
+    if POSITION_LATITUDE in position and POSITION_LONGITUDE in position:
+        lat, lon = position[POSITION_LATITUDE], position[POSITION_LONGITUDE]
+    elif isinstance(position.get(POSITION_COORDINATES), (list, tuple)):
+        lon, lat = position[POSITION_COORDINATES][:2]
+    else:
+        return None
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    timestamp = None
+    for key in POSITION_TIMESTAMPS:
+        if key in position:
+            timestamp = parse_timestamp(position[key])
+            break
+    return timestamp, lat, lon
+
+
+def scan_positions(response, mark: float = None, last=None, now: float = None):
+    """(positions, mark, last) of the positions newer than `mark`.
+
+    previousPositions is scanned from its newest end and the scan stops at
+    the first position that is not newer than the mark, so only the new
+    positions are parsed. Previous positions without a timestamp are skipped.
+    The mark only advances to timestamps of the server: a current position
+    without one is new if it is not at `last`, the (latitude, longitude) of
+    the last current position handed out, and gets `now`. Oldest first.
+    """
+    try:
+        previous = PREVIOUS.get(response)
+    except MyPermobilClientException:
+        previous = None
+    positions = []
+    if isinstance(previous, list) and previous:
+        first = parse_position(previous[0])
+        final = parse_position(previous[-1])
+        newest_first = (
+            first is not None
+            and final is not None
+            and first[0] is not None
+            and final[0] is not None
+            and first[0] > final[0]
+        )
+        for position in previous if newest_first else reversed(previous):
+            position = parse_position(position)
+            if position is None or position[0] is None:
+                continue
+            if mark is not None and position[0] <= mark:
+                break
+            positions.append(position)
+        positions.reverse()
+    if positions:
+        mark = positions[-1][0]
+
+    try:
+        current = parse_position(CURRENT.get(response))
+    except MyPermobilClientException:
+        current = None
+    if current is not None:
+        if current[0] is None:
+            if last is None or tuple(last) != current[1:]:
+                current = (now if now is not None else time.time(), *current[1:])
+                positions.append(current)
+                last = current[1:]
+        elif mark is None or current[0] > mark:
+            positions.append(current)
+            mark, last = current[0], current[1:]
+    if len(positions) > 1 and positions[-2][0] > positions[-1][0]:
+        positions.sort(key=lambda position: position[0])
+    return positions, mark, last
+
+
+def new_positions(response, mark: float = None, now: float = None, last=None) -> list:
+    """(timestamp, latitude, longitude) of the positions newer than `mark`.
+
+    See scan_positions, the current position gets `now` if it has no
+    timestamp. Oldest first.
+    """
+    return scan_positions(response, mark, last, now)[0]
+
+
+class PositionCursor:
+    """The high-water mark of the positions handed out for every chair.
+
+    The marks are timestamps of the server only. A current position without
+    a timestamp is handed out again only when it has moved, so the last one
+    of every chair is kept as well. With a path, both are saved to a JSON
+    file so that a restarted process only gets the positions it has not
+    seen. The file holds every chair, so it is written at most once every
+    `save_interval` seconds when the marks changed, or when `save` is
+    called; a mark is only durable once it has been saved, so call `save`
+    after a round of polls and before exiting.
+    """
+
+    def __init__(
+        self, path: str = None, clock=time.time, save_interval: float = 60
+    ) -> None:
+        """Initialize."""
+        self.path = path
+        self.clock = clock
+        self.save_interval = save_interval  # None to only save on `save`
+        self.dirty = False  # marks changed since the last save
+        self.saved = -math.inf  # time of the last save
+        self.marks = {}
+        self.last = {}  # product id -> [latitude, longitude]
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+            if isinstance(data.get("marks"), dict):
+                self.marks = data["marks"]
+                self.last = data.get("last", {})
+            else:
+                # the marks were saved alone before
+                self.marks = data
+
+    def __getitem__(self, product_id: str) -> float:
+        """The newest server timestamp handed out, None if there is none."""
+        return self.marks.get(product_id)
+
+    def new_positions(self, product_id: str, response) -> list:
+        """The positions of a response that are newer than the mark, oldest first."""
+        mark = self.marks.get(product_id)
+        last = self.last.get(product_id)
+        now = self.clock()
+        positions, mark, last = scan_positions(response, mark, last, now)
+        if positions:
+            if mark is not None:
+                self.marks[product_id] = mark
+            if last is not None:
+                self.last[product_id] = list(last)
+            self.dirty = True
+            if (
+                self.save_interval is not None
+                and now - self.saved >= self.save_interval
+            ):
+                self.save(now)
+        return positions
+
+    def reset(self, product_id: str = None):
+        """Forget the mark of a chair, or of every chair."""
+        if product_id is None:
+            self.marks.clear()
+            self.last.clear()
+        else:
+            self.marks.pop(product_id, None)
+            self.last.pop(product_id, None)
+        self.dirty = True
+        self.save()
+
+    def save(self, now: float = None):
+        """Write the marks if they changed, replacing the file so it is
+        never half written.
+        """
+        if self.path is None or not self.dirty:
+            return
+        temp = f"{self.path}.tmp"
+        with open(temp, "w", encoding="utf-8") as file:
+            json.dump({"marks": self.marks, "last": self.last}, file)
+        os.replace(temp, self.path)
+        self.dirty = False
+        self.saved = self.clock() if now is None else now
+
+
+class PositionTrack:
+    """The positions of one chair in time order, in arrays."""
+
+    __slots__ = ("times", "lats", "lons")
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.times = array("d")
+        self.lats = array("d")
+        self.lons = array("d")
+
+    def __len__(self) -> int:
+        """Number of positions."""
+        return len(self.times)
+
+    @property
+    def last(self) -> tuple:
+        """(timestamp, latitude, longitude) of the last position."""
+        if not self.times:
+            return None
+        return self.times[-1], self.lats[-1], self.lons[-1]
+
+    def add(self, timestamp: float, lat: float, lon: float) -> bool:
+        """Insert a position in time order.
+
+        It is skipped if there is a position at the same time, or if the one
+        before it is at the same place.
+        """
+        index = bisect.bisect_left(self.times, timestamp)
+        if index < len(self.times) and self.times[index] == timestamp:
+            return False
+        if index and (self.lats[index - 1], self.lons[index - 1]) == (lat, lon):
+            return False
+        if index == len(self.times):
+            self.times.append(timestamp)
+            self.lats.append(lat)
+            self.lons.append(lon)
+        else:
+            # a server position older than a current one stamped locally
+            self.times.insert(index, timestamp)
+            self.lats.insert(index, lat)
+            self.lons.insert(index, lon)
+        return True
+
+    def range(self, start: float = None, end: float = None) -> tuple:
+        """Times, latitudes and longitudes with start <= time < end as numpy arrays."""
+        require_numpy()
+        low = 0 if start is None else bisect.bisect_left(self.times, start)
+        high = len(self) if end is None else bisect.bisect_left(self.times, end)
+        return tuple(
+            np.frombuffer(data, dtype=np.float64)[low:high]
+            for data in (self.times, self.lats, self.lons)
+        )
+
+    def distance(self, start: float = None, end: float = None) -> float:
+        """Meters travelled between the positions with start <= time < end."""
+        _, lats, lons = self.range(start, end)
+        if len(lats) < 2:
+            return 0.0
+        return float(haversine(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum())
+
+
+class GridIndex:
+    """The last position of every chair in a grid of `cell_size` degrees."""
+
+    def __init__(self, cell_size: float = 0.01) -> None:
+        """Initialize."""
+        self.cell_size = cell_size
+        self.cells = {}  # cell -> set of keys
+        self.positions = {}  # key -> (cell, latitude, longitude)
+
+    def __len__(self) -> int:
+        """Number of chairs."""
+        return len(self.positions)
+
+    def cell(self, lat: float, lon: float) -> tuple:
+        """The cell of a position."""
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def update(self, key, lat: float, lon: float):
+        """Move a chair to its new position."""
+        cell = self.cell(lat, lon)
+        old = self.positions.get(key)
+        if old is not None and old[0] != cell:
+            self.cells[old[0]].discard(key)
+            if not self.cells[old[0]]:
+                del self.cells[old[0]]
+        self.cells.setdefault(cell, set()).add(key)
+        self.positions[key] = (cell, lat, lon)
+
+    def remove(self, key):
+        """Remove a chair."""
+        cell, _, _ = self.positions.pop(key)
+        self.cells[cell].discard(key)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def candidates(self, south: float, west: float, north: float, east: float):
+        """The keys in the cells that overlap a bounding box.
+
+        A box with west > east crosses the antimeridian.
+        """
+        if west > east:
+            return self.candidates(south, west, north, 180) + self.candidates(
+                south, -180, north, east
+            )
+        low_lat, low_lon = self.cell(south, west)
+        high_lat, high_lon = self.cell(north, east)
+        if (high_lat - low_lat + 1) * (high_lon - low_lon + 1) > len(self.cells):
+            # fewer cells in use than in the box, check them instead
+            return [
+                key
+                for (lat, lon), keys in self.cells.items()
+                if low_lat <= lat <= high_lat and low_lon <= lon <= high_lon
+                for key in keys
+            ]
+        return [
+            key
+            for lat in range(low_lat, high_lat + 1)
+            for lon in range(low_lon, high_lon + 1)
+            for key in self.cells.get((lat, lon), ())
+        ]
+
+    def in_bbox(self, south: float, west: float, north: float, east: float) -> list:
+        """The keys with a position in a bounding box, west > east if it
+        crosses the antimeridian.
+        """
+        return [
+            key
+            for key in self.candidates(south, west, north, east)
+            if south <= self.positions[key][1] <= north
+            and (
+                west <= self.positions[key][2] <= east
+                if west <= east
+                else not east < self.positions[key][2] < west
+            )
+        ]
+
+    def within(self, lat: float, lon: float, radius: float) -> list:
+        """(key, meters) of the chairs within `radius` meters, nearest first."""
+        delta_lat = radius / METERS_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + delta_lat, 90)))
+        delta_lon = 180 if cos_lat < 1e-9 else min(180, delta_lat / cos_lat)
+        if delta_lon >= 180:
+            west, east = -180, 180
+        else:
+            # wrap around the antimeridian, then west > east
+            west = (lon - delta_lon + 180) % 360 - 180
+            east = (lon + delta_lon + 180) % 360 - 180
+        keys = self.candidates(
+            max(-90, lat - delta_lat), west, min(90, lat + delta_lat), east
+        )
+        if not keys:
+            return []
+        require_numpy()
+        lats = np.array([self.positions[key][1] for key in keys])
+        lons = np.array([self.positions[key][2] for key in keys])
+        distances = haversine(lat, lon, lats, lons)
+        return sorted(
+            (
+                (key, float(distance))
+                for key, distance in zip(keys, distances)
+                if distance <= radius
+            ),
+            key=lambda item: item[1],
+        )
+
+
+class PositionStore:
+    """The position history of every chair and an index of where they are.
+
+    Responses of ENDPOINT_PRODUCTS_POSITIONS are ingested incrementally
+    with a mark of the newest server timestamp of every chair, like
+    PositionCursor: positions that are not newer than the mark, or that have
+    not moved, are skipped, so the previous positions that are in every
+    response are only stored once.
+    """
+
+    def __init__(self, cell_size: float = 0.01, clock=time.time) -> None:
+        """Initialize."""
+        require_numpy()
+        self.tracks = {}
+        self.marks = {}
+        self.last = {}
+        self.index = GridIndex(cell_size)
+        self.clock = clock
+
+    def __contains__(self, product_id) -> bool:
+        """in."""
+        return product_id in self.tracks
+
+    def __getitem__(self, product_id) -> PositionTrack:
+        """The track of a chair."""
+        return self.tracks[product_id]
+
+    def ingest(self, product_id: str, response) -> int:
+        """Add the new positions of a response, returns how many were added."""
+        positions, mark, last = scan_positions(
+            response,
+            self.marks.get(product_id),
+            self.last.get(product_id),
+            self.clock(),
+        )
+        if not positions:
+            return 0
+        if mark is not None:
+            self.marks[product_id] = mark
+        if last is not None:
+            self.last[product_id] = last
+
+        track = self.tracks.setdefault(product_id, PositionTrack())
+        added = sum(track.add(*position) for position in positions)
+        if added:
+            _, lat, lon = track.last
+            self.index.update(product_id, lat, lon)
+        return added
+
+    async def poll(self, api) -> int:
+        """Request the positions of a chair and ingest them."""
+        response = await api.request_endpoint(ENDPOINT_PRODUCTS_POSITIONS)
+        return self.ingest(api.product_id, response)
+
+    def within(self, lat: float, lon: float, radius: float) -> list:
+        """(product_id, meters) of the chairs within `radius` meters, nearest first."""
+        return self.index.within(lat, lon, radius)
+
+    def in_bbox(self, south: float, west: float, north: float, east: float) -> list:
+        """The product ids of the chairs in a bounding box."""
+        return self.index.in_bbox(south, west, north, east)
+
+    def distance(self, product_id: str, start: float = None, end: float = None):
+        """Meters travelled by a chair with start <= time < end."""
+        if product_id not in self.tracks:
+            return 0.0
+        return self.tracks[product_id].distance(start, end)
@@ -0,0 +1,152 @@
+"""Client side rate limiting of requests to the Permobil API."""
+
+import asyncio
+import datetime
+import email.utils
+import time
+from urllib.parse import urlparse
+
+from .exceptions import MyPermobilClientException
+
+
+def parse_retry_after(headers) -> float:
+    """Seconds to wait from a Retry-After header, None if there is none."""
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max(0.0, (date - now).total_seconds())
+
+
+class TokenBucket:
+    """Allows `rate` requests per second with bursts of `capacity` requests.
+
+    Tokens are reserved in order, so a request that has to wait knows for how
+    long when it reserves its token, and the bucket can be paused.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic) -> None:
+        """Initialize."""
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()  # tokens are refilled from this time
+
+    def _refill(self, now: float):
+        """Add the tokens for the time passed since the last refill."""
+        if now > self.updated:
+            elapsed = now - self.updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def reserve(self) -> float:
+        """Reserve a token, returns the seconds to wait before using it."""
+        now = self.clock()
+        self._refill(now)
+        self.tokens -= 1
+        wait = max(0.0, self.updated - now)
+        if self.tokens < 0:
+            wait += -self.tokens / self.rate
+        return wait
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`."""
+        now = self.clock()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0)
+        self.updated = max(self.updated, now + seconds)
+
+    def paused_for(self) -> float:
+        """Seconds left of a pause."""
+        return max(0.0, self.updated - self.clock())
+
+
+class RateLimiter:
+    """Token bucket rate limiter per region host, and optionally per token.
+
+    Share one limiter between all clients that should be limited together.
+    A 429 response pauses the bucket for its Retry-After.
+    """
+
+    def __init__(
+        self,
+        rate: float = 10,
+        capacity: float = None,
+        per_token: bool = False,
+        clock=time.monotonic,
+        sleep=asyncio.sleep,
+    ) -> None:
+        """Initialize."""
+        if rate <= 0:
+            raise MyPermobilClientException("Rate must be positive")
+        if capacity is not None and capacity < 1:
+            raise MyPermobilClientException("Capacity must be at least 1")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.per_token = per_token
+        self.clock = clock
+        self.sleep = sleep
+        self.buckets = {}
+        self.queued = 0  # requests waiting right now
+        self.max_queued = 0
+        self.requests = 0
+        self.waits = 0  # requests that had to wait
+        self.wait_time = 0.0  # total seconds waited
+        self.throttled = 0  # 429 responses
+
+    @property
+    def stats(self) -> dict:
+        """Queue depth and wait time counters."""
+        return {
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "requests": self.requests,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+            "throttled": self.throttled,
+        }
+
+    def key(self, url, token: str = None) -> tuple:
+        """The bucket key of a request."""
+        host = urlparse(str(url)).netloc
+        return (host, token if self.per_token else None)
+
+    def bucket(self, key: tuple) -> TokenBucket:
+        """Get the bucket of a key."""
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.rate, self.capacity, self.clock)
+        return self.buckets[key]
+
+    async def acquire(self, url, token: str = None):
+        """Wait until a request to `url` may be made."""
+        bucket = self.bucket(self.key(url, token))
+        self.requests += 1
+        wait = bucket.reserve()
+        if wait <= 0:
+            return
+        self.waits += 1
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        start = self.clock()
+        try:
+            while wait > 0:
+                await self.sleep(wait)
+                # the bucket may have been paused while waiting
+                wait = bucket.paused_for()
+        finally:
+            self.queued -= 1
+            self.wait_time += self.clock() - start
+
+    def retry_after(self, url, token: str = None, seconds: float = 0):
+        """Pause the requests to `url` after a 429 response."""
+        self.throttled += 1
+        self.bucket(self.key(url, token)).pause(seconds)
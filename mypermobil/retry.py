@@ -0,0 +1,92 @@
+"""Retry policy for transient request failures."""
+
+import random
+
+from .const import GET, PUT, DELETE
+from .exceptions import MyPermobilClientException
+
+
+class RetryBudget:
+    """Limits the retries to a fraction of the requests.
+
+    Every request deposits `ratio` tokens, up to `max_tokens`, and every
+    retry withdraws one. When the API is down the retries stop once the
+    budget is spent instead of multiplying the load on it.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10) -> None:
+        """Initialize."""
+        if ratio < 0 or max_tokens < 1:
+            raise MyPermobilClientException("Invalid retry budget")
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        """Add tokens for a request."""
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Take a token for a retry, False if the budget is spent."""
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RetryPolicy:
+    """When and how long to wait before retrying a request.
+
+    Requests are retried on connection errors and timeouts, and on the
+    statuses in `retry_statuses`, for at most `max_attempts` attempts. The
+    wait is exponential backoff with full jitter. Only idempotent requests
+    are retried by default. Clients that share a policy share its budget.
+    """
+
+    retry_statuses = (429, 502, 503, 504)
+    methods = (GET, PUT, DELETE)
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 10,
+        retry_statuses: tuple = None,
+        methods: tuple = None,
+        budget: RetryBudget = None,
+        rng: random.Random = None,
+    ) -> None:
+        """Initialize."""
+        if max_attempts < 1:
+            raise MyPermobilClientException("At least 1 attempt is needed")
+        if backoff < 0 or max_backoff < 0:
+            raise MyPermobilClientException("Backoff cannot be negative")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        if retry_statuses is not None:
+            self.retry_statuses = tuple(retry_statuses)
+        if methods is not None:
+            self.methods = tuple(methods)
+        self.budget = budget if budget is not None else RetryBudget()
+        self.rng = rng if rng is not None else random.Random()
+        self.retries = 0  # retries made
+        self.exhausted = 0  # requests that failed after all attempts
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after the given failed attempt, starting at 1."""
+        cap = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        return self.rng.uniform(0, cap)
+
+    def should_retry(self, request_type: str, attempt: int) -> bool:
+        """Check if a failed attempt should be retried, spending budget."""
+        if request_type not in self.methods:
+            return False
+        if attempt >= self.max_attempts:
+            self.exhausted += 1
+            return False
+        if not self.budget.withdraw():
+            self.exhausted += 1
+            return False
+        self.retries += 1
+        return True
@@ -0,0 +1,234 @@
+"""Background polling of many chairs with adaptive intervals."""
+
+import asyncio
+import inspect
+import random
+
+from .const import (
+    BATTERY_CHARGING,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_PRODUCTS_POSITIONS,
+    POSITIONS_CURRENT,
+)
+from .exceptions import MyPermobilClientException
+from .items import compile_item, get_or_none
+from .mypermobil import MyPermobil
+
+CHARGING = compile_item(BATTERY_CHARGING)
+CURRENT_POSITION = compile_item(POSITIONS_CURRENT)
+
+
+class PollUpdate:
+    """Result of polling one endpoint for one chair."""
+
+    __slots__ = ("api", "endpoint", "result", "error", "interval")
+
+    def __init__(
+        self, api: MyPermobil, endpoint: str, result=None, error=None, interval=None
+    ):
+        """Initialize."""
+        self.api = api
+        self.endpoint = endpoint
+        self.result = result
+        self.error = error
+        self.interval = interval  # seconds until the chair is polled again
+
+    def __repr__(self) -> str:
+        """repr."""
+        outcome = f"error={self.error!r}" if self.error else "ok"
+        return f"PollUpdate({self.api.product_id}, {self.endpoint}, {outcome})"
+
+    @property
+    def ok(self) -> bool:
+        """True if the request did not raise."""
+        return self.error is None
+
+
+class ChairState:
+    """What the scheduler remembers about a chair between polls."""
+
+    __slots__ = ("interval", "results")
+
+    def __init__(self, interval: float) -> None:
+        """Initialize."""
+        self.interval = interval
+        self.results = {}  # endpoint -> last result
+
+
+class PollScheduler:
+    """Polls endpoints for many chairs in the background.
+
+    The first poll of each chair is given its own slot in the interval so
+    that the requests are spread out instead of all made at once, and every
+    interval is jittered so that they do not drift back together.
+
+    The interval adapts per chair: it is `min_interval` while the chair is
+    charging or its position is changing, it doubles up to `max_interval`
+    while nothing changes, and it is `interval` otherwise. The responses are
+    cached, so `min_interval` is raised to the shortest cache TTL of the
+    endpoints, and a poll that only gets cached responses keeps the interval.
+    """
+
+    jitter = 0.1  # fraction of the interval
+
+    def __init__(
+        self,
+        apis: list,
+        endpoints: tuple = (ENDPOINT_BATTERY_INFO, ENDPOINT_PRODUCTS_POSITIONS),
+        interval: float = 60,
+        min_interval: float = 15,
+        max_interval: float = 600,
+        rng: random.Random = None,
+    ) -> None:
+        """Initialize."""
+        if not 0 < min_interval <= interval <= max_interval:
+            raise MyPermobilClientException(
+                "Intervals must be 0 < min_interval <= interval <= max_interval"
+            )
+        self.apis = list(apis)
+        self.endpoints = tuple(endpoints)
+        self.interval = interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rng = rng if rng is not None else random.Random()
+        self.states = {}
+        self.tasks = []
+        self.callbacks = []
+        self.queues = []
+
+    @property
+    def running(self) -> bool:
+        """True if the scheduler has been started and not stopped."""
+        return bool(self.tasks)
+
+    def subscribe(self, callback):
+        """Call `callback(update)` for every PollUpdate.
+
+        The callback may be a coroutine function. Returns a function that
+        unsubscribes the callback.
+        """
+        self.callbacks.append(callback)
+        return lambda: self.callbacks.remove(callback)
+
+    async def updates(self):
+        """Async iterator of every PollUpdate from now on."""
+        queue = asyncio.Queue()
+        self.queues.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.queues.remove(queue)
+
+    def start(self):
+        """Start polling every chair."""
+        if self.running:
+            raise MyPermobilClientException("Scheduler already running")
+        count = len(self.apis)
+        for index, api in enumerate(self.apis):
+            # spread the first polls evenly over the interval
+            offset = self.interval * index / count
+            offset += self.rng.uniform(0, self.jitter * self.interval / count)
+            self.tasks.append(asyncio.ensure_future(self._poll_loop(api, offset)))
+
+    async def stop(self):
+        """Stop polling and wait for the polls in progress to be cancelled."""
+        tasks, self.tasks = self.tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def shortest_interval(self, api: MyPermobil) -> float:
+        """min_interval, or the shortest cache TTL of the endpoints if longer.
+
+        Polling more often than that only gets cached responses.
+        """
+        ttl = min((api.cache_ttl(endpoint) for endpoint in self.endpoints), default=0)
+        return min(self.max_interval, max(self.min_interval, ttl))
+
+    def next_interval(self, state: ChairState, updates: list) -> float:
+        """Seconds until the chair should be polled again."""
+        results = {update.endpoint: update.result for update in updates if update.ok}
+        # the cache returns the same object until the response is refreshed,
+        # a cached response says nothing about whether the chair is idle
+        refreshed = {
+            endpoint: result
+            for endpoint, result in results.items()
+            if result is not state.results.get(endpoint)
+        }
+        changed = any(
+            state.results.get(endpoint) != result
+            for endpoint, result in refreshed.items()
+        )
+        min_interval = (
+            self.shortest_interval(updates[0].api) if updates else self.min_interval
+        )
+
+        battery = results.get(ENDPOINT_BATTERY_INFO)
+        position = refreshed.get(ENDPOINT_PRODUCTS_POSITIONS)
+        previous = state.results.get(ENDPOINT_PRODUCTS_POSITIONS)
+        if battery is not None and get_or_none(CHARGING, battery):
+            interval = min_interval
+        elif (
+            position is not None
+            and previous is not None
+            and get_or_none(CURRENT_POSITION, position)
+            != get_or_none(CURRENT_POSITION, previous)
+        ):
+            interval = min_interval
+        elif changed or not results:
+            interval = self.interval
+        elif len(refreshed) < len(results):
+            # some responses were cached, poll again as planned
+            interval = state.interval
+        else:
+            # the chair is idle, back off
+            interval = min(self.max_interval, max(state.interval, self.interval) * 2)
+
+        state.results.update(results)
+        state.interval = interval
+        return interval
+
+    async def poll(self, api: MyPermobil) -> list:
+        """Poll every endpoint for one chair and publish the updates."""
+        state = self.states.setdefault(id(api), ChairState(self.interval))
+        results = await asyncio.gather(
+            *(api.request_endpoint(endpoint) for endpoint in self.endpoints),
+            return_exceptions=True,
+        )
+        updates = []
+        for endpoint, result in zip(self.endpoints, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result
+            if isinstance(result, Exception):
+                updates.append(PollUpdate(api, endpoint, error=result))
+            else:
+                updates.append(PollUpdate(api, endpoint, result=result))
+
+        interval = self.next_interval(state, updates)
+        for update in updates:
+            update.interval = interval
+            await self.publish(update)
+        return updates
+
+    async def publish(self, update: PollUpdate):
+        """Send an update to every subscriber."""
+        for queue in self.queues:
+            queue.put_nowait(update)
+        for callback in list(self.callbacks):
+            try:
+                res = callback(update)
+                if inspect.isawaitable(res):
+                    await res
+            except Exception:  # pylint: disable=broad-except
+                # a failing subscriber must not stop the polling
+                pass
+
+    async def _poll_loop(self, api: MyPermobil, offset: float):
+        """Poll a chair until the scheduler is stopped."""
+        await asyncio.sleep(offset)
+        while True:
+            updates = await self.poll(api)
+            interval = updates[0].interval if updates else self.interval
+            jitter = self.rng.uniform(-self.jitter, self.jitter) * interval
+            await asyncio.sleep(interval + jitter)
@@ -0,0 +1,207 @@
+"""HTTP session and connection pool for the Permobil API."""
+
+import json
+import weakref
+
+import aiohttp
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None
+
+try:
+    from aiohttp.compression_utils import HAS_BROTLI
+except ImportError:  # pragma: no cover
+    HAS_BROTLI = False
+
+from .exceptions import MyPermobilClientException
+
+# the encodings aiohttp can decompress, brotli needs the brotli package
+CONTENT_ENCODINGS = "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+# raised by the decoders for a body that is not valid JSON
+DECODE_ERRORS = (ValueError,)
+if msgspec is not None:
+    DECODE_ERRORS += (msgspec.DecodeError,)
+
+
+def json_decoder(name: str = "auto"):
+    """The function that decodes a JSON body for a decoder name.
+
+    "json" is the standard library, "orjson" and "msgspec" need those
+    packages to be installed and "auto" is the fastest one that is.
+    """
+    decoders = {"json": json.loads}
+    if msgspec is not None:
+        decoders["msgspec"] = msgspec.json.decode
+    if orjson is not None:
+        decoders["orjson"] = orjson.loads
+    if name == "auto":
+        name = next(n for n in ("orjson", "msgspec", "json") if n in decoders)
+    if name not in decoders:
+        raise MyPermobilClientException(f"JSON decoder not available: {name}")
+    return decoders[name]
+
+
+class ConnectionPoolProfile:
+    """Connection pool settings for create_session.
+
+    The defaults are meant for polling many chairs: connections are kept
+    alive between polls so that they are reused instead of paying for a new
+    TCP and TLS handshake, and DNS lookups of the region hosts are cached.
+    """
+
+    def __init__(
+        self,
+        limit: int = 200,
+        limit_per_host: int = 50,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 60,
+    ) -> None:
+        """Initialize."""
+        if limit < 0 or limit_per_host < 0:
+            raise MyPermobilClientException("Connection limits cannot be negative")
+        self.limit = limit  # 0 for no limit
+        self.limit_per_host = limit_per_host  # 0 for no limit
+        self.ttl_dns_cache = ttl_dns_cache  # None to cache forever
+        self.keepalive_timeout = keepalive_timeout
+
+    def create_connector(self) -> aiohttp.TCPConnector:
+        """Create a connector with the profile settings."""
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.ttl_dns_cache,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive_timeout,
+        )
+
+
+class ConnectionStats:
+    """Counters of the connections used by a session."""
+
+    def __init__(self) -> None:
+        """Initialize."""
+        self.opened = 0  # new connections
+        self.reused = 0  # connections taken from the pool
+        self.queued = 0  # requests that waited for a free connection
+        self.responses = 0  # responses received
+        # the responses that may still hold a connection
+        self._responses = weakref.WeakSet()
+
+    @property
+    def unreleased(self) -> int:
+        """Responses that still hold a connection.
+
+        aiohttp drops the connection of a response once it is read in full
+        or released, so this should be 0 whenever no request is in flight,
+        anything else is a leak.
+        """
+        held = [resp for resp in self._responses if resp.connection is not None]
+        if len(held) < len(self._responses):
+            self._responses = weakref.WeakSet(held)
+        return len(held)
+
+    @property
+    def stats(self) -> dict:
+        """Counters as a dict."""
+        return {
+            "opened": self.opened,
+            "reused": self.reused,
+            "queued": self.queued,
+            "responses": self.responses,
+            "unreleased": self.unreleased,
+        }
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Create a trace config that updates the counters."""
+
+        async def on_create(session, context, params):
+            self.opened += 1
+
+        async def on_reuse(session, context, params):
+            self.reused += 1
+
+        async def on_queued(session, context, params):
+            self.queued += 1
+
+        async def on_response(session, context, params):
+            self.responses += 1
+            self._responses.add(params.response)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_create)
+        trace_config.on_connection_reuseconn.append(on_reuse)
+        trace_config.on_connection_queued_start.append(on_queued)
+        trace_config.on_request_end.append(on_response)
+        return trace_config
+
+
+class MyPermobilResponse:
+    """A response that has been read in full and released to the pool.
+
+    It has the same status, headers, json() and text() as the aiohttp
+    response it was read from.
+    """
+
+    __slots__ = ("status", "headers", "body", "request_info")
+
+    def __init__(
+        self, status: int, headers: dict, body: bytes, request_info=None
+    ) -> None:
+        """Initialize."""
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.request_info = request_info
+
+    def __repr__(self) -> str:
+        """repr."""
+        return f"MyPermobilResponse({self.status}, {len(self.body)} bytes)"
+
+    @classmethod
+    async def read(cls, response: aiohttp.ClientResponse):
+        """Read an aiohttp response and release its connection."""
+        async with response:
+            body = await response.read()
+        return cls(response.status, response.headers, body, response.request_info)
+
+    async def text(self) -> str:
+        """The body as a string."""
+        return self.body.decode("utf-8", errors="replace")
+
+    async def json(self, loads=json.loads):
+        """The body decoded as JSON with `loads`, None if the body is empty."""
+        content_type = self.headers.get("Content-Type", "")
+        if "json" not in content_type.lower():
+            raise aiohttp.ContentTypeError(
+                self.request_info,
+                (),
+                status=self.status,
+                message=f"Unexpected mimetype: {content_type}",
+                headers=self.headers,
+            )
+        if not self.body.strip():
+            return None
+        return loads(self.body)
+
+
+async def create_session(
+    profile: ConnectionPoolProfile = None, stats: ConnectionStats = None
+) -> aiohttp.ClientSession:
+    """Create a client session.
+
+    Without a profile the default ConnectionPoolProfile is used. If `stats`
+    is given its counters are updated by the session.
+    """
+    if profile is None:
+        profile = ConnectionPoolProfile()
+    kwargs = {"connector": profile.create_connector()}
+    if stats is not None:
+        kwargs["trace_configs"] = [stats.trace_config()]
+    return aiohttp.ClientSession(**kwargs)
@@ -0,0 +1,199 @@
+"""Incremental decoding of large JSON responses."""
+
+import codecs
+import json
+import re
+
+from .exceptions import MyPermobilAPIException, MyPermobilClientException
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+KEY = re.compile(r'("(?:[^"\\]|\\.)*")[ \t\n\r]*:', re.S)
+DECODER = json.JSONDecoder()
+OPEN_VALUE = set("{[\"")
+DELIMITERS = set(" \t\n\r,]}")
+
+
+def invalid_response() -> MyPermobilAPIException:
+    """The exception for a document that is not valid JSON."""
+    return MyPermobilAPIException("Invalid formatted server response")
+
+
+class JSONStream:
+    """Decodes the value at `path` of a JSON document fed in chunks.
+
+    If the value is an array, its elements are returned one at a time as
+    they are complete, otherwise the value is returned once. Values outside
+    the path are decoded one at a time and dropped, so only the largest
+    single value has to be kept in memory and not the whole document.
+    `path` is a list of object keys and array indexes, like an item.
+    """
+
+    def __init__(self, path=()) -> None:
+        """Initialize."""
+        self.path = tuple(path)
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.depth = 0  # steps of the path that have been entered
+        self.mode = "value"
+        self.index = 0  # index of the next element while entering an array
+        self.need_comma = False  # None right after a comma
+        self.wait_for = 0  # buffer length before a value is decoded again
+        self.count = 0  # values returned
+
+    @property
+    def done(self) -> bool:
+        """True once the value at the path has been returned."""
+        return self.mode == "done"
+
+    def feed(self, data: bytes) -> list:
+        """Add a chunk, returns the values that were completed by it."""
+        self.buffer += self.text.decode(data)
+        return self._parse(eof=False)
+
+    def close(self) -> list:
+        """End of the document, returns the last values."""
+        self.buffer += self.text.decode(b"", final=True)
+        values = self._parse(eof=True)
+        if not self.done:
+            raise invalid_response()
+        return values
+
+    def _decode(self, pos: int, eof: bool):
+        """Decode the value at pos, None if it is not complete yet."""
+        if not eof and len(self.buffer) < self.wait_for:
+            return None
+        try:
+            value, end = DECODER.raw_decode(self.buffer, pos)
+        except json.JSONDecodeError as err:
+            if eof:
+                raise invalid_response() from err
+            # try again when the buffer has doubled so that a large value is
+            # not decoded from the start for every chunk
+            self.wait_for = pos + 2 * (len(self.buffer) - pos)
+            return None
+        if (
+            not eof
+            and self.buffer[pos] not in OPEN_VALUE
+            and (end == len(self.buffer) or self.buffer[end] not in DELIMITERS)
+        ):
+            return None  # the number or literal may not be complete
+        self.wait_for = 0
+        return value, end
+
+    def _not_found(self):
+        """Raise for a path that is not in the document."""
+        step = self.path[self.depth]
+        raise MyPermobilClientException(f"{step} not in response")
+
+    def _parse(self, eof: bool) -> list:
+        """Consume as much of the buffer as possible."""
+        values = []
+        buffer = self.buffer
+        pos = 0
+        while self.mode != "done":
+            pos = WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+
+            if self.mode == "value":
+                if self.depth == len(self.path):
+                    if char == "[":
+                        self.mode = "elements"
+                        self.need_comma = False
+                        pos += 1
+                        continue
+                    decoded = self._decode(pos, eof)
+                    if decoded is None:
+                        break
+                    values.append(decoded[0])
+                    pos = decoded[1]
+                    self.mode = "done"
+                elif char == "{" and isinstance(self.path[self.depth], str):
+                    self.mode = "keys"
+                    self.need_comma = False
+                    pos += 1
+                elif char == "[" and isinstance(self.path[self.depth], int):
+                    self.mode = "indexes"
+                    self.index = 0
+                    self.need_comma = False
+                    pos += 1
+                else:
+                    self._not_found()
+                continue
+
+            if char in "]}":
+                if self.need_comma is None:
+                    raise invalid_response()  # a comma before the end
+                if self.mode == "elements" and char == "]":
+                    self.mode = "done"
+                    pos += 1
+                    continue
+                if self.mode in ("keys", "indexes"):
+                    self._not_found()
+                raise invalid_response()
+            if self.need_comma:
+                if char != ",":
+                    raise invalid_response()
+                self.need_comma = None  # a value must follow
+                pos += 1
+                continue
+
+            if self.mode == "keys":
+                # a key and its value, the value is entered or skipped
+                match = KEY.match(buffer, pos)
+                if match is None:
+                    if eof or char != '"':
+                        raise invalid_response()
+                    break
+                key = json.loads(match.group(1))
+                if key == self.path[self.depth]:
+                    self.depth += 1
+                    self.mode = "value"
+                    pos = match.end()
+                    continue
+                start = WHITESPACE.match(buffer, match.end()).end()
+                if start >= len(buffer):
+                    break
+                decoded = self._decode(start, eof)
+                if decoded is None:
+                    break
+                pos = decoded[1]
+                self.need_comma = True
+            elif self.mode == "indexes":
+                if self.index == self.path[self.depth]:
+                    self.depth += 1
+                    self.mode = "value"
+                    continue
+                decoded = self._decode(pos, eof)
+                if decoded is None:
+                    break
+                pos = decoded[1]
+                self.index += 1
+                self.need_comma = True
+            else:  # elements
+                decoded = self._decode(pos, eof)
+                if decoded is None:
+                    break
+                values.append(decoded[0])
+                pos = decoded[1]
+                self.need_comma = True
+
+        # the rest of the document after the value is not needed
+        self.buffer = "" if self.mode == "done" else buffer[pos:]
+        if self.wait_for:
+            self.wait_for -= pos
+        self.count += len(values)
+        return values
+
+
+async def iter_json(chunks, path=()):
+    """Async iterator of the values at `path` of a document read in chunks."""
+    stream = JSONStream(path)
+    async for chunk in chunks:
+        for value in stream.feed(chunk):
+            yield value
+        if stream.done:
+            return
+    for value in stream.close():
+        yield value
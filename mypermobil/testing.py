@@ -0,0 +1,395 @@
+"""A fake Permobil API to test against without network.
+
+The server emulates the regions service, the authentication flow and the
+endpoints of ITEM_LOOKUP of a region. Faults and latencies can be set per
+endpoint and are deterministic, so that retries, rate limits, timeouts and
+coalescing can be tested reliably.
+
+    async with FakePermobilServer() as server:
+        api = server.client(session)
+        server.inject(ENDPOINT_BATTERY_INFO, status=500, times=2)
+        await api.get_battery_info()
+"""
+
+import asyncio
+import datetime
+import hashlib
+import json
+import random
+from urllib.parse import urlparse
+
+from aiohttp import web
+from yarl import URL
+
+from .const import (
+    ENDPOINT_APPLICATIONAUTHENTICATIONS,
+    ENDPOINT_APPLICATIONLINKS,
+    ENDPOINT_PRODUCTS,
+    ETAG,
+    GET_REGIONS,
+    IF_NONE_MATCH,
+    ITEM_LOOKUP,
+)
+from .exceptions import MyPermobilClientException
+from .mypermobil import MyPermobil
+
+REGIONS_PATH = urlparse(GET_REGIONS).path
+BOOLEAN_ITEMS = ("charging", "chargingNow", "unknown")
+STRING_ITEMS = ("Unit", "Date", "Timestamp", "At", "_id", "Model")
+
+
+def fake_value(key: str):
+    """A plausible value for an item."""
+    if key.endswith(STRING_ITEMS):
+        return f"{key}-2024-01-01T12:00:00.000Z"
+    if key in BOOLEAN_ITEMS:
+        return False
+    return 42.5
+
+
+def fake_position(i: int) -> dict:
+    """A previous position like the positions endpoint returns."""
+    return {
+        "latitude": 59.3293 + i * 1e-5,
+        "longitude": 18.0686 - i * 1e-5,
+        "timestamp": f"2024-01-01T12:{i // 60 % 60:02}:{i % 60:02}.000Z",
+    }
+
+
+def fake_payload(endpoint: str, positions: int = 100):
+    """A response of an endpoint in ITEM_LOOKUP that has all its items."""
+    items = ITEM_LOOKUP[endpoint]
+    root = [] if isinstance(items[0][0], int) else {}
+    # the longest items first, so that an item that holds other items is a dict
+    for item in sorted(items, key=len, reverse=True):
+        node = root
+        for step in item[:-1]:
+            if isinstance(step, int):
+                while len(node) <= step:
+                    node.append({})
+                node = node[step]
+            else:
+                node = node.setdefault(step, {})
+        node.setdefault(item[-1], fake_value(item[-1]))
+    if isinstance(root, dict) and "previousPositions" in root:
+        root["currentPosition"] = fake_position(0)
+        root["previousPositions"] = [fake_position(i) for i in range(positions)]
+    return root
+
+
+def error(status: int, message: str) -> web.Response:
+    """An error response like the API returns."""
+    return web.json_response({"error": message}, status=status)
+
+
+class Fault:
+    """A fault injected into the responses of an endpoint.
+
+    The response is delayed by `delay` seconds, then the connection is
+    dropped if `disconnect` is set, or else the response is replaced by
+    `status` with `body` and `headers` if a status is set. The fault applies
+    to the next `times` requests, or to all of them if `times` is None.
+    aiohttp sends a GET again once when its connection is dropped, so the
+    client only sees a disconnect that applies to two requests.
+    """
+
+    __slots__ = ("status", "body", "headers", "delay", "disconnect", "times")
+
+    def __init__(
+        self,
+        status: int = None,
+        body=None,
+        headers: dict = None,
+        delay: float = 0,
+        disconnect: bool = False,
+        times: int = None,
+    ) -> None:
+        """Initialize."""
+        if times is not None and times < 1:
+            raise MyPermobilClientException("A fault must apply at least once")
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.delay = delay
+        self.disconnect = disconnect
+        self.times = times
+
+    @property
+    def active(self) -> bool:
+        """True while the fault applies to more requests."""
+        return self.times is None or self.times > 0
+
+
+class FakeUser:
+    """An account of the fake server, with one product."""
+
+    __slots__ = ("email", "product_id", "code", "token", "eula")
+
+    def __init__(self, email: str, product_id: str, eula: bool = True) -> None:
+        """Initialize."""
+        self.email = email
+        self.product_id = product_id
+        self.code = None  # the code sent by the last application link
+        self.token = None
+        self.eula = eula  # False to answer authentications with 430
+
+
+class FakePermobilServer:
+    """Local aiohttp server that behaves like the regions service and a
+    region, with one user per email.
+
+    Every response is delayed by `latency`, or the latency of its endpoint
+    in `latencies`. A latency is seconds or a (low, high) range. A
+    `error_rate` fraction of the responses to the endpoints of ITEM_LOOKUP
+    are 500 errors. The ranges and the errors are drawn from a generator
+    seeded with `seed`. Responses have `positions` previous positions and
+    with `etags`, an ETag to revalidate them with.
+    """
+
+    def __init__(
+        self,
+        latency=0,
+        latencies: dict = None,
+        error_rate: float = 0,
+        positions: int = 100,
+        etags: bool = False,
+        seed: int = 0,
+    ) -> None:
+        """Initialize."""
+        self.latency = latency
+        self.latencies = latencies or {}  # endpoint -> latency
+        self.error_rate = error_rate
+        self.positions = positions
+        self.etags = etags
+        self.random = random.Random(seed)
+        self.users = {}  # email -> FakeUser
+        self.tokens = {}  # token -> FakeUser
+        self.faults = {}  # endpoint -> [Fault]
+        self.requests = {}  # endpoint -> requests received
+        self.errors = 0  # responses with a random error
+        self.url = None
+        self._responses = {}  # endpoint -> (body, etag)
+        self._runner = None
+
+    async def __aenter__(self):
+        """Start the server."""
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        """Stop the server."""
+        await self.close()
+
+    @property
+    def regions_url(self) -> str:
+        """The url to use as MyPermobil.regions_url."""
+        return str(self.url) + GET_REGIONS[GET_REGIONS.index(REGIONS_PATH) :]
+
+    def add_user(
+        self, email: str, product_id: str = None, eula: bool = True
+    ) -> FakeUser:
+        """Add an account that can authenticate."""
+        if product_id is None:
+            product_id = f"{len(self.users) + 1:024x}"
+        user = self.users[email] = FakeUser(email, product_id, eula)
+        return user
+
+    def issue_token(self, user: FakeUser) -> str:
+        """Give the user a new token."""
+        seed = f"{user.email}:{len(self.tokens)}".encode()
+        user.token = hashlib.sha256(seed).hexdigest() * 4
+        self.tokens[user.token] = user
+        return user.token
+
+    def client(self, session, email: str = None, **kwargs) -> MyPermobil:
+        """An authenticated client of a user, added if it does not exist."""
+        if email is None:
+            email = f"user{len(self.users) + 1}@example.com"
+        user = self.users.get(email) or self.add_user(email)
+        expiration = datetime.date.today() + datetime.timedelta(days=365)
+        api = MyPermobil(
+            "fake",
+            session,
+            email=email,
+            region=str(self.url),
+            token=user.token or self.issue_token(user),
+            expiration_date=expiration.isoformat(),
+            product_id=user.product_id,
+            **kwargs,
+        )
+        api.regions_url = self.regions_url
+        api.self_authenticate()
+        return api
+
+    def inject(self, endpoint: str, **kwargs) -> Fault:
+        """Inject a fault into the responses of an endpoint, see Fault."""
+        fault = Fault(**kwargs)
+        self.faults.setdefault(endpoint, []).append(fault)
+        return fault
+
+    def clear_faults(self):
+        """Remove all the faults."""
+        self.faults.clear()
+
+    def set_response(self, endpoint: str, payload):
+        """Answer an endpoint with a payload instead of the fake one."""
+        body = json.dumps(payload).encode()
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        self._responses[endpoint] = (body, etag)
+
+    def response(self, endpoint: str) -> tuple:
+        """The encoded response of an endpoint and its ETag."""
+        if endpoint not in self._responses:
+            self.set_response(endpoint, fake_payload(endpoint, self.positions))
+        return self._responses[endpoint]
+
+    def regions(self) -> list:
+        """The regions, with one production region that is this server."""
+        return [
+            {
+                "_id": "fake",
+                "name": "Fake",
+                "host": f"{self.url.host}:{self.url.port}",
+                "backendPort": self.url.port,
+                "serverType": "Production",
+                "flag": "",
+            }
+        ]
+
+    def _fault(self, endpoint: str) -> Fault:
+        """The fault that applies to a request, None if there is none."""
+        for fault in self.faults.get(endpoint, ()):
+            if fault.active:
+                if fault.times is not None:
+                    fault.times -= 1
+                return fault
+        return None
+
+    def _latency(self, endpoint: str) -> float:
+        """Seconds to delay a response."""
+        latency = self.latencies.get(endpoint, self.latency)
+        if isinstance(latency, (tuple, list)):
+            return self.random.uniform(*latency)
+        return latency
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        """Answer any request, with the faults of its endpoint."""
+        endpoint = request.match_info.route.resource.canonical
+        if endpoint == REGIONS_PATH:
+            endpoint = GET_REGIONS
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+        fault = self._fault(endpoint)
+        delay = self._latency(endpoint) + (fault.delay if fault else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        if fault is not None and fault.disconnect:
+            request.transport.close()
+            return web.Response()
+        if fault is not None and fault.status is not None:
+            if isinstance(fault.body, (dict, list)):
+                return web.json_response(
+                    fault.body, status=fault.status, headers=fault.headers
+                )
+            return web.Response(
+                text=fault.body or "", status=fault.status, headers=fault.headers
+            )
+
+        if endpoint == GET_REGIONS:
+            return web.json_response(self.regions())
+        if endpoint == ENDPOINT_APPLICATIONLINKS:
+            return await self._application_link(request)
+        if endpoint == ENDPOINT_APPLICATIONAUTHENTICATIONS:
+            return await self._application_authentication(request)
+        return self._endpoint(request, endpoint)
+
+    async def _application_link(self, request: web.Request) -> web.Response:
+        """Send a code to a user, or unlink the token of the request."""
+        if request.method == "DELETE":
+            user = self._user(request)
+            if user is None:
+                return error(401, "Unauthorized")
+            self.tokens.pop(user.token, None)
+            user.token = None
+            return web.Response(status=204)
+        data = await request.json()
+        user = self.users.get(data.get("username"))
+        if user is None:
+            return error(401, "Email not registered for region")
+        user.code = f"{self.random.randrange(10**6):06}"
+        return web.Response(status=204)
+
+    async def _application_authentication(self, request: web.Request):
+        """Exchange the code of a user for a token."""
+        data = await request.json()
+        user = self.users.get(data.get("username"))
+        if user is None:
+            return error(401, "Email not registered for region")
+        if user.code is None or data.get("code") != user.code:
+            return error(403, "Incorrect code")
+        if not user.eula:
+            return error(430, "Please accept the EULA")
+        user.code = None
+        return web.json_response({"token": self.issue_token(user)})
+
+    def _user(self, request: web.Request) -> FakeUser:
+        """The user of the bearer token of a request, None if it has none."""
+        authorization = request.headers.get("Authorization", "")
+        return self.tokens.get(authorization.removeprefix("Bearer "))
+
+    def _endpoint(self, request: web.Request, endpoint: str) -> web.Response:
+        """Answer an endpoint of ITEM_LOOKUP for the user of the request."""
+        user = self._user(request)
+        if user is None:
+            return error(401, "Unauthorized")
+        product_id = request.match_info.get("product_id", user.product_id)
+        if product_id != user.product_id:
+            return error(404, "Product not found")
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            return error(500, "Internal server error")
+        if endpoint == ENDPOINT_PRODUCTS:
+            return web.json_response([{"_id": user.product_id, "Model": "M3"}])
+
+        body, etag = self.response(endpoint)
+        if not self.etags:
+            return web.Response(body=body, content_type="application/json")
+        if request.headers.get(IF_NONE_MATCH) == etag:
+            return web.Response(status=304, headers={ETAG: etag})
+        return web.Response(
+            body=body, content_type="application/json", headers={ETAG: etag}
+        )
+
+    def application(self) -> web.Application:
+        """The routes, the fixed paths before the ones with a product id."""
+        app = web.Application()
+        app.router.add_get(REGIONS_PATH, self._handle)
+        app.router.add_post(ENDPOINT_APPLICATIONLINKS, self._handle)
+        app.router.add_delete(ENDPOINT_APPLICATIONLINKS, self._handle)
+        app.router.add_post(ENDPOINT_APPLICATIONAUTHENTICATIONS, self._handle)
+        for endpoint in sorted(ITEM_LOOKUP, key=lambda path: "{" in path):
+            app.router.add_get(endpoint, self._handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start the server, returns its url."""
+        if self._runner is not None:
+            raise MyPermobilClientException("Server already started")
+        # slow responses are cancelled when the client gives up on them
+        self._runner = web.AppRunner(
+            self.application(),
+            access_log=None,
+            handler_cancellation=True,
+            shutdown_timeout=0,
+        )
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        port = self._runner.addresses[0][1]
+        self.url = URL.build(scheme="http", host=host, port=port)
+        return str(self.url)
+
+    async def close(self):
+        """Stop the server."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,390 @@
+"""Compact local store of the history of numeric items."""
+
+import bisect
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+
+from .const import (
+    BATTERY_AMPERE_HOURS_LEFT,
+    BATTERY_DISTANCE_LEFT,
+    BATTERY_INDOOR_DRIVE_TIME,
+    BATTERY_STATE_OF_CHARGE,
+    BATTERY_STATE_OF_HEALTH,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_DAILY_USAGE,
+    USAGE_DISTANCE,
+)
+from .exceptions import MyPermobilClientException
+from .items import ItemPath
+
+# the numeric items that are stored by default
+SERIES_ITEMS = {
+    ENDPOINT_BATTERY_INFO: [
+        BATTERY_STATE_OF_CHARGE,
+        BATTERY_STATE_OF_HEALTH,
+        BATTERY_AMPERE_HOURS_LEFT,
+        BATTERY_DISTANCE_LEFT,
+        BATTERY_INDOOR_DRIVE_TIME,
+    ],
+    ENDPOINT_DAILY_USAGE: [
+        USAGE_DISTANCE,
+    ],
+}
+
+TIME_TYPE = "d"  # seconds since the epoch
+VALUE_TYPE = "f"  # float32 is precise enough for the items and half the size
+# magic, number of samples and bytes of the column names that follow
+CHUNK_HEADER = struct.Struct("<4sII")
+CHUNK_MAGIC = b"MPTS"
+ACTIVE_MAGIC = b"MPTA"
+NAN = float("nan")
+
+
+def item_name(item) -> str:
+    """The column name of an item."""
+    return "/".join(str(step) for step in item)
+
+
+def to_float(value) -> float:
+    """A value as a float, NaN if it is not a number."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return NAN
+    return float(value)
+
+
+def pack_header(magic: bytes, count: int, names: list) -> bytes:
+    """The header of a file, with the names of its columns."""
+    data = "\n".join(names).encode()
+    return CHUNK_HEADER.pack(magic, count, len(data)) + data
+
+
+def read_header(file, path: str, magic: bytes, names: list) -> int:
+    """Check the header of a file, returns the number of samples."""
+    header = file.read(CHUNK_HEADER.size)
+    if len(header) < CHUNK_HEADER.size:
+        raise MyPermobilClientException(f"Not a time series chunk: {path}")
+    found, count, size = CHUNK_HEADER.unpack(header)
+    if found != magic:
+        raise MyPermobilClientException(f"Not a time series chunk: {path}")
+    stored = file.read(size).decode().split("\n") if size else []
+    if stored != list(names):
+        raise MyPermobilClientException(
+            f"The columns of {path} are {stored}, expected {list(names)}"
+        )
+    return count
+
+
+class Chunk:
+    """Samples of a time range, in memory or in an append-only file."""
+
+    __slots__ = ("first", "last", "count", "path", "times", "columns")
+
+    def __init__(self, times: array, columns: list, path: str = None) -> None:
+        """Initialize."""
+        self.first = times[0]
+        self.last = times[-1]
+        self.count = len(times)
+        self.path = path
+        # only chunks that are not in a file are kept in memory
+        self.times = None if path else times
+        self.columns = None if path else columns
+
+    @staticmethod
+    def write(path: str, names: list, times: array, columns: list):
+        """Write the samples to a new file, columns one after the other.
+
+        The file is replaced at once, so it is never half written.
+        """
+        temp = f"{path}.tmp"
+        with open(temp, "wb") as file:
+            file.write(pack_header(CHUNK_MAGIC, len(times), names))
+            for data in (times, *columns):
+                if sys.byteorder != "little":
+                    data = array(data.typecode, data)
+                    data.byteswap()
+                data.tofile(file)
+        os.replace(temp, path)
+
+    @classmethod
+    def open(cls, path: str, names: list) -> "Chunk":
+        """Open a file written by `write`, only the times are kept."""
+        times, _ = cls.read_file(path, names, times_only=True)
+        return cls(times, None, path)
+
+    @staticmethod
+    def read_file(path: str, names: list, times_only: bool = False) -> tuple:
+        """Read the times and columns of a file with the columns `names`."""
+        with open(path, "rb") as file:
+            count = read_header(file, path, CHUNK_MAGIC, names)
+            typecodes = [TIME_TYPE] + [VALUE_TYPE] * (0 if times_only else len(names))
+            arrays = []
+            for typecode in typecodes:
+                data = array(typecode)
+                data.fromfile(file, count)
+                if sys.byteorder != "little":
+                    data.byteswap()
+                arrays.append(data)
+        return arrays[0], arrays[1:]
+
+    def read(self, names: list) -> tuple:
+        """The times and columns of the chunk."""
+        if self.path is None:
+            return self.times, self.columns
+        return self.read_file(self.path, names)
+
+
+class TimeSeries:
+    """The history of numeric items of one chair.
+
+    Every item is a column in an array. Samples are appended in time order
+    to an active chunk, which is sealed when it holds `chunk_size` samples.
+    With a directory, sealed chunks are written to files that are never
+    changed again and only read back when a query needs them, so only the
+    active chunk is kept in memory. Every sample of the active chunk is also
+    appended to an `.active` file as a row, so it survives a restart without
+    a flush; the file is removed once the chunk is sealed.
+    """
+
+    def __init__(self, items: list, path: str = None, chunk_size: int = 1440) -> None:
+        """Initialize."""
+        if chunk_size < 1:
+            raise MyPermobilClientException("Chunk size must be at least 1")
+        self.items = [ItemPath(item, None) for item in items]
+        self.names = [item_name(item) for item in items]
+        self.path = path
+        self.chunk_size = chunk_size
+        self.chunks = []
+        self.times = array(TIME_TYPE)
+        self.columns = [array(VALUE_TYPE) for _ in self.items]
+        self.row = struct.Struct("<" + TIME_TYPE + VALUE_TYPE * len(self.items))
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            names = sorted(os.listdir(path))
+            for name in names:
+                if name.endswith(".chunk"):
+                    chunk = Chunk.open(os.path.join(path, name), self.names)
+                    self.chunks.append(chunk)
+            for name in names:
+                if name.endswith(".active"):
+                    if name == os.path.basename(self.active_path):
+                        self.load_active()
+                    else:
+                        # sealed before the process stopped
+                        os.remove(os.path.join(path, name))
+
+    def __len__(self) -> int:
+        """Number of samples."""
+        return len(self.times) + sum(chunk.count for chunk in self.chunks)
+
+    @property
+    def active_path(self) -> str:
+        """The file of the samples of the active chunk."""
+        return os.path.join(self.path, f"{len(self.chunks):08d}.active")
+
+    def load_active(self):
+        """Load the samples of the active chunk from its file."""
+        path = self.active_path
+        with open(path, "r+b") as file:
+            read_header(file, path, ACTIVE_MAGIC, self.names)
+            start = file.tell()
+            data = file.read()
+            size = len(data) - len(data) % self.row.size
+            if size < len(data):
+                # the last row was not completely written
+                file.truncate(start + size)
+        for values in self.row.iter_unpack(data[:size]):
+            self.times.append(values[0])
+            for column, value in zip(self.columns, values[1:]):
+                column.append(value)
+
+    def write_active(self):
+        """Append the last sample to the file of the active chunk."""
+        first = len(self.times) == 1
+        values = [column[-1] for column in self.columns]
+        with open(self.active_path, "wb" if first else "ab") as file:
+            if first:
+                file.write(pack_header(ACTIVE_MAGIC, 0, self.names))
+            file.write(self.row.pack(self.times[-1], *values))
+
+    @property
+    def last_time(self) -> float:
+        """Time of the last sample, None if there are no samples."""
+        if self.times:
+            return self.times[-1]
+        if self.chunks:
+            return self.chunks[-1].last
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of samples kept in memory."""
+        arrays = [self.times, *self.columns]
+        for chunk in self.chunks:
+            if chunk.path is None:
+                arrays += [chunk.times, *chunk.columns]
+        return sum(data.itemsize * len(data) for data in arrays)
+
+    def append(self, timestamp: float, values):
+        """Append a sample, a list of values or a response to get the items from."""
+        last = self.last_time
+        if last is not None and timestamp < last:
+            raise MyPermobilClientException("Samples must be appended in time order")
+        if isinstance(values, (list, tuple)):
+            if len(values) != len(self.items):
+                raise MyPermobilClientException(
+                    f"Expected {len(self.items)} values, got {len(values)}"
+                )
+        else:
+            response = values
+            values = []
+            for item in self.items:
+                try:
+                    values.append(item.get(response))
+                except MyPermobilClientException:
+                    values.append(None)
+        self.times.append(timestamp)
+        for column, value in zip(self.columns, values):
+            column.append(to_float(value))
+        if self.path is not None:
+            self.write_active()
+        if len(self.times) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Seal the active chunk, and write it if the series has a directory."""
+        if not self.times:
+            return
+        path = None
+        if self.path is not None:
+            active = self.active_path
+            path = os.path.join(self.path, f"{len(self.chunks):08d}.chunk")
+            Chunk.write(path, self.names, self.times, self.columns)
+            os.remove(active)
+        self.chunks.append(Chunk(self.times, self.columns, path))
+        self.times = array(TIME_TYPE)
+        self.columns = [array(VALUE_TYPE) for _ in self.items]
+
+    def range(self, start: float = None, end: float = None) -> tuple:
+        """Times and {name: values} of the samples with start <= time < end."""
+        start = -math.inf if start is None else start
+        end = math.inf if end is None else end
+        times = array(TIME_TYPE)
+        columns = [array(VALUE_TYPE) for _ in self.items]
+        parts = [
+            chunk.read(self.names)
+            for chunk in self.chunks
+            if chunk.last >= start and chunk.first < end
+        ]
+        if self.times and self.times[-1] >= start and self.times[0] < end:
+            parts.append((self.times, self.columns))
+        for part_times, part_columns in parts:
+            low = bisect.bisect_left(part_times, start)
+            high = bisect.bisect_left(part_times, end)
+            times.extend(part_times[low:high])
+            for column, part in zip(columns, part_columns):
+                column.extend(part[low:high])
+        return times, dict(zip(self.names, columns))
+
+    def downsample(
+        self, bucket: float, start: float = None, end: float = None, how: str = "mean"
+    ) -> tuple:
+        """Aggregate the samples into buckets of `bucket` seconds.
+
+        Returns the start times of the buckets and {name: values}, with the
+        mean, min, max or last of the values of each bucket that are not NaN.
+        """
+        if bucket <= 0:
+            raise MyPermobilClientException("Bucket must be positive")
+        if how not in ("mean", "min", "max", "last"):
+            raise MyPermobilClientException(f"Unknown aggregation: {how}")
+        times, columns = self.range(start, end)
+        bucket_times = array(TIME_TYPE)
+        bounds = []  # index of the first sample of each bucket
+        for index, timestamp in enumerate(times):
+            key = math.floor(timestamp / bucket) * bucket
+            if not bucket_times or bucket_times[-1] != key:
+                bucket_times.append(key)
+                bounds.append(index)
+        bounds.append(len(times))
+
+        result = {}
+        for name, column in columns.items():
+            values = array(VALUE_TYPE)
+            for low, high in zip(bounds, bounds[1:]):
+                found = [value for value in column[low:high] if not math.isnan(value)]
+                if not found:
+                    values.append(NAN)
+                elif how == "mean":
+                    values.append(math.fsum(found) / len(found))
+                elif how == "min":
+                    values.append(min(found))
+                elif how == "max":
+                    values.append(max(found))
+                else:
+                    values.append(found[-1])
+            result[name] = values
+        return bucket_times, result
+
+
+class TimeSeriesStore:
+    """A TimeSeries of the items of an endpoint per chair.
+
+    Without a directory the samples are only kept in memory.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        endpoint: str = ENDPOINT_BATTERY_INFO,
+        items: list = None,
+        chunk_size: int = 1440,
+    ) -> None:
+        """Initialize."""
+        if items is None:
+            if endpoint not in SERIES_ITEMS:
+                raise MyPermobilClientException(f"No series items for: {endpoint}")
+            items = SERIES_ITEMS[endpoint]
+        self.path = path
+        self.endpoint = endpoint
+        self.items = list(items)
+        self.chunk_size = chunk_size
+        self.series = {}
+
+    def __contains__(self, key) -> bool:
+        """in."""
+        return key in self.series or (
+            self.path is not None and os.path.isdir(os.path.join(self.path, key))
+        )
+
+    def __getitem__(self, key: str) -> TimeSeries:
+        """The series of a chair, opened or created on first use."""
+        if key not in self.series:
+            path = os.path.join(self.path, key) if self.path is not None else None
+            self.series[key] = TimeSeries(self.items, path, self.chunk_size)
+        return self.series[key]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes of samples kept in memory."""
+        return sum(series.nbytes for series in self.series.values())
+
+    def record(self, product_id: str, response, timestamp: float = None):
+        """Append the items of a response of the endpoint."""
+        if timestamp is None:
+            timestamp = time.time()
+        self[product_id].append(timestamp, response)
+
+    async def poll(self, api, timestamp: float = None):
+        """Request the endpoint for a chair and record the response."""
+        response = await api.request_endpoint(self.endpoint)
+        self.record(api.product_id, response, timestamp)
+        return response
+
+    def flush(self):
+        """Seal the active chunk of every series."""
+        for series in self.series.values():
+            series.flush()
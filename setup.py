@@ -9,8 +9,9 @@ setuptools.setup(
     author_email="isak@nyberg.dev",
     license="MIT",
     packages=["mypermobil"],
-    install_requires=["aiohttp", "aiocache"],
-    test_requires=["pytest", "aiocache"],
+    install_requires=["aiohttp"],
+    extras_require={"analytics": ["numpy"], "speedups": ["orjson", "Brotli"]},
+    test_requires=["pytest"],
     long_description=open("README.md").read(),
     long_description_content_type="text/markdown",
 )
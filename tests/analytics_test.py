@@ -0,0 +1,133 @@
+""" test the fleet analytics """
+
+import math
+import unittest
+from unittest.mock import MagicMock
+from mypermobil import (
+    BatteryTable,
+    FleetResult,
+    MyPermobilAPIException,
+)
+from mypermobil.analytics import DAY, np
+
+
+def battery(charge=50, health=100, distance=10, max_distance=20, charging=False):
+    return {
+        "stateOfCharge": charge,
+        "stateOfHealth": health,
+        "distanceLeft": distance,
+        "maxDistanceLeft": max_distance,
+        "charging": charging,
+    }
+
+
+# pylint: disable=missing-docstring
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestBatteryTable(unittest.TestCase):
+    def setUp(self):
+        self.table = BatteryTable.from_snapshots(
+            [
+                ("b", 0, battery(charge=80, health=100)),
+                ("a", 0, battery(charge=10, health=90, charging=True)),
+                ("b", DAY, battery(charge=15, health=99)),
+                ("a", DAY, battery(charge=60, health=90, max_distance=0)),
+                ("c", 0, {"stateOfCharge": 40}),
+            ]
+        )
+
+    def test_columns(self):
+        assert len(self.table) == 5
+        assert list(self.table.ids) == ["a", "b", "c"]
+        assert list(self.table.product_ids) == ["b", "a", "b", "a", "c"]
+        assert self.table["stateOfCharge"].dtype == np.float32
+        assert list(self.table["charging"][:2]) == [0, 1]
+        assert math.isnan(self.table["stateOfHealth"][4])
+
+    def test_latest(self):
+        latest = self.table.latest()
+        assert list(latest.product_ids) == ["a", "b", "c"]
+        assert list(latest["stateOfCharge"]) == [60, 15, 40]
+
+    def test_filters(self):
+        assert list(self.table.below("stateOfCharge", 20)) == ["b"]
+        assert len(self.table.between(DAY)) == 2
+        assert len(self.table.between(end=DAY)) == 3
+        charging = self.table.filter(self.table["charging"] == 1)
+        assert list(charging.product_ids) == ["a"]
+
+    def test_aggregations(self):
+        assert self.table.mean("stateOfHealth") == 94.75
+        ids, means = self.table.per_chair("stateOfCharge")
+        assert list(ids) == ["a", "b", "c"]
+        assert list(means) == [35, 47.5, 40]
+        ratio = self.table.range_ratio()
+        assert ratio[0] == 0.5
+        assert math.isnan(ratio[3])  # no max distance
+
+    def test_degradation(self):
+        ids, slope = self.table.degradation()
+        assert list(ids) == ["a", "b", "c"]
+        assert slope[0] == 0
+        assert slope[1] == -1
+        assert math.isnan(slope[2])
+
+    def test_summary(self):
+        assert self.table.summary(low_charge=20) == {
+            "chairs": 3,
+            "mean_state_of_health": 94.5,
+            "mean_state_of_charge": 115 / 3,
+            "charging": 0,
+            "low_charge": 1,
+            "mean_range_ratio": 0.5,
+        }
+
+    def test_concat(self):
+        other = BatteryTable.from_snapshots([("d", 2 * DAY, battery())])
+        table = BatteryTable.concat([self.table, other])
+        assert len(table) == 6
+        assert list(table.ids) == ["a", "b", "c", "d"]
+        assert list(table.latest().product_ids) == ["a", "b", "c", "d"]
+        assert len(BatteryTable.concat([])) == 0
+
+    def test_empty(self):
+        table = BatteryTable.from_snapshots([])
+        assert len(table.latest()) == 0
+        assert table.summary()["chairs"] == 0
+        assert math.isnan(table.mean("stateOfCharge"))
+
+    def test_fleet_results(self):
+        apis = [MagicMock(product_id=product_id) for product_id in "ab"]
+        results = [
+            FleetResult(apis[0], "get_battery_info", result=battery()),
+            FleetResult(apis[1], "get_battery_info", error=MyPermobilAPIException()),
+        ]
+        table = BatteryTable.from_fleet_results(results, timestamp=10)
+        assert list(table.product_ids) == ["a"]
+        assert list(table.timestamp) == [10]
+
+    def test_large(self):
+        chairs, days = 10000, 30
+        rng = np.random.default_rng(0)
+        product_ids = np.repeat(np.arange(chairs).astype(str), days)
+        table = BatteryTable(
+            *np.unique(product_ids, return_inverse=True),
+            np.tile(np.arange(days) * float(DAY), chairs),
+            {
+                "stateOfCharge": rng.uniform(0, 100, chairs * days).astype(np.float32),
+                "stateOfHealth": rng.uniform(80, 100, chairs * days).astype(np.float32),
+                "distanceLeft": rng.uniform(0, 20, chairs * days).astype(np.float32),
+                "maxDistanceLeft": np.full(chairs * days, 20, dtype=np.float32),
+                "ampereHoursLeft": np.zeros(chairs * days, dtype=np.float32),
+                "maxAmpereHours": np.zeros(chairs * days, dtype=np.float32),
+                "charging": np.zeros(chairs * days, dtype=np.float32),
+            },
+        )
+        summary = table.summary()
+        assert summary["chairs"] == chairs
+        assert 0 < summary["low_charge"] < chairs
+        _, slope = table.degradation()
+        assert not np.isnan(slope).any()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,474 @@
+""" test the response cache """
+
+import asyncio
+import datetime
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilCache,
+    MyPermobilPersistentCache,
+    MyPermobilClientException,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_DAILY_USAGE,
+    ENDPOINT_PRODUCTS,
+    CACHE_TTL_LOOKUP,
+    BATTERY_STATE_OF_CHARGE,
+)
+from mypermobil.mypermobil import CACHE_ERROR_TTL
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# pylint: disable=missing-docstring
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.cache = MyPermobilCache(max_entries=3, clock=self.clock)
+
+    def test_invalid_bounds(self):
+        with self.assertRaises(MyPermobilClientException):
+            MyPermobilCache(max_entries=0)
+        with self.assertRaises(MyPermobilClientException):
+            MyPermobilCache(max_bytes=0)
+
+    def test_get_set(self):
+        assert self.cache.get(("a",)) is None
+        self.cache.set(("a",), {"value": 1}, ttl=10)
+        assert self.cache.get(("a",)) == {"value": 1}
+        assert self.cache.stats["hits"] == 1
+        assert self.cache.stats["misses"] == 1
+
+    def test_ttl(self):
+        self.cache.set(("a",), 1, ttl=10)
+        self.clock.now = 9
+        assert self.cache.get(("a",)) == 1
+        self.clock.now = 10
+        assert self.cache.get(("a",)) is None
+        assert len(self.cache) == 0
+
+    def test_lru_eviction(self):
+        for key in "abc":
+            self.cache.set((key,), key, ttl=10)
+        # use "a" so that "b" is the least recently used
+        self.cache.get(("a",))
+        self.cache.set(("d",), "d", ttl=10)
+
+        assert ("b",) not in self.cache
+        assert ("a",) in self.cache
+        assert len(self.cache) == 3
+        assert self.cache.stats["evictions"] == 1
+
+    def test_max_bytes(self):
+        cache = MyPermobilCache(max_bytes=2000, clock=self.clock)
+        cache.set(("a",), "a" * 1200, ttl=10)
+        cache.set(("b",), "b" * 900, ttl=10)
+        assert cache.size <= 2000
+        assert ("a",) not in cache
+        # values larger than the cache are not cached at all
+        cache.set(("c",), "c" * 3000, ttl=10)
+        assert ("c",) not in cache
+        assert ("b",) in cache
+
+    def test_get_stale(self):
+        self.cache.set(("a",), 1, ttl=10, stale_ttl=5)
+        self.clock.now = 12
+        assert self.cache.get(("a",)) is None
+        assert self.cache.get_stale(("a",)) == 1
+        self.clock.now = 15
+        assert self.cache.get_stale(("a",)) is None
+        assert len(self.cache) == 0
+
+    def test_validators(self):
+        validators = {"ETag": '"v1"'}
+        self.cache.set(("a",), 1, ttl=10, validators=validators)
+        self.cache.set(("b",), 2, ttl=10)
+        self.clock.now = 12
+        assert self.cache.get(("a",)) is None
+        assert self.cache.get_stale(("a",)) is None
+        # the expired value is kept to be revalidated
+        assert self.cache.get_validated(("a",)) == (1, validators)
+        assert self.cache.get_validated(("b",)) is None
+        assert len(self.cache) == 1
+
+        self.clock.now = 10 + self.cache.revalidate_ttl
+        assert self.cache.get_validated(("a",)) is None
+        assert len(self.cache) == 0
+
+    def test_error_not_validated(self):
+        error = MyPermobilClientException("error")
+        self.cache.set(("a",), error, ttl=10, validators={"ETag": '"v1"'})
+        assert self.cache.get_validated(("a",)) is None
+
+    def test_clear(self):
+        self.cache.set(("a",), 1, ttl=10)
+        self.cache.get(("a",))
+        self.cache.clear()
+        assert len(self.cache) == 0
+        assert self.cache.stats["hits"] == 0
+
+
+class TestPersistentCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.clock.now = 1000.0
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def open(self):
+        return MyPermobilPersistentCache(self.path, clock=self.clock)
+
+    def test_survives_restart(self):
+        cache = self.open()
+        cache.set(("region", "endpoint", "id"), {"value": [1, 2]}, ttl=10)
+        cache.close()
+
+        cache = self.open()
+        assert len(cache) == 0  # warmed lazily
+        assert cache.get(("region", "endpoint", "id")) == {"value": [1, 2]}
+        assert cache.stats["loads"] == 1
+        assert len(cache) == 1
+        cache.close()
+
+    def test_ttl_after_restart(self):
+        cache = self.open()
+        cache.set(("a",), 1, ttl=10, stale_ttl=10)
+        cache.close()
+
+        self.clock.now += 15
+        cache = self.open()
+        assert cache.get(("a",)) is None
+        assert cache.get_stale(("a",)) == 1
+        cache.close()
+
+        self.clock.now += 10
+        cache = self.open()
+        assert cache.get_stale(("a",)) is None
+        cache.close()
+
+    def test_errors_not_stored(self):
+        cache = self.open()
+        cache.set(("a",), MyPermobilClientException("error"), ttl=10)
+        assert isinstance(cache.get(("a",)), MyPermobilClientException)
+        cache.close()
+
+        cache = self.open()
+        assert cache.get(("a",)) is None
+        cache.close()
+
+    def test_expired_error_keeps_file(self):
+        cache = self.open()
+        cache.set(("a",), {"a": 1}, ttl=3600, validators={"ETag": '"v1"'})
+        cache.set(("a",), MyPermobilClientException("error"), ttl=10)
+        self.clock.now += 11
+        # the error is gone, the stored response is not
+        assert cache.get(("a",)) == {"a": 1}
+        assert cache.get_validated(("a",)) == ({"a": 1}, {"ETag": '"v1"'})
+        cache.close()
+
+        cache = self.open()
+        assert cache.get(("a",)) == {"a": 1}
+        cache.close()
+
+    def test_validators_after_restart(self):
+        cache = self.open()
+        cache.set(("a",), 1, ttl=10, validators={"ETag": '"v1"'})
+        cache.set(("b",), 2, ttl=10)
+        cache.close()
+
+        self.clock.now += 20
+        cache = self.open()
+        assert cache.get_validated(("a",)) == (1, {"ETag": '"v1"'})
+        assert cache.get(("b",)) is None
+        cache.close()
+
+        self.clock.now += cache.revalidate_ttl
+        cache = self.open()
+        assert cache.get_validated(("a",)) is None
+        cache.close()
+
+    def test_file_without_validators(self):
+        db = sqlite3.connect(self.path)
+        db.execute(
+            "CREATE TABLE responses ("
+            "key TEXT PRIMARY KEY, value TEXT, expires REAL, keep REAL)"
+        )
+        with db:
+            db.execute("INSERT INTO responses VALUES ('[\"a\"]', '1', 2000, 2000)")
+        db.close()
+
+        cache = self.open()
+        assert cache.get(("a",)) == 1
+        cache.set(("b",), 2, ttl=10, validators={"ETag": '"v1"'})
+        cache.close()
+
+    def test_delete_and_clear(self):
+        cache = self.open()
+        cache.set(("a",), 1, ttl=10)
+        cache.set(("b",), 2, ttl=10)
+        cache.delete(("a",))
+        cache.close()
+
+        cache = self.open()
+        assert cache.get(("a",)) is None
+        assert cache.get(("b",)) == 2
+        cache.clear()
+        cache.close()
+
+        cache = self.open()
+        assert cache.get(("b",)) is None
+        cache.close()
+
+
+class TestClientCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+        )
+        self.api.self_authenticate()
+        resp = AsyncMock(status=200)
+        resp.json = AsyncMock(return_value={"stateOfCharge": 50})
+        self.api.make_request = AsyncMock(return_value=resp)
+
+    async def test_structured_keys(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        await self.api.request_endpoint(ENDPOINT_DAILY_USAGE)
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+
+        assert ("http://example.com", ENDPOINT_BATTERY_INFO, "a" * 24) in self.api.cache
+        assert self.api.make_request.call_count == 2
+        assert self.api.cache_stats["hits"] == 1
+        assert self.api.cache_stats["misses"] == 2
+
+    async def test_cache_per_instance(self):
+        other = MyPermobil("test", AsyncMock(), region="http://example.com")
+        assert other.cache is not self.api.cache
+
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert len(other.cache) == 0
+
+    async def test_shared_cache(self):
+        other = MyPermobil(
+            "test",
+            AsyncMock(),
+            region="http://example.com",
+            product_id="a" * 24,
+            cache=self.api.cache,
+        )
+        other.make_request = AsyncMock()
+
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        res = await other.request_endpoint(ENDPOINT_BATTERY_INFO)
+
+        assert res == {"stateOfCharge": 50}
+        assert other.make_request.call_count == 0
+
+    async def test_ttl_per_endpoint(self):
+        clock = Clock()
+        self.api.cache = MyPermobilCache(clock=clock)
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        await self.api.request_endpoint(ENDPOINT_PRODUCTS)
+
+        clock.now = CACHE_TTL_LOOKUP[ENDPOINT_BATTERY_INFO]
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        await self.api.request_endpoint(ENDPOINT_PRODUCTS)
+
+        # battery info expired, products did not
+        assert self.api.make_request.call_count == 3
+
+    async def test_ttl_override(self):
+        api = MyPermobil("test", AsyncMock(), cache_ttls={ENDPOINT_PRODUCTS: 1})
+        assert api.cache_ttl(ENDPOINT_PRODUCTS) == 1
+        assert api.cache_ttl(ENDPOINT_BATTERY_INFO) == CACHE_TTL_LOOKUP[
+            ENDPOINT_BATTERY_INFO
+        ]
+        assert api.cache_ttl("/not/an/endpoint") > 0
+        # the override does not change the defaults of other instances
+        assert self.api.cache_ttl(ENDPOINT_PRODUCTS) != 1
+
+
+class TestConditionalRequests(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.clock = Clock()
+        self.api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+            cache=MyPermobilCache(clock=self.clock),
+        )
+        self.api.self_authenticate()
+        self.headers = {
+            "ETag": '"v1"',
+            "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT",
+        }
+        self.status = 200
+
+        async def request(*args, **kwargs):
+            resp = AsyncMock(status=self.status, headers=self.headers)
+            resp.json = AsyncMock(return_value={"stateOfCharge": 50})
+            return resp
+
+        self.api.make_request = AsyncMock(side_effect=request)
+
+    def sent_headers(self):
+        return self.api.make_request.call_args.kwargs["headers"]
+
+    async def test_not_modified(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert "If-None-Match" not in self.sent_headers()
+
+        self.clock.now = CACHE_TTL_LOOKUP[ENDPOINT_BATTERY_INFO]
+        self.status = 304
+        self.headers = {}
+        res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res == {"stateOfCharge": 50}
+        headers = self.sent_headers()
+        assert headers["If-None-Match"] == '"v1"'
+        assert headers["If-Modified-Since"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+        assert headers["Authorization"] == "Bearer " + "a" * 256
+        assert self.api.cache_stats["not_modified"] == 1
+
+    async def test_request_item_keeps_auth(self):
+        # request_item passes its empty kwargs as the headers
+        assert await self.api.request_item(BATTERY_STATE_OF_CHARGE) == 50
+        self.clock.now = CACHE_TTL_LOOKUP[ENDPOINT_BATTERY_INFO]
+        self.status = 304
+        assert await self.api.request_item(BATTERY_STATE_OF_CHARGE) == 50
+        headers = self.sent_headers()
+        assert headers["If-None-Match"] == '"v1"'
+        assert headers["Authorization"] == "Bearer " + "a" * 256
+
+        # the revalidated response is cached for another TTL
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.api.make_request.call_count == 2
+
+        # and keeps its validators
+        self.clock.now *= 2
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.sent_headers()["If-None-Match"] == '"v1"'
+
+    async def test_modified(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = CACHE_TTL_LOOKUP[ENDPOINT_BATTERY_INFO]
+        self.headers = {"ETag": '"v2"'}
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.api.cache_stats["not_modified"] == 0
+
+        self.clock.now *= 2
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        headers = self.sent_headers()
+        assert headers["If-None-Match"] == '"v2"'
+        assert "If-Modified-Since" not in headers
+
+    async def test_no_validators(self):
+        self.headers = {}
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = CACHE_TTL_LOOKUP[ENDPOINT_BATTERY_INFO]
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert "If-None-Match" not in self.sent_headers()
+        assert self.api.make_request.call_count == 2
+
+
+class TestStaleWhileRevalidate(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.clock = Clock()
+        self.api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+            cache=MyPermobilCache(clock=self.clock),
+            cache_ttls={ENDPOINT_BATTERY_INFO: 10},
+            stale_while_revalidate=60,
+        )
+        self.api.self_authenticate()
+        self.charge = 50
+
+        async def request(*args, **kwargs):
+            await asyncio.sleep(0.01)
+            resp = AsyncMock(status=200)
+            resp.json = AsyncMock(return_value={"stateOfCharge": self.charge})
+            return resp
+
+        self.api.make_request = AsyncMock(side_effect=request)
+
+    async def test_stale_returned_and_refreshed(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = 11
+        self.charge = 40
+
+        # both callers get the stale value without waiting
+        res1 = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        res2 = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res1 == res2 == {"stateOfCharge": 50}
+
+        # only one refresh is made in the background
+        await asyncio.gather(*self.api.background_tasks)
+        assert self.api.make_request.call_count == 2
+        res3 = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res3 == {"stateOfCharge": 40}
+
+    async def test_too_stale_blocks(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = 71
+        self.charge = 40
+        res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res == {"stateOfCharge": 40}
+        assert not self.api.background_tasks
+
+    async def test_failed_refresh_keeps_stale(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = 11
+        self.api.make_request = AsyncMock(side_effect=MyPermobilClientException)
+
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        await asyncio.gather(*self.api.background_tasks, return_exceptions=True)
+        res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res == {"stateOfCharge": 50}
+
+    async def test_failed_refresh_cooldown(self):
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        self.clock.now = 11
+        self.api.make_request = AsyncMock(side_effect=MyPermobilClientException)
+        for _ in range(10):
+            res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+            assert res == {"stateOfCharge": 50}
+            await asyncio.gather(*self.api.background_tasks, return_exceptions=True)
+        # the failed refresh is not retried until the error TTL passes
+        assert self.api.make_request.call_count == 1
+        self.clock.now += CACHE_ERROR_TTL
+        await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        await asyncio.gather(*self.api.background_tasks, return_exceptions=True)
+        assert self.api.make_request.call_count == 2
+
+
+if __name__ == "__main__":
+    unittest.main()
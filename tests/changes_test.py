@@ -0,0 +1,111 @@
+""" test change detection """
+
+import unittest
+from unittest.mock import AsyncMock, patch
+from mypermobil import (
+    MyPermobil,
+    MyPermobilAPIException,
+    MyPermobilClientException,
+    Change,
+    ChangeDetector,
+    payload_hash,
+    watch_endpoint,
+    BATTERY_CHARGING,
+    BATTERY_STATE_OF_CHARGE,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_DAILY_USAGE,
+)
+
+
+# pylint: disable=missing-docstring
+class TestPayloadHash(unittest.TestCase):
+    def test_key_order(self):
+        assert payload_hash({"a": 1, "b": [1, 2]}) == payload_hash({"b": [1, 2], "a": 1})
+
+    def test_different(self):
+        assert payload_hash({"a": 1}) != payload_hash({"a": 2})
+        assert payload_hash([1, 2]) != payload_hash([2, 1])
+
+
+class TestChangeDetector(unittest.TestCase):
+    def setUp(self):
+        self.detector = ChangeDetector(
+            ENDPOINT_BATTERY_INFO, [BATTERY_STATE_OF_CHARGE, BATTERY_CHARGING]
+        )
+
+    def test_default_items(self):
+        detector = ChangeDetector(ENDPOINT_DAILY_USAGE)
+        changes = detector.diff({"distance": 5, "distanceUnit": "km"})
+        assert [list(change.path) for change in changes] == [
+            ["distance"],
+            ["distanceUnit"],
+            ["adjustments"],
+        ]
+        assert changes[2].new is None
+
+    def test_duplicate_paths(self):
+        # BATTERY_TIMESTAMP and BATTERY_LOCAL_TIMESTAMP are the same path
+        detector = ChangeDetector(ENDPOINT_BATTERY_INFO)
+        paths = [tuple(path) for path in detector.paths]
+        assert len(paths) == len(set(paths))
+
+    def test_unknown_endpoint(self):
+        with self.assertRaises(MyPermobilClientException):
+            ChangeDetector("/api/v1/unknown")
+
+    def test_diff(self):
+        first = self.detector.diff({"stateOfCharge": 50, "charging": False})
+        assert first == [
+            Change(("stateOfCharge",), None, 50),
+            Change(("charging",), None, False),
+        ]
+        changes = self.detector.diff({"charging": True, "stateOfCharge": 50})
+        assert changes == [Change(("charging",), False, True)]
+        changes = self.detector.diff({"charging": True})
+        assert changes == [Change(("stateOfCharge",), 50, None)]
+
+    def test_skip_unchanged(self):
+        response = {"stateOfCharge": 50, "charging": False, "other": 1}
+        self.detector.diff(response)
+        assert not self.detector.diff(response)
+        assert not self.detector.diff(dict(response))
+        # a change outside the items is not reported
+        assert not self.detector.diff({**response, "other": 2})
+        assert self.detector.stats == {"checked": 4, "skipped": 2, "changes": 2}
+
+    def test_reset(self):
+        response = {"stateOfCharge": 50, "charging": False}
+        self.detector.diff(response)
+        self.detector.reset()
+        assert len(self.detector.diff(response)) == 2
+
+
+class TestWatchEndpoint(unittest.IsolatedAsyncioTestCase):
+    async def test_watch(self):
+        api = MyPermobil("test", AsyncMock())
+        responses = [
+            {"stateOfCharge": 50, "charging": False},
+            {"stateOfCharge": 50, "charging": False},
+            {"stateOfCharge": 49, "charging": False},
+            MyPermobilAPIException("error"),
+        ]
+        api.request_endpoint = AsyncMock(side_effect=responses)
+        detector = ChangeDetector(ENDPOINT_BATTERY_INFO)
+
+        received = []
+        with patch("asyncio.sleep", new=AsyncMock()) as sleep:
+            with self.assertRaises(MyPermobilAPIException):
+                async for changes in watch_endpoint(
+                    api, ENDPOINT_BATTERY_INFO, interval=30, detector=detector
+                ):
+                    received.append(changes)
+
+        assert len(received) == 2
+        assert received[1] == [Change(("stateOfCharge",), 50, 49)]
+        assert sleep.await_count == 3
+        sleep.assert_awaited_with(30)
+        api.request_endpoint.assert_awaited_with(ENDPOINT_BATTERY_INFO)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,208 @@
+""" test coalescing identical requests """
+
+import asyncio
+import datetime
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilAPIException,
+    RequestCoalescer,
+    ENDPOINT_BATTERY_INFO,
+)
+
+
+# pylint: disable=missing-docstring
+class TestCoalescer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.coalescer = RequestCoalescer()
+        self.calls = 0
+
+    async def request(self, result=1, delay=0.05):
+        self.calls += 1
+        await asyncio.sleep(delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def test_coalesce(self):
+        results = await asyncio.gather(
+            *(self.coalescer.run("key", self.request) for _ in range(10))
+        )
+        assert results == [1] * 10
+        assert self.calls == 1
+        assert self.coalescer.stats == {"requests": 1, "coalesced": 9, "inflight": 0}
+
+    async def test_exception_propagates(self):
+        error = MyPermobilAPIException("error")
+        results = await asyncio.gather(
+            *(
+                self.coalescer.run("key", lambda: self.request(error))
+                for _ in range(3)
+            ),
+            return_exceptions=True,
+        )
+        assert results == [error] * 3
+        assert self.calls == 1
+
+    async def test_leader_cancelled(self):
+        leader = asyncio.ensure_future(self.coalescer.run("key", self.request))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.coalescer.run("key", self.request))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        assert await follower == 1
+        assert leader.cancelled()
+        assert self.calls == 1
+
+    async def test_all_cancelled(self):
+        tasks = [
+            asyncio.ensure_future(self.coalescer.run("key", self.request))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0)
+        inflight = self.coalescer.inflight["key"]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert inflight.task.cancelled()
+        assert not self.coalescer.inflight
+        # a new call makes a new request
+        assert await self.coalescer.run("key", self.request) == 1
+        assert self.calls == 2
+
+
+class TestClientCoalescing(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.coalescer = RequestCoalescer()
+
+    def create(self, token="a" * 256):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token=token,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+            coalescer=self.coalescer,
+        )
+        api.self_authenticate()
+
+        async def request(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            resp = AsyncMock(status=200)
+            resp.json = AsyncMock(return_value={"stateOfCharge": 50})
+            return resp
+
+        api.make_request = AsyncMock(side_effect=request)
+        return api
+
+    async def test_instances_share_request(self):
+        apis = [self.create() for _ in range(3)]
+        results = await asyncio.gather(
+            *(api.request_endpoint(ENDPOINT_BATTERY_INFO) for api in apis)
+        )
+        assert results == [{"stateOfCharge": 50}] * 3
+        assert sum(api.make_request.call_count for api in apis) == 1
+        # every instance caches the response
+        assert all(len(api.cache) == 1 for api in apis)
+
+    async def test_different_tokens(self):
+        apis = [self.create("a" * 256), self.create("b" * 256)]
+        await asyncio.gather(
+            *(api.request_endpoint(ENDPOINT_BATTERY_INFO) for api in apis)
+        )
+        assert sum(api.make_request.call_count for api in apis) == 2
+
+    async def test_no_coalescer(self):
+        apis = [self.create() for _ in range(2)]
+        for api in apis:
+            api.coalescer = None
+        await asyncio.gather(
+            *(api.request_endpoint(ENDPOINT_BATTERY_INFO) for api in apis)
+        )
+        assert sum(api.make_request.call_count for api in apis) == 2
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+            coalescer=RequestCoalescer(),
+        )
+        self.api.self_authenticate()
+        self.status = 200
+        self.payload = {"stateOfCharge": 50}
+
+        async def request(*args, **kwargs):
+            await asyncio.sleep(0.05)
+            resp = AsyncMock(status=self.status)
+            resp.json = AsyncMock(return_value=self.payload)
+            return resp
+
+        self.api.make_request = AsyncMock(side_effect=request)
+
+    async def call_many(self, count=2000):
+        return await asyncio.gather(
+            *(
+                self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+                for _ in range(count)
+            ),
+            return_exceptions=True,
+        )
+
+    async def test_stress_result(self):
+        results = await self.call_many()
+        assert all(res == {"stateOfCharge": 50} for res in results)
+        assert self.api.make_request.call_count == 1
+        assert not self.api.cache.flights.inflight
+
+    async def test_stress_exception(self):
+        self.status = 500
+        self.payload = {"error": "server error"}
+        results = await self.call_many()
+        assert all(isinstance(res, MyPermobilAPIException) for res in results)
+        # every caller gets the same exception, none gets None
+        assert len({id(res) for res in results}) == 1
+        assert self.api.make_request.call_count == 1
+
+    async def test_falsy_cached(self):
+        for payload in ([], {}):
+            self.api.cache.clear()
+            self.api.make_request.reset_mock()
+            self.payload = payload
+            results = await self.call_many(100)
+            results += await self.call_many(100)
+            assert results == [payload] * 200
+            assert self.api.make_request.call_count == 1
+
+    async def test_leader_cancelled(self):
+        leader = asyncio.ensure_future(self.api.request_endpoint(ENDPOINT_BATTERY_INFO))
+        await asyncio.sleep(0)
+        followers = [
+            asyncio.ensure_future(self.api.request_endpoint(ENDPOINT_BATTERY_INFO))
+            for _ in range(100)
+        ]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        results = await asyncio.gather(*followers)
+        assert results == [{"stateOfCharge": 50}] * 100
+        assert leader.cancelled()
+        assert self.api.make_request.call_count == 1
+
+
+if __name__ == "__main__":
+    unittest.main()
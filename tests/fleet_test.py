@@ -0,0 +1,110 @@
+""" test fleet fan out """
+
+import asyncio
+import datetime
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilFleet,
+    MyPermobilClientException,
+    MyPermobilAPIException,
+)
+
+
+# pylint: disable=missing-docstring
+class TestFleet(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.session = AsyncMock()
+        self.fleet = MyPermobilFleet(self.session, max_concurrency_per_host=2)
+        self.ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+
+    def create(self, product_id, region="http://example.com"):
+        return self.fleet.create(
+            "test",
+            "valid@email.com",
+            region,
+            "a" * 256,
+            self.ttl.strftime("%Y-%m-%d"),
+            product_id=product_id,
+        )
+
+    async def test_add_requires_auth(self):
+        api = MyPermobil("test", AsyncMock())
+        with self.assertRaises(MyPermobilClientException):
+            self.fleet.add(api)
+
+    async def test_shared_session(self):
+        api = self.create("a" * 24)
+        assert api.session is self.session
+        assert len(self.fleet) == 1
+
+    async def test_invalid_method(self):
+        self.create("a" * 24)
+        with self.assertRaises(MyPermobilClientException):
+            await self.fleet.refresh_all(["not_a_method"])
+
+    async def test_refresh_as_completed(self):
+        slow = self.create("a" * 24)
+        fast = self.create("b" * 24)
+
+        async def delay():
+            await asyncio.sleep(0.2)
+            return 1
+
+        slow.get_battery_info = AsyncMock(side_effect=delay)
+        fast.get_battery_info = AsyncMock(return_value=2)
+
+        results = [res async for res in self.fleet.refresh(["get_battery_info"])]
+
+        assert [res.result for res in results] == [2, 1]
+        assert all(res.ok for res in results)
+        assert results[0].api is fast
+
+    async def test_refresh_errors_per_chair(self):
+        good = self.create("a" * 24)
+        bad = self.create("b" * 24)
+        good.get_daily_usage = AsyncMock(return_value={"distance": 1})
+        bad.get_daily_usage = AsyncMock(side_effect=MyPermobilAPIException("404"))
+
+        results = await self.fleet.refresh_all(["get_daily_usage"])
+
+        errors = [res for res in results if not res.ok]
+        assert len(results) == 2
+        assert len(errors) == 1
+        assert errors[0].api is bad
+        assert isinstance(errors[0].error, MyPermobilAPIException)
+
+    async def test_concurrency_per_host(self):
+        running = {"now": 0, "max": 0}
+
+        async def request():
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(0.01)
+            running["now"] -= 1
+            return {}
+
+        for i in range(6):
+            api = self.create(str(i) * 24)
+            api.get_battery_info = AsyncMock(side_effect=request)
+        other = self.create("z" * 24, region="http://other.example.com")
+        other.get_battery_info = AsyncMock(side_effect=request)
+
+        results = await self.fleet.refresh_all(["get_battery_info"])
+
+        assert len(results) == 7
+        # two for example.com plus one for other.example.com
+        assert running["max"] <= 3
+
+    async def test_close_session(self):
+        api = self.create("a" * 24)
+        await self.fleet.close_session()
+        assert self.fleet.session is None
+        assert api.session is None
+        with self.assertRaises(MyPermobilClientException):
+            await self.fleet.close_session()
+
+
+if __name__ == "__main__":
+    unittest.main()
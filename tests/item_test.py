@@ -12,8 +12,17 @@ from mypermobil import (
     MyPermobilAPIException,
     MyPermobilConnectionException,
     BATTERY_AMPERE_HOURS_LEFT,
+    BATTERY_STATE_OF_CHARGE,
+    PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_PRODUCT_BY_ID,
     RECORDS_DISTANCE,
     RECORDS_SEATING,
+    BATTERY_TIMESTAMP,
+    ENDPOINT_LOOKUP,
+    ITEM_PATHS,
+    ItemPath,
+    compile_item,
     ENDPOINT_VA_USAGE_RECORDS,
     GET,
     POST,
@@ -108,6 +117,46 @@ class TestRequest(unittest.IsolatedAsyncioTestCase):
     #        with self.assertRaises(MyPermobilClientException):
     #            await self.api.request_item(item, endpoint=endpoint)
 
+    async def test_request_items(self):
+        responses = {
+            ENDPOINT_BATTERY_INFO: {"stateOfCharge": 50, "ampereHoursLeft": 10},
+            ENDPOINT_VA_USAGE_RECORDS: {"distanceRecord": 123},
+            ENDPOINT_PRODUCT_BY_ID: MyPermobilAPIException("500: error"),
+        }
+
+        async def request_endpoint(endpoint):
+            if isinstance(responses[endpoint], Exception):
+                raise responses[endpoint]
+            return responses[endpoint]
+
+        self.api.request_endpoint = AsyncMock(side_effect=request_endpoint)
+        res = await self.api.request_items(
+            [
+                BATTERY_STATE_OF_CHARGE,
+                BATTERY_AMPERE_HOURS_LEFT,
+                RECORDS_DISTANCE,
+                RECORDS_SEATING,
+                PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL,
+                "not an item",
+            ]
+        )
+
+        # one request per distinct endpoint
+        assert self.api.request_endpoint.call_count == 3
+        assert res[tuple(BATTERY_STATE_OF_CHARGE)] == 50
+        assert res[tuple(BATTERY_AMPERE_HOURS_LEFT)] == 10
+        assert res[tuple(RECORDS_DISTANCE)] == 123
+        assert isinstance(res[tuple(RECORDS_SEATING)], MyPermobilClientException)
+        assert isinstance(
+            res[tuple(PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL)],
+            MyPermobilAPIException,
+        )
+        assert isinstance(res[("not an item",)], MyPermobilClientException)
+
+    async def test_request_items_empty(self):
+        with self.assertRaises(MyPermobilClientException):
+            await self.api.request_items([])
+
     async def test_request_request_endpoint_cache(self):
         """call the same endpoint twice and check that the cache is used"""
         resp = AsyncMock(status=200)
@@ -275,5 +324,38 @@ class TestRequest(unittest.IsolatedAsyncioTestCase):
         assert resp.status == 200
 
 
+class TestItemPath(unittest.TestCase):
+    def test_compiled_constants(self):
+        path = ITEM_PATHS[tuple(PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL)]
+        assert path == tuple(PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL)
+        assert path.endpoint == ENDPOINT_PRODUCT_BY_ID
+        assert hash(path) == hash(tuple(PRODUCT_BY_ID_MOST_RECENT_ODOMETER_TOTAL))
+
+    def test_same_endpoints_as_lookup(self):
+        for key, path in ITEM_PATHS.items():
+            assert ENDPOINT_LOOKUP[str(list(key))] == path.endpoint
+        assert compile_item(BATTERY_TIMESTAMP).endpoint == ENDPOINT_BATTERY_INFO
+
+    def test_compile_item(self):
+        path = compile_item(BATTERY_STATE_OF_CHARGE)
+        assert compile_item(path) is path
+        assert compile_item("stateOfCharge") is path
+        assert compile_item(["a", 0], endpoint="test").endpoint == "test"
+        with self.assertRaises(MyPermobilClientException):
+            compile_item([])
+        with self.assertRaises(MyPermobilClientException):
+            compile_item(["not an item"])
+
+    def test_get(self):
+        path = ItemPath(["a", 1, "b"], "test")
+        assert path.get({"a": [0, {"b": 2}]}) == 2
+        with self.assertRaises(MyPermobilClientException):
+            path.get({"a": [0]})
+        with self.assertRaises(MyPermobilClientException):
+            path.get({"a": [0, {"c": 2}]})
+        with self.assertRaises(MyPermobilClientException):
+            path.get({"a": "not a list"})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,136 @@
+""" test the response models """
+
+import datetime
+import json
+import pickle
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilClientException,
+    BatteryInfo,
+    DailyUsage,
+    UsageRecords,
+    Position,
+    Positions,
+    MODEL_LOOKUP,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_PRODUCTS,
+    ENDPOINT_PRODUCTS_POSITIONS,
+)
+from mypermobil.cache import sizeof
+
+BATTERY = {
+    "stateOfHealth": 98,
+    "stateOfCharge": 55.5,
+    "charging": False,
+    "distanceLeft": 12.3,
+    "distanceUnit": "kilometers",
+    "localTimestamp": "2024-01-01T12:00:00.000Z",
+}
+
+POSITIONS = {
+    "currentPosition": {"latitude": 59.3, "longitude": 18.0},
+    "previousPositions": [
+        {"latitude": 59.3, "longitude": 18.0, "timestamp": "1970-01-01T00:01:00Z"},
+        {"name": "no coordinates"},
+        {"latitude": 59.4, "longitude": 18.1, "timestamp": 120},
+    ],
+}
+
+
+# pylint: disable=missing-docstring
+class TestModels(unittest.TestCase):
+    def test_fields(self):
+        # the attributes are generated from the items in const
+        assert "state_of_charge" in BatteryInfo.__slots__
+        assert "local_timestamp" in BatteryInfo.__slots__
+        assert DailyUsage.__slots__ == ("distance", "distance_unit", "adjustments")
+        assert "seating_date" in UsageRecords.__slots__
+        assert Positions.__slots__ == ("current", "previous")
+        assert not hasattr(BatteryInfo(BATTERY), "__dict__")
+
+    def test_battery(self):
+        info = BatteryInfo(BATTERY)
+        assert info.state_of_charge == 55.5
+        assert info.charging is False
+        assert info.distance_unit == "kilometers"
+        assert info.max_ampere_hours is None
+        assert info.as_dict()["state_of_health"] == 98
+        assert info == BatteryInfo(BATTERY)
+        assert info != BatteryInfo({})
+        assert "state_of_charge=55.5" in repr(info)
+        with self.assertRaises(AttributeError):
+            _ = info.missing
+
+    def test_lazy(self):
+        info = BatteryInfo(body=json.dumps(BATTERY).encode())
+        assert not info.decoded
+        assert info.state_of_charge == 55.5
+        assert info.decoded
+        assert info == BatteryInfo(BATTERY)
+
+        calls = []
+
+        def loads(body):
+            calls.append(body)
+            return json.loads(body)
+
+        info = BatteryInfo(body=b'{"stateOfCharge": 10}', loads=loads)
+        assert info.state_of_charge == 10
+        assert info.charging is None
+        assert len(calls) == 1
+
+    def test_positions(self):
+        positions = Positions(POSITIONS)
+        assert positions.current == Position(None, 59.3, 18.0)
+        assert positions.previous == (
+            Position(60, 59.3, 18.0),
+            Position(120, 59.4, 18.1),
+        )
+        assert tuple(positions.previous[0]) == (60, 59.3, 18.0)
+        empty = Positions({})
+        assert empty.current is None
+        assert empty.previous == ()
+
+    def test_pickle(self):
+        info = BatteryInfo(body=json.dumps(BATTERY).encode())
+        assert pickle.loads(pickle.dumps(info)) == info
+        positions = Positions(POSITIONS)
+        assert pickle.loads(pickle.dumps(positions)) == positions
+
+    def test_memory(self):
+        info = BatteryInfo(BATTERY)
+        slots = sizeof(info) + sum(sizeof(value) for value in info.as_dict().values())
+        assert slots < sizeof(BATTERY)
+
+
+class TestRequestModel(unittest.IsolatedAsyncioTestCase):
+    async def test_request_model(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+        )
+        api.self_authenticate()
+        api.request_endpoint = AsyncMock(return_value=BATTERY)
+        info = await api.request_model(ENDPOINT_BATTERY_INFO)
+        assert isinstance(info, BatteryInfo)
+        assert info.state_of_charge == 55.5
+
+        api.request_endpoint = AsyncMock(return_value=POSITIONS)
+        positions = await api.request_model(ENDPOINT_PRODUCTS_POSITIONS)
+        assert isinstance(positions, MODEL_LOOKUP[ENDPOINT_PRODUCTS_POSITIONS])
+        assert len(positions.previous) == 2
+
+        with self.assertRaises(MyPermobilClientException):
+            await api.request_model(ENDPOINT_PRODUCTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
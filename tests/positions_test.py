@@ -0,0 +1,332 @@
+""" test the position history """
+
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    GridIndex,
+    PositionCursor,
+    PositionStore,
+    haversine,
+    ENDPOINT_PRODUCTS_POSITIONS,
+)
+from mypermobil.analytics import np
+from mypermobil.positions import new_positions, parse_position, parse_timestamp
+
+STOCKHOLM = (59.3293, 18.0686)
+SUNDSVALL = (62.3908, 17.3069)
+
+
+def position(lat, lon, timestamp=None):
+    res = {"latitude": lat, "longitude": lon}
+    if timestamp is not None:
+        res["timestamp"] = timestamp
+    return res
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# pylint: disable=missing-docstring
+class TestParse(unittest.TestCase):
+    def test_timestamp(self):
+        assert parse_timestamp(10) == 10
+        assert parse_timestamp(10_000_000_000_000) == 10_000_000_000
+        assert parse_timestamp("1970-01-01T00:01:00Z") == 60
+        assert parse_timestamp("1970-01-01T00:01:00") == 60
+        assert parse_timestamp("yesterday") is None
+        assert parse_timestamp(None) is None
+
+    def test_position(self):
+        assert parse_position(position(1, 2, 3)) == (3, 1, 2)
+        assert parse_position({"coordinates": [2, 1]}) == (None, 1, 2)
+        assert parse_position({"latitude": "1.5", "longitude": 2}) == (None, 1.5, 2)
+        assert parse_position({"latitude": 91, "longitude": 2}) is None
+        assert parse_position({"latitude": None, "longitude": 2}) is None
+        assert parse_position({}) is None
+        assert parse_position("nowhere") is None
+
+
+class TestNewPositions(unittest.TestCase):
+    def test_oldest_first(self):
+        response = {
+            "currentPosition": position(3, 0, 30),
+            "previousPositions": [position(1, 0, 10), position(2, 0, 20)],
+        }
+        assert new_positions(response) == [(10, 1, 0), (20, 2, 0), (30, 3, 0)]
+        assert new_positions(response, 10) == [(20, 2, 0), (30, 3, 0)]
+        assert new_positions(response, 30) == []
+
+    def test_newest_first(self):
+        response = {
+            "previousPositions": [
+                position(3, 0, 30),
+                position(2, 0, 20),
+                position(1, 0, 10),
+            ]
+        }
+        assert new_positions(response, 15) == [(20, 2, 0), (30, 3, 0)]
+
+    def test_stops_at_mark(self):
+        previous = [position(i, 0, i) for i in range(10)]
+        previous[2] = "not parsed"
+        response = {"previousPositions": previous}
+        assert new_positions(response, 7) == [(8, 8, 0), (9, 9, 0)]
+
+    def test_no_timestamp(self):
+        response = {
+            "currentPosition": position(3, 0),
+            "previousPositions": [position(1, 0), position(2, 0, 20)],
+        }
+        assert new_positions(response, now=100) == [(20, 2, 0), (100, 3, 0)]
+
+
+class TestPositionCursor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.tmp.name, "marks.json")
+        self.response = {
+            "currentPosition": position(2, 0, 20),
+            "previousPositions": [position(1, 0, 10)],
+        }
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_persisted(self):
+        cursor = PositionCursor(self.path)
+        assert cursor["a"] is None
+        assert len(cursor.new_positions("a", self.response)) == 2
+        assert cursor["a"] == 20
+        assert cursor.new_positions("a", self.response) == []
+
+        # a restarted process resumes from the mark
+        cursor = PositionCursor(self.path)
+        self.response["previousPositions"].append(position(2, 0, 20))
+        self.response["currentPosition"] = position(3, 0, 30)
+        assert cursor.new_positions("a", self.response) == [(30, 3, 0)]
+        assert cursor.new_positions("b", self.response) == [
+            (10, 1, 0),
+            (20, 2, 0),
+            (30, 3, 0),
+        ]
+        cursor.reset("a")
+        assert PositionCursor(self.path)["a"] is None
+        assert PositionCursor(self.path)["b"] == 30
+        cursor.reset()
+        assert not PositionCursor(self.path).marks
+
+    def test_no_timestamp(self):
+        clock = iter([200, 300, 400, 500])
+        cursor = PositionCursor(self.path, clock=lambda: next(clock))
+        response = {"currentPosition": position(2, 0)}
+        assert cursor.new_positions("a", response) == [(200, 2, 0)]
+        # the local time is not a mark, the same place is not handed out again
+        assert cursor["a"] is None
+        assert cursor.new_positions("a", response) == []
+        # a server position older than the local time is not dropped
+        response["previousPositions"] = [position(1, 0, 150)]
+        assert cursor.new_positions("a", response) == [(150, 1, 0)]
+        assert cursor["a"] == 150
+
+        cursor = PositionCursor(self.path, clock=lambda: 600)
+        assert cursor.new_positions("a", response) == []
+        response["currentPosition"] = position(3, 0)
+        assert cursor.new_positions("a", response) == [(600, 3, 0)]
+
+    def test_save_interval(self):
+        clock = Clock()
+        cursor = PositionCursor(self.path, clock=clock, save_interval=60)
+        assert cursor.new_positions("a", self.response)
+        assert PositionCursor(self.path)["a"] == 20
+        # a mark that changes within the interval is only kept in memory
+        clock.now = 30
+        self.response["currentPosition"] = position(3, 0, 30)
+        assert cursor.new_positions("b", self.response)
+        assert PositionCursor(self.path)["b"] is None
+        cursor.save()
+        assert PositionCursor(self.path)["b"] == 30
+        # nothing is written when nothing changed
+        os.remove(self.path)
+        cursor.save()
+        assert not os.path.exists(self.path)
+
+        # saved again once the interval since the last save has passed
+        clock.now = 90
+        self.response["currentPosition"] = position(4, 0, 40)
+        assert cursor.new_positions("a", self.response)
+        assert PositionCursor(self.path)["a"] == 40
+
+    def test_legacy_file(self):
+        with open(self.path, "w", encoding="utf-8") as file:
+            file.write('{"a": 10}')
+        cursor = PositionCursor(self.path)
+        assert cursor["a"] == 10
+        assert cursor.new_positions("a", self.response) == [(20, 2, 0)]
+        assert PositionCursor(self.path)["a"] == 20
+
+    async def test_client(self):
+        api = MyPermobil("test", AsyncMock())
+        api.product_id = "a" * 24
+        api.request_endpoint = AsyncMock(return_value=self.response)
+        cursor = PositionCursor()
+        assert len(await api.get_new_positions(cursor)) == 2
+        assert await api.get_new_positions(cursor) == []
+        api.request_endpoint.assert_awaited_with(ENDPOINT_PRODUCTS_POSITIONS)
+        assert not os.listdir(self.tmp.name)
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHaversine(unittest.TestCase):
+    def test_distance(self):
+        distance = haversine(*STOCKHOLM, *SUNDSVALL)
+        assert 342_000 < distance < 343_000
+        assert haversine(*STOCKHOLM, *STOCKHOLM) == 0
+
+    def test_vectorized(self):
+        lats = np.array([0.0, 0.0, 1.0])
+        lons = np.array([0.0, 1.0, 1.0])
+        distances = haversine(lats[:-1], lons[:-1], lats[1:], lons[1:])
+        assert distances.shape == (2,)
+        assert abs(distances[0] - distances[1]) < 1
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestGridIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size=0.01)
+        self.index.update("center", *STOCKHOLM)
+        self.index.update("near", STOCKHOLM[0] + 0.003, STOCKHOLM[1])  # ~330 m
+        self.index.update("far", STOCKHOLM[0] + 0.01, STOCKHOLM[1])  # ~1.1 km
+        self.index.update("sundsvall", *SUNDSVALL)
+
+    def test_within(self):
+        found = self.index.within(*STOCKHOLM, 500)
+        assert [key for key, _ in found] == ["center", "near"]
+        assert found[0][1] == 0
+        assert 300 < found[1][1] < 350
+        assert len(self.index.within(*STOCKHOLM, 400_000)) == 4
+
+    def test_bbox(self):
+        found = self.index.in_bbox(59, 17, 60, 19)
+        assert sorted(found) == ["center", "far", "near"]
+        assert self.index.in_bbox(0, 0, 1, 1) == []
+        assert len(self.index.in_bbox(-90, -180, 90, 180)) == 4
+
+    def test_antimeridian(self):
+        self.index.update("east", 0, 179.999)
+        self.index.update("west", 0, -179.999)
+        found = self.index.within(0, 179.999, 1000)
+        assert [key for key, _ in found] == ["east", "west"]
+        assert 200 < found[1][1] < 250
+        assert [key for key, _ in self.index.within(0, -179.999, 1000)] == [
+            "west",
+            "east",
+        ]
+        assert sorted(self.index.in_bbox(-1, 179, 1, -179)) == ["east", "west"]
+        assert self.index.in_bbox(-1, 179, 1, 179.5) == []
+
+    def test_move(self):
+        self.index.update("sundsvall", *STOCKHOLM)
+        assert len(self.index.within(*STOCKHOLM, 10)) == 2
+        # the cell of the old position is dropped when it is empty
+        assert len(self.index.cells) == 2
+        self.index.remove("near")
+        self.index.remove("far")
+        assert len(self.index) == 2
+        assert len(self.index.cells) == 1
+
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        points = {
+            str(i): (59 + rng.random(), 18 + rng.random()) for i in range(1000)
+        }
+        for key, (lat, lon) in points.items():
+            self.index.update(key, lat, lon)
+        center = (59.5, 18.5)
+        expected = {
+            key
+            for key, point in points.items()
+            if haversine(*center, *point) <= 5000
+        }
+        found = {key for key, _ in self.index.within(*center, 5000)}
+        assert found == expected
+
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestPositionStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.store = PositionStore(clock=lambda: 1000)
+
+    def test_ingest(self):
+        response = {
+            "currentPosition": position(59.002, 18, 30),
+            "previousPositions": [position(59.001, 18, 20), position(59, 18, 10)],
+        }
+        assert self.store.ingest("a", response) == 3
+        # positions already seen are skipped
+        assert self.store.ingest("a", response) == 0
+        response["previousPositions"].insert(0, position(59.002, 18, 30))
+        response["currentPosition"] = position(59.003, 18, 40)
+        assert self.store.ingest("a", response) == 1
+
+        times, lats, _ = self.store["a"].range()
+        assert list(times) == [10, 20, 30, 40]
+        assert list(lats) == [59, 59.001, 59.002, 59.003]
+        assert 300 < self.store.distance("a") < 350
+        assert 200 < self.store.distance("a", 10, 40) < 250
+        assert self.store.distance("b") == 0
+
+    def test_no_timestamp(self):
+        response = {"currentPosition": position(59, 18)}
+        assert self.store.ingest("a", response) == 1
+        # a chair that has not moved is not stored again
+        self.store.clock = lambda: 2000
+        assert self.store.ingest("a", response) == 0
+        assert self.store.ingest("a", {"currentPosition": position(59.1, 18)}) == 1
+        assert list(self.store["a"].times) == [1000, 2000]
+        # a server position older than the local time is inserted in order
+        response = {
+            "currentPosition": position(59.1, 18),
+            "previousPositions": [position(59.05, 18, 1500)],
+        }
+        assert self.store.ingest("a", response) == 1
+        assert list(self.store["a"].times) == [1000, 1500, 2000]
+        assert self.store.ingest("a", response) == 0
+
+    def test_invalid(self):
+        assert self.store.ingest("a", {}) == 0
+        assert self.store.ingest("a", {"currentPosition": None}) == 0
+        assert "a" not in self.store
+
+    def test_queries(self):
+        self.store.ingest("a", {"currentPosition": position(*STOCKHOLM)})
+        self.store.ingest("b", {"currentPosition": position(*SUNDSVALL)})
+        assert [key for key, _ in self.store.within(*STOCKHOLM, 500)] == ["a"]
+        assert self.store.in_bbox(62, 17, 63, 18) == ["b"]
+        # the index follows the last position
+        self.store.clock = lambda: 2000
+        self.store.ingest("b", {"currentPosition": position(*STOCKHOLM)})
+        assert len(self.store.within(*STOCKHOLM, 500)) == 2
+
+    async def test_poll(self):
+        api = MyPermobil("test", AsyncMock())
+        api.product_id = "a" * 24
+        api.request_endpoint = AsyncMock(
+            return_value={"currentPosition": position(*STOCKHOLM, 10)}
+        )
+        assert await self.store.poll(api) == 1
+        api.request_endpoint.assert_awaited_once_with(ENDPOINT_PRODUCTS_POSITIONS)
+        assert "a" * 24 in self.store
+
+
+if __name__ == "__main__":
+    unittest.main()
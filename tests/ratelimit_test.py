@@ -0,0 +1,130 @@
+""" test client side rate limiting """
+
+import asyncio
+import datetime
+import email.utils
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilFleet,
+    MyPermobilClientException,
+    MyPermobilResponse,
+    RateLimiter,
+    TokenBucket,
+    GET,
+)
+from mypermobil.ratelimit import parse_retry_after
+
+
+class Clock:
+    """Fake clock where sleeping advances the time."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+# pylint: disable=missing-docstring
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+        assert bucket.reserve() == 0.5
+        assert bucket.reserve() == 1.0
+        clock.now = 10
+        assert bucket.reserve() == 0
+
+    def test_pause(self):
+        clock = Clock()
+        bucket = TokenBucket(rate=1, capacity=5, clock=clock)
+        bucket.pause(10)
+        assert bucket.paused_for() == 10
+        assert bucket.reserve() == 11
+        clock.now = 20
+        assert bucket.paused_for() == 0
+
+    def test_parse_retry_after(self):
+        assert parse_retry_after({}) is None
+        assert parse_retry_after({"Retry-After": "5"}) == 5
+        assert parse_retry_after({"Retry-After": "invalid"}) is None
+        date = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
+            seconds=60
+        )
+        seconds = parse_retry_after({"Retry-After": email.utils.format_datetime(date)})
+        assert 50 < seconds <= 60
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.limiter = RateLimiter(
+            rate=2, capacity=1, clock=self.clock, sleep=self.clock.sleep
+        )
+
+    def test_invalid(self):
+        with self.assertRaises(MyPermobilClientException):
+            RateLimiter(rate=0)
+        with self.assertRaises(MyPermobilClientException):
+            RateLimiter(capacity=0)
+
+    async def test_per_host(self):
+        await asyncio.gather(
+            *(self.limiter.acquire("http://a.com/x") for _ in range(3)),
+            self.limiter.acquire("http://b.com/x"),
+        )
+        assert self.limiter.stats["waits"] == 2
+        assert self.limiter.stats["max_queued"] == 2
+        assert self.limiter.stats["queued"] == 0
+        # the third request to a.com is made 1 second after the first
+        assert self.clock.now == 1.0
+
+    async def test_per_token(self):
+        limiter = RateLimiter(rate=1, per_token=True, clock=self.clock)
+        assert limiter.key("http://a.com/x", "t1") != limiter.key("http://a.com/x", "t2")
+        assert self.limiter.key("http://a.com/x", "t1") == ("a.com", None)
+
+    async def test_client_retry_after(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            rate_limiter=self.limiter,
+        )
+        api.self_authenticate()
+        api.read_request = AsyncMock(
+            return_value=MyPermobilResponse(429, {"Retry-After": "30"}, b"")
+        )
+        await api.make_request(GET, "http://example.com/api")
+        assert self.limiter.stats["throttled"] == 1
+
+        api.read_request = AsyncMock(
+            return_value=MyPermobilResponse(200, {}, b"")
+        )
+        await api.make_request(GET, "http://example.com/api")
+        # the second request waited for the Retry-After
+        assert self.clock.now >= 30
+
+    async def test_fleet_shares_limiter(self):
+        fleet = MyPermobilFleet(AsyncMock(), rate_limiter=self.limiter)
+        api = MyPermobil("test", AsyncMock())
+        api.authenticated = True
+        fleet.add(api)
+        assert api.rate_limiter is self.limiter
+
+
+if __name__ == "__main__":
+    unittest.main()
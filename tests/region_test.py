@@ -1,6 +1,7 @@
 """Test the region names request"""
 
 import asyncio
+import json
 import unittest
 from unittest.mock import AsyncMock
 
@@ -47,6 +48,31 @@ class TestRegion(unittest.TestCase):
         #asyncio.run(region_with_flags())
         #asyncio.run(region_error())
 
+    def test_regions_url(self):
+        """Test the regions request of another regions service"""
+
+        async def regions_url():
+            """Test the regions request of another regions service"""
+            region = {
+                "_id": "local",
+                "name": "Local",
+                "host": "localhost:8080",
+                "backendPort": 8080,
+                "serverType": "Production",
+            }
+            response = AsyncMock(status=200)
+            response.headers = {"Content-Type": "application/json"}
+            response.read = AsyncMock(return_value=json.dumps([region]).encode())
+            session = AsyncMock()
+            session.get = AsyncMock(return_value=response)
+            api = MyPermobil("test", session)
+            api.regions_url = "http://localhost:8080/api/v1/regions"
+            regions = await api.request_regions(include_internal=True)
+            assert session.get.call_args[0][0] == api.regions_url
+            assert regions["local"]["url"] == "http://localhost:8080"
+
+        asyncio.run(regions_url())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,131 @@
+""" test retrying transient failures """
+
+import datetime
+import random
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilClientException,
+    MyPermobilAPIException,
+    MyPermobilConnectionException,
+    MyPermobilResponse,
+    RetryPolicy,
+    RetryBudget,
+    ENDPOINT_BATTERY_INFO,
+    GET,
+    POST,
+)
+
+
+def response(status, body=b'{"stateOfCharge": 50}'):
+    return MyPermobilResponse(status, {"Content-Type": "application/json"}, body)
+
+
+# pylint: disable=missing-docstring
+class TestRetryPolicy(unittest.TestCase):
+    def test_invalid(self):
+        with self.assertRaises(MyPermobilClientException):
+            RetryPolicy(max_attempts=0)
+        with self.assertRaises(MyPermobilClientException):
+            RetryPolicy(backoff=-1)
+        with self.assertRaises(MyPermobilClientException):
+            RetryBudget(max_tokens=0)
+
+    def test_delay(self):
+        policy = RetryPolicy(backoff=1, max_backoff=5, rng=random.Random(0))
+        for attempt, cap in [(1, 1), (2, 2), (3, 4), (4, 5), (10, 5)]:
+            for _ in range(20):
+                assert 0 <= policy.delay(attempt) <= cap
+
+    def test_should_retry(self):
+        policy = RetryPolicy(max_attempts=3)
+        assert policy.should_retry(GET, 1)
+        assert policy.should_retry(GET, 2)
+        assert not policy.should_retry(GET, 3)
+        assert not policy.should_retry(POST, 1)
+        assert policy.retries == 2
+        assert policy.exhausted == 1
+
+    def test_budget(self):
+        budget = RetryBudget(ratio=0.5, max_tokens=2)
+        assert budget.withdraw()
+        assert budget.withdraw()
+        assert not budget.withdraw()
+        budget.deposit()
+        budget.deposit()
+        assert budget.withdraw()
+
+
+class TestRetry(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.policy = RetryPolicy(max_attempts=3, backoff=0)
+        self.api = MyPermobil(
+            "test",
+            AsyncMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+            retry_policy=self.policy,
+        )
+        self.api.self_authenticate()
+
+    async def test_retry_connection_error(self):
+        self.api.send_request = AsyncMock(
+            side_effect=[
+                MyPermobilConnectionException("Connection timeout"),
+                response(200),
+            ]
+        )
+        res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res == {"stateOfCharge": 50}
+        assert self.api.send_request.call_count == 2
+
+    async def test_retry_status(self):
+        self.api.send_request = AsyncMock(
+            side_effect=[response(503), response(429), response(200)]
+        )
+        res = await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert res == {"stateOfCharge": 50}
+        assert self.policy.retries == 2
+
+    async def test_no_retry_status(self):
+        self.api.send_request = AsyncMock(return_value=response(404, b"{}"))
+        with self.assertRaises(MyPermobilAPIException):
+            await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.api.send_request.call_count == 1
+
+    async def test_error_cached_after_retries(self):
+        self.api.send_request = AsyncMock(
+            side_effect=MyPermobilConnectionException("Connection error")
+        )
+        with self.assertRaises(MyPermobilConnectionException):
+            await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.api.send_request.call_count == 3
+
+        # the error is cached once the retries are exhausted
+        with self.assertRaises(MyPermobilConnectionException):
+            await self.api.request_endpoint(ENDPOINT_BATTERY_INFO)
+        assert self.api.send_request.call_count == 3
+        assert self.policy.exhausted == 1
+
+    async def test_no_retry_post(self):
+        self.api.send_request = AsyncMock(return_value=response(503))
+        res = await self.api.make_request(POST, "http://example.com")
+        assert res.status == 503
+        assert self.api.send_request.call_count == 1
+
+    async def test_budget_spent(self):
+        self.policy.budget = RetryBudget(ratio=0, max_tokens=1)
+        self.api.send_request = AsyncMock(return_value=response(503))
+        await self.api.make_request(GET, "http://example.com")
+        await self.api.make_request(GET, "http://example.com")
+        # one retry for the first request, none for the second
+        assert self.api.send_request.call_count == 3
+
+
+if __name__ == "__main__":
+    unittest.main()
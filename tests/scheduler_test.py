@@ -0,0 +1,179 @@
+""" test the polling scheduler """
+
+import asyncio
+import random
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilCache,
+    MyPermobilClientException,
+    MyPermobilAPIException,
+    PollScheduler,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_PRODUCTS_POSITIONS,
+    create_session,
+)
+from mypermobil.scheduler import ChairState, PollUpdate
+from mypermobil.testing import FakePermobilServer
+
+
+def position(lat, lon):
+    return {"currentPosition": {"latitude": lat, "longitude": lon}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# pylint: disable=missing-docstring
+class TestNextInterval(unittest.TestCase):
+    def setUp(self):
+        self.api = MyPermobil(
+            "test", AsyncMock(), cache_ttls={ENDPOINT_PRODUCTS_POSITIONS: 10}
+        )
+        self.scheduler = PollScheduler(
+            [self.api], interval=60, min_interval=10, max_interval=200
+        )
+        self.state = ChairState(60)
+
+    def next(self, battery, pos):
+        updates = [
+            PollUpdate(self.api, ENDPOINT_BATTERY_INFO, result=battery),
+            PollUpdate(self.api, ENDPOINT_PRODUCTS_POSITIONS, result=pos),
+        ]
+        return self.scheduler.next_interval(self.state, updates)
+
+    def test_invalid(self):
+        with self.assertRaises(MyPermobilClientException):
+            PollScheduler([], interval=10, min_interval=20)
+
+    def test_charging(self):
+        assert self.next({"charging": True}, position(1, 1)) == 10
+        assert self.next({"charging": True}, position(1, 1)) == 10
+
+    def test_moving(self):
+        assert self.next({"charging": False}, position(1, 1)) == 60
+        assert self.next({"charging": False}, position(1, 2)) == 10
+
+    def test_idle_backs_off(self):
+        battery = {"charging": False, "stateOfCharge": 80}
+        intervals = [self.next(dict(battery), position(1, 1)) for _ in range(5)]
+        assert intervals == [60, 120, 200, 200, 200]
+        # a change resets the interval
+        battery = {"charging": False, "stateOfCharge": 79}
+        assert self.next(battery, position(1, 1)) == 60
+
+    def test_errors(self):
+        updates = [
+            PollUpdate(self.api, ENDPOINT_BATTERY_INFO, error=MyPermobilAPIException())
+        ]
+        assert self.scheduler.next_interval(self.state, updates) == 60
+
+    def test_cached(self):
+        battery = {"charging": False}
+        assert self.next(battery, position(1, 1)) == 60
+        assert self.next(battery, position(1, 2)) == 10
+        # the same objects came from the cache, the chair is not idle
+        cached = self.state.results[ENDPOINT_PRODUCTS_POSITIONS]
+        assert self.next(battery, cached) == 10
+
+    def test_shortest_interval(self):
+        assert self.scheduler.shortest_interval(self.api) == 10
+        api = MyPermobil("test", AsyncMock())
+        # positions are cached for 15 seconds
+        assert self.scheduler.shortest_interval(api) == 15
+        api.cache_ttls[ENDPOINT_PRODUCTS_POSITIONS] = 3600
+        assert self.scheduler.shortest_interval(api) == 30
+
+
+class TestSchedulerCache(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakePermobilServer()
+        await self.server.start()
+        self.session = await create_session()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+
+    async def test_moving_through_cache(self):
+        clock = Clock()
+        api = self.server.client(self.session, cache=MyPermobilCache(clock=clock))
+        scheduler = PollScheduler([api], interval=60, min_interval=15)
+        intervals = []
+        # polls 10% early land inside the TTL of the cached responses
+        for index, now in enumerate([0, 15, 28.5, 30, 43.5, 45, 58.5, 61]):
+            clock.now = now
+            self.server.set_response(ENDPOINT_PRODUCTS_POSITIONS, position(index, 0))
+            updates = await scheduler.poll(api)
+            intervals.append(updates[0].interval)
+        assert intervals == [60] + [15] * 7
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.apis = []
+        for _ in range(4):
+            api = MyPermobil("test", AsyncMock(), cache_ttls={ENDPOINT_BATTERY_INFO: 0})
+            api.request_endpoint = AsyncMock(return_value={"charging": True})
+            self.apis.append(api)
+        self.scheduler = PollScheduler(
+            self.apis,
+            endpoints=[ENDPOINT_BATTERY_INFO],
+            interval=0.2,
+            min_interval=0.02,
+            max_interval=1,
+            rng=random.Random(0),
+        )
+
+    async def test_updates(self):
+        seen = []
+        unsubscribe = self.scheduler.subscribe(seen.append)
+
+        async def failing(update):
+            raise ValueError()
+
+        self.scheduler.subscribe(failing)
+        self.scheduler.start()
+        with self.assertRaises(MyPermobilClientException):
+            self.scheduler.start()
+
+        updates = []
+        async for update in self.scheduler.updates():
+            updates.append(update)
+            if len({id(update.api) for update in updates}) == len(self.apis):
+                break
+        unsubscribe()
+        await self.scheduler.stop()
+
+        assert not self.scheduler.running
+        assert all(update.ok for update in updates)
+        assert len(seen) >= len(updates)
+        # charging chairs are polled often
+        assert len(updates) > len(self.apis)
+        assert all(update.interval == 0.02 for update in updates)
+
+    async def test_spread(self):
+        times = {}
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.scheduler.subscribe(
+            lambda update: times.setdefault(id(update.api), loop.time() - start)
+        )
+        self.scheduler.start()
+        await asyncio.sleep(0.25)
+        await self.scheduler.stop()
+
+        first = sorted(times.values())
+        assert len(first) == 4
+        # the first polls are spread over the interval, not all at once
+        assert first[-1] - first[0] >= 0.1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,221 @@
+""" test sessions and connection pooling """
+
+import asyncio
+import datetime
+import json
+import unittest
+from unittest.mock import AsyncMock
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from mypermobil import (
+    MyPermobil,
+    MyPermobilFleet,
+    MyPermobilClientException,
+    MyPermobilAPIException,
+    MyPermobilResponse,
+    ConnectionPoolProfile,
+    ConnectionStats,
+    create_session,
+    json_decoder,
+)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# pylint: disable=missing-docstring
+class TestSession(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        async def handler(request):
+            return web.json_response({"ok": True})
+
+        async def text_handler(request):
+            return web.Response(text="not json")
+
+        async def gzip_handler(request):
+            encoding = request.headers.get("Accept-Encoding")
+            response = web.json_response({"encoding": encoding, "pad": "x" * 2000})
+            if "gzip" in encoding:
+                response.enable_compression(web.ContentCoding.gzip)
+            return response
+
+        async def slow_handler(request):
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b"{")
+            # the rest of the body is sent once the test is done
+            await self.done.wait()
+            await response.write(b"}")
+            return response
+
+        self.done = asyncio.Event()
+        app = web.Application()
+        app.router.add_get("/", handler)
+        app.router.add_get("/slow", slow_handler)
+        app.router.add_get("/text", text_handler)
+        app.router.add_get("/gzip", gzip_handler)
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+    async def asyncTearDown(self):
+        await self.server.close()
+
+    def test_invalid_profile(self):
+        with self.assertRaises(MyPermobilClientException):
+            ConnectionPoolProfile(limit=-1)
+
+    async def test_profile(self):
+        profile = ConnectionPoolProfile(limit=10, limit_per_host=2)
+        session = await create_session(profile)
+        assert session.connector.limit == 10
+        assert session.connector.limit_per_host == 2
+        await session.close()
+
+    async def test_connections_reused(self):
+        stats = ConnectionStats()
+        session = await create_session(stats=stats)
+        for _ in range(5):
+            async with session.get(self.server.make_url("/")) as resp:
+                await resp.json()
+        await session.close()
+
+        assert stats.opened == 1
+        assert stats.reused == 4
+
+    async def test_unreleased(self):
+        stats = ConnectionStats()
+        session = await create_session(stats=stats)
+        # the body is not read and the response is not released
+        resp = await session.get(self.server.make_url("/slow"))
+        assert stats.responses == 1
+        assert stats.unreleased == 1
+        assert stats.stats["unreleased"] == 1
+        resp.release()
+        assert stats.unreleased == 0
+        async with session.get(self.server.make_url("/slow")) as resp:
+            assert stats.unreleased == 1
+            self.done.set()
+            assert await resp.read() == b"{}"
+        assert stats.unreleased == 0
+        await session.close()
+
+    async def test_client_open_session(self):
+        api = MyPermobil("test", None)
+        await api.open_session(ConnectionPoolProfile(limit_per_host=1))
+        with self.assertRaises(MyPermobilClientException):
+            await api.open_session()
+        async with api.session.get(self.server.make_url("/")) as resp:
+            await resp.json()
+        await api.close_session()
+        assert api.connection_stats.stats["opened"] == 1
+
+    async def test_make_request_releases(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        api = MyPermobil(
+            "test",
+            None,
+            email="valid@email.com",
+            region=str(self.server.make_url("")),
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+        )
+        api.self_authenticate()
+        await api.open_session(ConnectionPoolProfile(limit_per_host=1))
+        for _ in range(3):
+            resp = await api.make_request("get", self.server.make_url("/"))
+            assert isinstance(resp, MyPermobilResponse)
+            assert resp.status == 200
+            assert await resp.json() == {"ok": True}
+
+        # the single connection is released after every request and reused
+        assert api.connection_stats.unreleased == 0
+        assert api.connection_stats.opened == 1
+        assert api.connection_stats.reused == 2
+
+        resp = await api.make_request("get", self.server.make_url("/text"))
+        assert await resp.text() == "not json"
+        with self.assertRaises(aiohttp.ContentTypeError):
+            await resp.json()
+        with self.assertRaises(MyPermobilAPIException):
+            await api.request_endpoint("/text")
+        assert api.connection_stats.unreleased == 0
+        await api.close_session()
+
+    def api(self, **kwargs):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        api = MyPermobil(
+            "test",
+            None,
+            email="valid@email.com",
+            region=str(self.server.make_url("")),
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            **kwargs,
+        )
+        api.self_authenticate()
+        return api
+
+    async def test_compression(self):
+        api = self.api()
+        await api.open_session()
+        resp = await api.make_request("get", self.server.make_url("/gzip"))
+        assert resp.headers["Content-Encoding"] == "gzip"
+        res = await resp.json()
+        assert res["encoding"].startswith("gzip, deflate")
+        assert res["pad"] == "x" * 2000
+        await api.close_session()
+
+        api = self.api(compression=False)
+        await api.open_session()
+        res = await api.request_endpoint("/gzip")
+        assert res["encoding"] == "identity"
+        await api.close_session()
+
+    async def test_json_loads(self):
+        calls = []
+
+        def loads(body):
+            calls.append(body)
+            return json.loads(body)
+
+        api = self.api(json_loads=loads)
+        await api.open_session()
+        res = await api.request_endpoint("/")
+        assert res == {"ok": True}
+        assert calls == [b'{"ok": true}']
+        with self.assertRaises(MyPermobilAPIException):
+            await api.request_endpoint("/text")
+        await api.close_session()
+
+    def test_json_decoder(self):
+        assert json_decoder("json") is json.loads
+        assert json_decoder("auto")(b'{"a": [1]}') == {"a": [1]}
+        with self.assertRaises(MyPermobilClientException):
+            json_decoder("unknown")
+        with self.assertRaises(MyPermobilClientException):
+            MyPermobil("test", None, json_loads="unknown")
+
+    @unittest.skipIf(orjson is None, "orjson is not installed")
+    async def test_orjson(self):
+        api = self.api(json_loads="orjson")
+        assert api.json_loads is orjson.loads
+        await api.open_session()
+        assert await api.request_endpoint("/") == {"ok": True}
+        await api.close_session()
+
+    async def test_fleet_open_session(self):
+        fleet = MyPermobilFleet(None)
+        api = MyPermobil("test", AsyncMock())
+        api.authenticated = True
+        fleet.add(api)
+        await fleet.open_session()
+        assert api.session is fleet.session
+        assert api.connection_stats is fleet.connection_stats
+        await fleet.close_session()
+
+
+if __name__ == "__main__":
+    unittest.main()
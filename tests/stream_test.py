@@ -0,0 +1,187 @@
+""" test streaming json decoding """
+
+import datetime
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilAPIException,
+    MyPermobilClientException,
+    JSONStream,
+    iter_json,
+    ENDPOINT_PRODUCTS_POSITIONS,
+)
+
+POSITIONS = {
+    "currentPosition": {"latitude": 1.5, "longitude": 2},
+    "previousPositions": [
+        {"latitude": i, "longitude": -i, "name": "ö \" ]"} for i in range(20)
+    ],
+    "flag": "x" * 1000,
+}
+
+
+def chunks(document, size):
+    if not isinstance(document, bytes):
+        document = json.dumps(document).encode()
+    return [document[i : i + size] for i in range(0, len(document), size)]
+
+
+def decode(document, path=(), size=7):
+    stream = JSONStream(path)
+    values = []
+    for chunk in chunks(document, size):
+        values += stream.feed(chunk)
+    return values + stream.close()
+
+
+async def aiter(items):
+    for item in items:
+        yield item
+
+
+# pylint: disable=missing-docstring
+class TestJSONStream(unittest.TestCase):
+    def test_elements(self):
+        for size in (1, 3, 64, 10000):
+            values = decode(POSITIONS, ["previousPositions"], size)
+            assert values == POSITIONS["previousPositions"]
+
+    def test_top_level_array(self):
+        document = [1, -2.5e3, "a", None, True, [], {}, [[1]]]
+        assert decode(document, size=1) == document
+        assert decode([]) == []
+
+    def test_value(self):
+        assert decode(POSITIONS, ["currentPosition"]) == [POSITIONS["currentPosition"]]
+        assert decode(POSITIONS, ["currentPosition", "latitude"], size=1) == [1.5]
+        assert decode(POSITIONS, ["flag"]) == [POSITIONS["flag"]]
+        assert decode(12345, size=1) == [12345]
+
+    def test_index(self):
+        path = ["previousPositions", 3, "longitude"]
+        assert decode(POSITIONS, path) == [-3]
+
+    def test_not_found(self):
+        for path in (["missing"], ["previousPositions", 100], ["flag", "x"], [0]):
+            with self.assertRaises(MyPermobilClientException):
+                decode(POSITIONS, path)
+
+    def test_invalid(self):
+        for document in (b'{"a": [1, 2', b"[1 2]", b'{"a" 1}', b"[1,]", b"", b'{1: 2}'):
+            with self.assertRaises(MyPermobilAPIException):
+                decode(document, ["a"] if document.startswith(b"{") else [])
+
+    def test_stops_after_value(self):
+        stream = JSONStream(["a"])
+        assert stream.feed(b'{"a": [1, 2], "b": ') == [1, 2]
+        assert stream.done
+        # the rest of the document is not decoded
+        assert stream.feed(b"not json") == []
+        assert stream.close() == []
+
+    def test_bounded_buffer(self):
+        document = {"items": [{"data": "x" * 100, "i": i} for i in range(1000)]}
+        stream = JSONStream(["items"])
+        largest = 0
+        for chunk in chunks(document, 256):
+            stream.feed(chunk)
+            largest = max(largest, len(stream.buffer))
+        assert stream.close() == []
+        assert stream.count == 1000
+        # only the element being decoded and a chunk are buffered
+        assert largest < 512
+
+    def test_large_value(self):
+        document = [{"data": "x" * 100000}]
+        stream = JSONStream()
+        values = []
+        for chunk in chunks(document, 100):
+            values += stream.feed(chunk)
+        assert values + stream.close() == document
+
+
+class TestIterJSON(unittest.IsolatedAsyncioTestCase):
+    async def test_iter(self):
+        values = [
+            value
+            async for value in iter_json(
+                aiter(chunks(POSITIONS, 10)), ["previousPositions"]
+            )
+        ]
+        assert values == POSITIONS["previousPositions"]
+
+
+class TestStreamEndpoint(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        ttl = datetime.datetime.now() + datetime.timedelta(days=1)
+        self.api = MyPermobil(
+            "test",
+            MagicMock(),
+            email="valid@email.com",
+            region="http://example.com",
+            token="a" * 256,
+            expiration_date=ttl.strftime("%Y-%m-%d"),
+            product_id="a" * 24,
+        )
+        self.api.self_authenticate()
+
+    def respond(self, status, body):
+        response = MagicMock(status=status)
+        response.content.iter_chunked = lambda size: aiter(chunks(body, size))
+        response.read = AsyncMock(return_value=json.dumps(body).encode())
+        response.headers = {"Content-Type": "application/json"}
+        response.__aenter__ = AsyncMock(return_value=response)
+        response.__aexit__ = AsyncMock(return_value=False)
+        self.api.session.get = MagicMock(return_value=response)
+        return response
+
+    async def test_stream(self):
+        response = self.respond(200, POSITIONS)
+        values = [
+            value
+            async for value in self.api.stream_endpoint(
+                ENDPOINT_PRODUCTS_POSITIONS, ["previousPositions"], chunk_size=16
+            )
+        ]
+        assert values == POSITIONS["previousPositions"]
+        url = self.api.session.get.call_args[0][0]
+        assert url == "http://example.com/api/v1/products/" + "a" * 24 + "/positions"
+        response.__aexit__.assert_awaited_once()
+        assert self.api.connection_stats.unreleased == 0
+
+    async def test_items(self):
+        self.respond(200, POSITIONS)
+        values = [
+            value
+            async for value in self.api.stream_endpoint(
+                ENDPOINT_PRODUCTS_POSITIONS,
+                ["previousPositions"],
+                items=[["latitude"], ["missing"]],
+            )
+        ]
+        assert values == [(i, None) for i in range(20)]
+
+    async def test_break(self):
+        response = self.respond(200, POSITIONS)
+        stream = self.api.stream_endpoint(
+            ENDPOINT_PRODUCTS_POSITIONS, ["previousPositions"]
+        )
+        async for _ in stream:
+            break
+        await stream.aclose()
+        # the response is released when the stream is closed early
+        response.__aexit__.assert_awaited_once()
+        assert self.api.connection_stats.unreleased == 0
+
+    async def test_error(self):
+        self.respond(500, {"error": "server error"})
+        with self.assertRaises(MyPermobilAPIException):
+            async for _ in self.api.stream_endpoint(ENDPOINT_PRODUCTS_POSITIONS):
+                pass
+        assert self.api.connection_stats.unreleased == 0
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+""" test against the fake server """
+
+import asyncio
+import time
+import unittest
+from mypermobil import (
+    MyPermobil,
+    MyPermobilAPIException,
+    MyPermobilClientException,
+    MyPermobilConnectionException,
+    MyPermobilEulaException,
+    RateLimiter,
+    RequestCoalescer,
+    RetryPolicy,
+    create_session,
+    ENDPOINT_BATTERY_INFO,
+    ENDPOINT_PRODUCTS,
+    ENDPOINT_PRODUCTS_POSITIONS,
+    ENDPOINT_APPLICATIONLINKS,
+    GET_REGIONS,
+    BATTERY_STATE_OF_CHARGE,
+)
+from mypermobil.testing import FakePermobilServer, Fault, fake_payload
+
+
+# pylint: disable=missing-docstring
+class TestFakeServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server = FakePermobilServer(positions=5)
+        await self.server.start()
+        self.session = await create_session()
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.server.close()
+
+    def unauthenticated(self, email):
+        region = str(self.server.url)
+        return MyPermobil("test", self.session, email=email, region=region)
+
+    async def test_auth_flow(self):
+        self.server.add_user("user@example.com")
+        api = self.unauthenticated("user@example.com")
+        await api.request_application_code()
+        code = self.server.users["user@example.com"].code
+        assert len(code) == 6
+        token, expiration_date = await api.request_application_token(code=code)
+        assert len(token) == 256
+
+        api.set_token(token)
+        api.set_expiration_date(expiration_date)
+        api.self_authenticate()
+        assert await api.request_product_id() == "0" * 23 + "1"
+        await api.deauthenticate()
+        api.cache.clear()
+        with self.assertRaises(MyPermobilAPIException):
+            await api.request_endpoint(ENDPOINT_PRODUCTS)
+
+    async def test_auth_errors(self):
+        api = self.unauthenticated("unknown@example.com")
+        with self.assertRaises(MyPermobilAPIException):
+            await api.request_application_code()
+        with self.assertRaisesRegex(MyPermobilAPIException, "not registered"):
+            await api.request_application_token(code="123456")
+
+        self.server.add_user("user@example.com", eula=False)
+        api = self.unauthenticated("user@example.com")
+        await api.request_application_code()
+        with self.assertRaisesRegex(MyPermobilAPIException, "Incorrect code"):
+            await api.request_application_token(code="000000")
+        code = self.server.users["user@example.com"].code
+        with self.assertRaises(MyPermobilEulaException):
+            await api.request_application_token(code=code)
+
+    async def test_endpoints(self):
+        api = self.server.client(self.session)
+        info = await api.get_battery_info()
+        assert info == fake_payload(ENDPOINT_BATTERY_INFO)
+        positions = await api.get_gps_position()
+        assert len(positions["previousPositions"]) == 5
+        self.server.set_response(ENDPOINT_BATTERY_INFO, {"stateOfCharge": 12})
+        api.cache.clear()
+        assert await api.request_item(BATTERY_STATE_OF_CHARGE) == 12
+
+        other = self.server.client(self.session)
+        with self.assertRaises(MyPermobilAPIException):
+            await api.request_endpoint(
+                ENDPOINT_PRODUCTS_POSITIONS, product_id=other.product_id
+            )
+
+    async def test_regions(self):
+        api = self.server.client(self.session)
+        names = await api.request_region_names(include_internal=True)
+        assert names == {"Fake": str(self.server.url)}
+
+        for status in (404, 500):
+            self.server.inject(GET_REGIONS, status=status, body="down", times=1)
+            api.cache.clear()
+            with self.assertRaisesRegex(MyPermobilAPIException, "down"):
+                await api.request_regions()
+
+    async def test_regions_per_service(self):
+        async with FakePermobilServer() as other:
+            apis = [self.server.client(self.session), other.client(self.session)]
+            for api in apis:
+                # the regions are requested before signing in
+                api.token = None
+            names = await asyncio.gather(
+                *(api.request_region_names(include_internal=True) for api in apis)
+            )
+            assert names == [
+                {"Fake": str(self.server.url)},
+                {"Fake": str(other.url)},
+            ]
+            assert apis[1].cache_ttl(other.regions_url) == 24 * 60 * 60
+
+    async def test_regions_unavailable(self):
+        api = self.server.client(self.session)
+        self.server.inject(GET_REGIONS, status=503, body="unavailable", times=1)
+        for _ in range(2):
+            with self.assertRaisesRegex(MyPermobilAPIException, "503: unavailable"):
+                await api.request_region_names()
+        # the error is cached for the error TTL, not the regions TTL
+        assert self.server.requests[GET_REGIONS] == 1
+        api.cache.clear()
+        assert await api.request_region_names() == {}
+        assert self.server.requests[GET_REGIONS] == 2
+
+    async def test_outage_stale(self):
+        api = self.server.client(
+            self.session,
+            cache_ttls={ENDPOINT_BATTERY_INFO: 0.01},
+            stale_while_revalidate=60,
+        )
+        info = await api.get_battery_info()
+        self.server.inject(ENDPOINT_BATTERY_INFO, status=500)
+        await asyncio.sleep(0.02)
+        for _ in range(50):
+            assert await api.get_battery_info() == info
+            await asyncio.sleep(0)
+        await asyncio.gather(*api.background_tasks, return_exceptions=True)
+        # one failed refresh, then the stale value until the error TTL passes
+        assert self.server.requests[ENDPOINT_BATTERY_INFO] == 2
+
+    async def test_timeout(self):
+        api = self.server.client(self.session)
+        api.request_timeout = 0.05
+        self.server.inject(ENDPOINT_BATTERY_INFO, delay=1, times=1)
+        with self.assertRaisesRegex(MyPermobilConnectionException, "timeout"):
+            await api.get_battery_info()
+
+    async def test_disconnect(self):
+        api = self.server.client(self.session)
+        # aiohttp sends a GET again once when the connection is dropped
+        self.server.inject(ENDPOINT_BATTERY_INFO, disconnect=True, times=2)
+        with self.assertRaises(MyPermobilConnectionException):
+            await api.get_battery_info()
+        assert self.server.requests[ENDPOINT_BATTERY_INFO] == 2
+
+    async def test_latency(self):
+        server = FakePermobilServer(
+            latencies={ENDPOINT_BATTERY_INFO: (0.05, 0.06)}, seed=1
+        )
+        async with server:
+            api = server.client(self.session)
+            start = time.monotonic()
+            await api.get_battery_info()
+            assert time.monotonic() - start >= 0.05
+            start = time.monotonic()
+            await api.request_endpoint(ENDPOINT_PRODUCTS)
+            assert time.monotonic() - start < 0.05
+
+    async def test_retry(self):
+        api = self.server.client(
+            self.session, retry_policy=RetryPolicy(backoff=0.01, max_backoff=0.01)
+        )
+        self.server.inject(ENDPOINT_BATTERY_INFO, status=503, times=2)
+        assert await api.get_battery_info() == fake_payload(ENDPOINT_BATTERY_INFO)
+        assert self.server.requests[ENDPOINT_BATTERY_INFO] == 3
+
+    async def test_retry_after(self):
+        api = self.server.client(self.session, rate_limiter=RateLimiter(rate=100))
+        self.server.inject(
+            ENDPOINT_BATTERY_INFO, status=429, headers={"Retry-After": "0.1"}, times=1
+        )
+        with self.assertRaises(MyPermobilAPIException):
+            await api.get_battery_info()
+        start = time.monotonic()
+        api.cache.clear()
+        await api.get_battery_info()
+        # the limiter waits as long as the server asked for
+        assert time.monotonic() - start >= 0.09
+
+    async def test_coalescing(self):
+        self.server.latency = 0.02
+        coalescer = RequestCoalescer()
+        user = self.server.add_user("shared@example.com")
+        apis = [
+            self.server.client(self.session, user.email, coalescer=coalescer)
+            for _ in range(5)
+        ]
+        results = await asyncio.gather(*(api.get_battery_info() for api in apis))
+        assert all(result == results[0] for result in results)
+        assert self.server.requests[ENDPOINT_BATTERY_INFO] == 1
+
+    async def test_error_rate(self):
+        server = FakePermobilServer(error_rate=0.5, seed=3)
+        async with server:
+            api = server.client(self.session, cache_ttls={ENDPOINT_PRODUCTS: 0})
+            for _ in range(20):
+                api.cache.clear()
+                try:
+                    await api.request_endpoint(ENDPOINT_PRODUCTS)
+                except MyPermobilAPIException:
+                    pass
+            assert 0 < server.errors < 20
+
+    async def test_etags(self):
+        server = FakePermobilServer(etags=True)
+        async with server:
+            api = server.client(self.session, cache_ttls={ENDPOINT_BATTERY_INFO: 0})
+            first = await api.get_battery_info()
+            assert await api.get_battery_info() == first
+            assert api.cache_stats["not_modified"] == 1
+
+    async def test_faults(self):
+        with self.assertRaises(MyPermobilClientException):
+            Fault(times=0)
+        fault = self.server.inject(ENDPOINT_APPLICATIONLINKS, status=500, times=2)
+        api = self.unauthenticated("user@example.com")
+        for _ in range(2):
+            with self.assertRaises(MyPermobilAPIException):
+                await api.request_application_code()
+        assert not fault.active
+        self.server.clear_faults()
+        assert not self.server.faults
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,209 @@
+""" test the time series store """
+
+import math
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+from mypermobil import (
+    MyPermobil,
+    MyPermobilClientException,
+    TimeSeries,
+    TimeSeriesStore,
+    BATTERY_CHARGING,
+    BATTERY_STATE_OF_CHARGE,
+    BATTERY_DISTANCE_LEFT,
+    ENDPOINT_BATTERY_INFO,
+)
+
+ITEMS = [BATTERY_STATE_OF_CHARGE, BATTERY_DISTANCE_LEFT]
+
+
+def battery(charge, distance=10.5):
+    return {"stateOfCharge": charge, "distanceLeft": distance, "charging": False}
+
+
+# pylint: disable=missing-docstring
+class TestTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.series = TimeSeries(ITEMS, chunk_size=4)
+        for minute in range(10):
+            self.series.append(minute * 60, battery(100 - minute))
+
+    def test_append(self):
+        assert len(self.series) == 10
+        assert len(self.series.chunks) == 2
+        assert self.series.last_time == 540
+        times, columns = self.series.range()
+        assert list(times) == [minute * 60 for minute in range(10)]
+        assert list(columns["stateOfCharge"]) == list(range(100, 90, -1))
+        assert list(columns["distanceLeft"]) == [10.5] * 10
+
+    def test_append_values(self):
+        self.series.append(600, [1, None])
+        with self.assertRaises(MyPermobilClientException):
+            self.series.append(660, [1])
+        times, columns = self.series.range(600)
+        assert list(times) == [600]
+        assert columns["stateOfCharge"][0] == 1
+        assert math.isnan(columns["distanceLeft"][0])
+
+    def test_not_numbers(self):
+        series = TimeSeries([BATTERY_CHARGING, BATTERY_STATE_OF_CHARGE])
+        series.append(0, {"charging": True})
+        _, columns = series.range()
+        assert math.isnan(columns["charging"][0])
+        assert math.isnan(columns["stateOfCharge"][0])
+
+    def test_time_order(self):
+        with self.assertRaises(MyPermobilClientException):
+            self.series.append(0, battery(50))
+
+    def test_range(self):
+        times, columns = self.series.range(180, 420)
+        assert list(times) == [180, 240, 300, 360]
+        assert list(columns["stateOfCharge"]) == [97, 96, 95, 94]
+        times, _ = self.series.range(1000)
+        assert not times
+
+    def test_downsample(self):
+        times, columns = self.series.downsample(300)
+        assert list(times) == [0, 300]
+        assert list(columns["stateOfCharge"]) == [98, 93]
+        _, columns = self.series.downsample(300, how="min")
+        assert list(columns["stateOfCharge"]) == [96, 91]
+        _, columns = self.series.downsample(300, how="last")
+        assert list(columns["stateOfCharge"]) == [96, 91]
+        times, columns = self.series.downsample(300, start=300, how="max")
+        assert list(times) == [300]
+        assert list(columns["stateOfCharge"]) == [95]
+
+    def test_downsample_nan(self):
+        series = TimeSeries(ITEMS)
+        series.append(0, [1, None])
+        series.append(1, [3, None])
+        _, columns = series.downsample(60)
+        assert list(columns["stateOfCharge"]) == [2]
+        assert math.isnan(columns["distanceLeft"][0])
+
+    def test_downsample_invalid(self):
+        with self.assertRaises(MyPermobilClientException):
+            self.series.downsample(0)
+        with self.assertRaises(MyPermobilClientException):
+            self.series.downsample(60, how="median")
+
+    def test_nbytes(self):
+        # a time and two float32 values per sample
+        assert self.series.nbytes == 10 * (8 + 4 + 4)
+
+
+class TestPersistentTimeSeries(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.tmp.name, "chair")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chunk_files(self):
+        series = TimeSeries(ITEMS, self.path, chunk_size=4)
+        for minute in range(10):
+            series.append(minute * 60, battery(100 - minute))
+        assert sorted(os.listdir(self.path)) == [
+            "00000000.chunk",
+            "00000001.chunk",
+            "00000002.active",
+        ]
+        # only the active chunk is in memory
+        assert series.nbytes == 2 * (8 + 4 + 4)
+        times, columns = series.range(120, 360)
+        assert list(times) == [120, 180, 240, 300]
+        assert list(columns["stateOfCharge"]) == [98, 97, 96, 95]
+
+    def test_reopen(self):
+        series = TimeSeries(ITEMS, self.path, chunk_size=4)
+        for minute in range(6):
+            series.append(minute * 60, battery(100 - minute))
+        series.flush()
+
+        series = TimeSeries(ITEMS, self.path, chunk_size=4)
+        assert len(series) == 6
+        assert series.last_time == 300
+        with self.assertRaises(MyPermobilClientException):
+            series.append(0, battery(50))
+        series.append(360, battery(94))
+        series.flush()
+        assert len(os.listdir(self.path)) == 3
+        _, columns = series.range()
+        assert list(columns["stateOfCharge"]) == list(range(100, 93, -1))
+
+    def test_restart_without_flush(self):
+        series = TimeSeries(ITEMS, self.path, chunk_size=4)
+        for minute in range(6):
+            series.append(minute * 60, battery(100 - minute))
+        del series
+
+        series = TimeSeries(ITEMS, self.path, chunk_size=4)
+        assert len(series) == 6
+        assert series.nbytes == 2 * (8 + 4 + 4)
+        series.append(360, battery(94))
+        series.append(420, battery(93))
+        # the active chunk was sealed, its file is gone
+        assert sorted(os.listdir(self.path)) == ["00000000.chunk", "00000001.chunk"]
+        _, columns = TimeSeries(ITEMS, self.path, chunk_size=4).range()
+        assert list(columns["stateOfCharge"]) == list(range(100, 92, -1))
+
+    def test_partial_row(self):
+        series = TimeSeries(ITEMS, self.path)
+        series.append(0, battery(100))
+        series.append(60, battery(99))
+        with open(series.active_path, "ab") as file:
+            file.write(b"\0" * 5)
+
+        series = TimeSeries(ITEMS, self.path)
+        assert list(series.times) == [0, 60]
+        series.append(120, battery(98))
+        assert list(TimeSeries(ITEMS, self.path).times) == [0, 60, 120]
+
+    def test_columns_checked(self):
+        series = TimeSeries(ITEMS, self.path, chunk_size=2)
+        for minute in range(3):
+            series.append(minute * 60, battery(100 - minute))
+        with self.assertRaisesRegex(MyPermobilClientException, "columns"):
+            TimeSeries(ITEMS[:1], self.path, chunk_size=2)
+        with self.assertRaisesRegex(MyPermobilClientException, "columns"):
+            TimeSeries(ITEMS[::-1], self.path, chunk_size=2)
+
+
+class TestTimeSeriesStore(unittest.IsolatedAsyncioTestCase):
+    async def test_poll(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = TimeSeriesStore(tmp, chunk_size=2)
+            api = MyPermobil("test", AsyncMock())
+            api.product_id = "a" * 24
+            api.request_endpoint = AsyncMock(return_value=battery(80))
+            for timestamp in range(3):
+                await store.poll(api, timestamp)
+            api.request_endpoint.assert_awaited_with(ENDPOINT_BATTERY_INFO)
+
+            assert "a" * 24 in store
+            assert "b" * 24 not in store
+            # the sample of the active chunk is read back without a flush
+            store = TimeSeriesStore(tmp, chunk_size=2)
+            times, columns = store["a" * 24].range()
+            assert list(times) == [0, 1, 2]
+            assert list(columns["stateOfCharge"]) == [80] * 3
+
+    def test_unknown_endpoint(self):
+        with self.assertRaises(MyPermobilClientException):
+            TimeSeriesStore(endpoint="/api/v1/unknown")
+
+    def test_memory(self):
+        store = TimeSeriesStore(items=ITEMS)
+        store.record("a" * 24, battery(80), 0)
+        store.record("b" * 24, battery(80), 0)
+        assert store.nbytes == 2 * (8 + 4 + 4)
+
+
+if __name__ == "__main__":
+    unittest.main()